@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_compression.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the decompression throughput of TSK
+# @details This script creates compressed btrfs images (zlib, lzo and zstd with
+# different levels) with the same seeded random payload and measures the
+# throughput of icat on the big file (or the standard file in fast mode) and of
+# tsk_recover on all allocated files. The extracted file is checked against the image manifest.
+################################################################################
+
+import argparse
+import sys
+import benchmark
+import testimage
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the decompression throughput of TSK on compressed btrfs images "
+                    "created with the same random payload.")
+    parser.add_argument('-t', nargs='+', metavar='type',
+                        default=['btrfs_zlib', 'btrfs_lzo', 'btrfs_zstd1', 'btrfs_zstd',
+                                 'btrfs_zstd15'],
+                        help="compressed image types (default = btrfs_zlib btrfs_lzo "
+                             "btrfs_zstd1 btrfs_zstd btrfs_zstd15)")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the images in GiB (default = 5)")
+    parser.add_argument('-e', type=float, default=0.5, metavar='entropy',
+                        help="fraction of random bytes in the payload (default = 0.5)")
+    parser.add_argument('--seed', type=int, default=0, metavar='seed',
+                        help="seed of the payload (default = 0)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--fast', action='store_true',
+                        help="skip the big file and measure icat on the standard file")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    payload = dict()
+    for c in testimage.Payload.CLASSES:
+        payload[c] = testimage.Payload(testimage.Payload.RANDOM, args.e, args.seed)
+    variant = "random_e{}_s{}{}".format(args.e, args.seed, "_fast" if args.fast else "")
+    target = "file" if args.fast else "file_big"
+
+    bench = benchmark.Benchmark(args.i, args.r)
+    header = ['type', 'file MiB', 'icat s', 'icat MiB/s', 'icat RSS MiB',
+              'recover MiB', 'recover s', 'recover MiB/s', 'content']
+    rows = list()
+    try:
+        for imagetype in args.t:
+            files = bench.image(imagetype, variant, size=args.s, fast=args.fast,
+                                payload=payload)
+            image = files[0]
+            expected = testimage.ImageFactory.read_manifest(files[-1]).get(target)
+
+            inode = bench.inode(image, target)
+            digest, size = bench.icat_md5(image, inode)
+            icat = bench.measure(['icat', image, str(inode)])
+            recover, nbytes = bench.recover(image)
+
+            rows.append([imagetype, size / 1024 ** 2, icat.elapsed, icat.throughput(size),
+                         icat.maxrss / 1024, nbytes / 1024 ** 2, recover.elapsed,
+                         recover.throughput(nbytes), "ok" if digest == expected else "MISMATCH"])
+            bench.remove(imagetype, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError) as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
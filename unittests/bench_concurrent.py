@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_concurrent.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of concurrent TSK tools on a single image
+# @details This script starts 1, 2, 4, ... N concurrent processes of the same
+# TSK tool (fls -r, icat of one file or tsk_recover -a) on one image and
+# measures the aggregate throughput, the latency of the single processes and
+# the CPU utilization (CPU time of all processes per wall-clock time). The
+# output of every concurrent process is compared against a single run before
+# the measurement, so a race in the btrfs code shows up as a mismatch.
+################################################################################
+
+import argparse
+import os
+import sys
+import time
+import shutil
+import hashlib
+import statistics
+import subprocess
+import benchmark
+import testimage
+
+
+##
+# compute a digest of a recovered directory tree
+#
+# @param path root directory of the tree
+# @return tuple of md5 sum in hex digits and size of all files in bytes
+#
+def tree_digest(path):
+    hashsum = hashlib.md5()
+    size = 0
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            fname = os.path.join(root, f)
+            hashsum.update(os.path.relpath(fname, path).encode('utf-8', 'surrogateescape'))
+            hashsum.update(testimage.ImageFactory.md5sum(fname).encode('ascii'))
+            size += os.lstat(fname).st_size
+    return hashsum.hexdigest(), size
+
+
+##
+# compute a digest of the output of a process
+#
+# @param out output file (stdout) or output directory (tsk_recover)
+# @return tuple of md5 sum in hex digits and size in bytes
+#
+def output_digest(out):
+    if os.path.isdir(out):
+        return tree_digest(out)
+    return testimage.ImageFactory.md5sum(out), os.lstat(out).st_size
+
+
+##
+# run a TSK tool in concurrent processes
+# @details All processes are started at once; every process writes to its
+# own output (a file for stdout, or the directory given in the command).
+#
+# @param cmds list of commands, one per process
+# @param outputs list of output files, None if the output is a directory
+# @throw BenchmarkError if a process failed
+# @return tuple of wall-clock time in seconds, list of latencies in seconds,
+#         CPU time of all processes in seconds and peak memory in KiB
+#
+def run_concurrent(cmds, outputs):
+    procs = dict()
+    files = list()
+    start = time.perf_counter()
+    try:
+        for cmd, out in zip(cmds, outputs):
+            stdout = subprocess.DEVNULL
+            if out is not None:
+                stdout = open(out, 'wb')
+                files.append(stdout)
+            p = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.DEVNULL)
+            procs[p.pid] = (p, time.perf_counter())
+        latencies = list()
+        cpu = 0.0
+        maxrss = 0
+        failed = list()
+        while procs:
+            # reap the processes in the order they finish
+            pid, status, usage = os.wait4(-1, 0)
+            if pid not in procs:
+                continue
+            p, started = procs.pop(pid)
+            latencies.append(time.perf_counter() - started)
+            p.returncode = os.waitstatus_to_exitcode(status)
+            if p.returncode != 0:
+                failed.append(' '.join(p.args) + " failed with " + str(p.returncode))
+            cpu += usage.ru_utime + usage.ru_stime
+            maxrss = max(maxrss, usage.ru_maxrss)
+        elapsed = time.perf_counter() - start
+    finally:
+        for f in files:
+            f.close()
+    if failed:
+        raise benchmark.BenchmarkError(failed[0])
+    return elapsed, latencies, cpu, maxrss
+
+
+##
+# measure a workload with a number of concurrent processes
+#
+# @param cmd function returning the command for an output directory
+# @param stdout flag if the output is written to stdout
+# @param count number of concurrent processes
+# @param repeat number of runs
+# @param work directory of the outputs
+# @param baseline digest of the output of a single run
+# @throw BenchmarkError if a process failed
+# @return tuple of Measurement of the wall-clock time, list of all latencies,
+#         median CPU time, bytes per process and number of mismatches
+#
+def measure_level(cmd, stdout, count, repeat, work, baseline):
+    times = list()
+    latencies = list()
+    cpus = list()
+    maxrss = 0
+    nbytes = 0
+    mismatches = 0
+    for i in range(0, repeat):
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        outs = [os.path.join(work, "out-{}".format(n)) for n in range(0, count)]
+        if not stdout:
+            for out in outs:
+                os.makedirs(out)
+        elapsed, lat, cpu, rss = run_concurrent([cmd(out) for out in outs],
+                                                outs if stdout else [None] * count)
+        times.append(elapsed)
+        latencies += lat
+        cpus.append(cpu)
+        maxrss = max(maxrss, rss)
+        for out in outs:
+            digest, nbytes = output_digest(out)
+            if digest != baseline:
+                mismatches += 1
+    shutil.rmtree(work, ignore_errors=True)
+    return benchmark.Measurement(times, maxrss), latencies, statistics.median(cpus), nbytes, \
+        mismatches
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how concurrent fls, icat and tsk_recover processes on the same "
+                    "image scale and check that their outputs are identical.")
+    parser.add_argument('-t', default='btrfs', metavar='type',
+                        help="image type (default = btrfs)")
+    parser.add_argument('-n', nargs='+', type=int, metavar='processes', default=[1, 2, 4, 8],
+                        help="numbers of concurrent processes (default = 1 2 4 8)")
+    parser.add_argument('-w', nargs='+', choices=['fls', 'icat', 'recover'],
+                        default=['fls', 'icat', 'recover'], metavar='workload',
+                        help="workloads: fls, icat, recover (default = all)")
+    parser.add_argument('--fast', action='store_true',
+                        help="skip the big file and read the standard file with icat")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the image in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+    if args.t not in testimage.IMAGE_TYPES:
+        parser.error("unknown image type " + args.t)
+    if min(args.n) < 1:
+        parser.error("the number of processes must be positive")
+
+    variant = "concurrent" + ("_fast" if args.fast else "")
+    target = "file" if args.fast else "file_big"
+    bench = benchmark.Benchmark(args.i, args.r)
+    header = ['workload', 'processes', 'wall s', 'MiB/s', 'speedup', 'latency s',
+              'latency max s', 'CPU cores', 'CPU %', 'RSS MiB', 'output']
+    rows = list()
+    work = bench.rec_dir
+    try:
+        files = bench.image(args.t, variant, size=args.s, fast=args.fast)
+        image = files[0]
+        inode = bench.inode(image, target)
+        workloads = {
+            'fls': (lambda out: ['fls', '-r', '-m', '/', image], True),
+            'icat': (lambda out: ['icat', image, str(inode)], True),
+            'recover': (lambda out: ['tsk_recover', '-a', image, out], False)}
+
+        for workload in args.w:
+            cmd, stdout = workloads[workload]
+            # single run as baseline of the output
+            shutil.rmtree(work, ignore_errors=True)
+            os.makedirs(work)
+            out = os.path.join(work, "baseline")
+            if not stdout:
+                os.makedirs(out)
+            run_concurrent([cmd(out)], [out] if stdout else [None])
+            baseline, _ = output_digest(out)
+            shutil.rmtree(work, ignore_errors=True)
+
+            # throughput of a single process at the lowest level
+            single = None
+            for count in sorted(set(args.n)):
+                m, latencies, cpu, nbytes, mismatches = measure_level(
+                    cmd, stdout, count, args.r, work, baseline)
+                throughput = m.throughput(count * nbytes)
+                if single is None:
+                    single = throughput / count
+                rows.append([workload, count, m.elapsed, throughput,
+                             throughput / single if single else None,
+                             statistics.median(latencies), max(latencies),
+                             cpu / m.elapsed if m.elapsed else None,
+                             100.0 * cpu / m.elapsed / (os.cpu_count() or 1) if m.elapsed else None,
+                             m.maxrss / 1024,
+                             "identical" if mismatches == 0 else
+                             "{} MISMATCHES".format(mismatches)])
+        bench.remove(args.t, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError) as e:
+        print("ERROR:", e, file=sys.stderr)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    benchmark.print_table(header, rows)
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_deleted.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the deleted-file recovery of TSK
+# @details This script creates btrfs images with a growing number of deleted
+# files of mixed sizes, optionally with part of the freed space written again
+# (churn), and measures the enumeration of the deleted entries (fls -r -d and
+# ils -A), the recovery of the deleted files with tsk_recover and the recovery
+# rate: the fraction of deleted files listed by TSK and the fraction recovered
+# byte-exact, compared against the sums kept in the image manifest.
+################################################################################
+
+import argparse
+import sys
+import subprocess
+import benchmark
+import testimage
+import textparser
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the enumeration and recovery of deleted files by TSK and its "
+                    "recovery rate.")
+    parser.add_argument('-n', nargs='+', type=int, metavar='files', default=[1000, 5000],
+                        help="numbers of deleted files (default = 1000 5000)")
+    parser.add_argument('-c', nargs='+', type=float, metavar='churn', default=[0.0, 0.5],
+                        help="fractions of the deleted bytes written again after the deletion "
+                             "(default = 0.0 0.5)")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the images in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+    if min(args.n) < 1:
+        parser.error("the number of deleted files must be positive")
+
+    imagetype = 'btrfs_deleted'
+    bench = benchmark.Benchmark(args.i, args.r)
+    header = ['files', 'churn', 'fls -d s', 'ils -A s', 'recover s', 'recover MiB/s',
+              'recover RSS MiB', 'listed %', 'recovered %']
+    rows = list()
+    try:
+        for count in sorted(args.n):
+            for churn in sorted(args.c):
+                variant = "files_{}_churn_{}".format(count, churn)
+                bench.fac.DELETED_FILES = count
+                bench.fac.DELETED_CHURN = churn
+                files = bench.image(imagetype, variant, size=args.s, fast=True)
+                image = files[0]
+                expected = testimage.ImageFactory.read_manifest(files[-1], 'deleted')
+
+                fls = bench.measure(['fls', '-r', '-d', image])
+                ils = bench.measure(['ils', '-A', image])
+                out = subprocess.check_output(['fls', '-r', '-d', '-p', image],
+                                              stderr=subprocess.DEVNULL)
+                listed = set(textparser.TextParser.parse_fls_names(out)) & expected.keys()
+
+                hashes = dict()
+                recover, nbytes = bench.recover(image, unallocated=True, hashes=hashes)
+                exact = [p for p in expected if hashes.get(p) == expected[p]]
+
+                rows.append([count, churn, fls.elapsed, ils.elapsed, recover.elapsed,
+                             recover.throughput(nbytes), recover.maxrss / 1024,
+                             100.0 * len(listed) / len(expected),
+                             100.0 * len(exact) / len(expected)])
+                bench.remove(imagetype, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError,
+            subprocess.CalledProcessError) as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
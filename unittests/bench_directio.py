@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_directio.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the memory usage of buffered and direct io loop devices
+# @details This script runs the complete test set-up (setUpClassCustom: mount,
+# metadata retrieval with TSK and stat, file recovery) of an image type once
+# with loop devices using buffered io and once using direct io. The page cache
+# is dropped before each run, the growth of the page cache and the drop of the
+# available memory are sampled during the run.
+################################################################################
+
+import argparse
+import os
+import sys
+import time
+import benchmark
+import testimage
+import test_btrfs
+
+
+##
+# run the test set-up and tear-down of an image type
+#
+# @param imagetype type of the image
+# @param direct_io flag to attach the loop devices with direct io
+# @return tuple of elapsed time in seconds and the MemorySampler
+#
+def run_setup(imagetype, direct_io):
+    # fresh class and factory, so neither the collected metadata nor the loop
+    # io setting is shared with other runs
+    fac = testimage.ImageFactory(True)
+    fac.LOOP_DIRECT_IO = direct_io
+    cls = type('DirectIo', (test_btrfs.TestBtrfs,),
+               {'keep_images': True, 'tsk': set(), 'stat': set(), 'fac': fac})
+
+    benchmark.MemorySampler.drop_caches()
+    with benchmark.MemorySampler() as sampler:
+        start = time.perf_counter()
+        cls.setUpClassCustom(cls, imagetype)
+        elapsed = time.perf_counter() - start
+    cls.tearDownClassCustom(cls, imagetype)
+    return elapsed, sampler
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the memory usage of the test set-up with buffered and direct io "
+                    "loop devices.")
+    parser.add_argument('-t', nargs='+', metavar='type', default=['btrfs', 'btrfs_raid1DM'],
+                        help="image types (default = btrfs btrfs_raid1DM)")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    if os.getuid() != 0:
+        print("ERROR: this benchmark needs root", file=sys.stderr)
+        return
+
+    header = ['type', 'loop io', 'setup s', 'page cache growth MiB', 'available drop MiB']
+    rows = list()
+    ipath = test_btrfs.TestBtrfs.ipath
+    fac = testimage.ImageFactory(True)
+    try:
+        for imagetype in args.t:
+            # create the image beforehand, so its creation is not measured
+            os.makedirs(ipath, exist_ok=True)
+            existed = os.path.isfile(os.path.join(ipath, fac.names(imagetype)[-1]))
+            fac.create(imagetype, imagedir=ipath)
+            try:
+                for direct_io in (False, True):
+                    elapsed, sampler = run_setup(imagetype, direct_io)
+                    rows.append([imagetype, "direct" if direct_io else "buffered", elapsed,
+                                 sampler.cache_growth / 1024, sampler.available_drop / 1024])
+            finally:
+                # images of other runs are kept
+                if not existed:
+                    fac.delete(imagetype, ipath)
+    except testimage.ImageCreationError as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
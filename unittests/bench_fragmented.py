@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_fragmented.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the extent tree traversal of TSK
+# @details This script creates a btrfs image with heavily fragmented files and
+# measures the read throughput of icat for every fragmented file against its
+# extent count (taken from the image manifest). The content read by icat is
+# checked against the manifest.
+################################################################################
+
+import argparse
+import os
+import sys
+import benchmark
+import testimage
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the read throughput of TSK against the extent count of files.")
+    parser.add_argument('-f', type=int, default=testimage.ImageFactory.FRAGMENTED_FILES,
+                        metavar='files', help="number of fragmented files (default = " +
+                                              str(testimage.ImageFactory.FRAGMENTED_FILES) + ")")
+    parser.add_argument('-m', type=int, default=4, metavar='MiB',
+                        help="size of each fragmented file in MiB (default = 4)")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the image in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    imagetype = 'btrfs_fragmented'
+    variant = "files_{}_{}M".format(args.f, args.m)
+    bench = benchmark.Benchmark(args.i, args.r)
+    bench.fac.FRAGMENTED_FILES = args.f
+    bench.fac.FRAGMENTED_SIZE = args.m * (1024 ** 2)
+
+    header = ['file', 'extents', 'MiB', 'icat s', 'icat MiB/s', 'icat RSS MiB', 'content']
+    rows = list()
+    try:
+        files = bench.image(imagetype, variant, size=args.s, fast=True)
+        image = files[0]
+        sums = testimage.ImageFactory.read_manifest(files[-1])
+        extents = testimage.ImageFactory.read_manifest(files[-1], 'extents')
+
+        for path in sorted(extents, key=lambda p: int(extents[p])):
+            if not os.path.basename(path).startswith("file_fragmented_"):
+                continue
+            inode = bench.inode(image, path)
+            digest, size = bench.icat_md5(image, inode)
+            icat = bench.measure(['icat', image, str(inode)])
+            rows.append([path, int(extents[path]), size / 1024 ** 2, icat.elapsed,
+                         icat.throughput(size), icat.maxrss / 1024,
+                         "ok" if digest == sums.get(path) else "MISMATCH"])
+        bench.remove(imagetype, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError) as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    measured = [row for row in rows if row[2] > 0]
+    if len(measured) > 1:
+        exponent = benchmark.scaling_exponent([row[1] for row in measured],
+                                              [row[3] / row[2] for row in measured])
+        print()
+        print("scaling exponent of time per MiB against extent count (1 = linear):",
+              benchmark.format_value(exponent))
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_hugedir.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the directory lookup scaling of TSK
+# @details This script creates btrfs images with a huge directory of a growing
+# number of entries and measures the time of fls listing the directory and of
+# ifind looking up single entries (first, middle and last) by path. The
+# scaling exponent of the times against the entry count shows whether the
+# directory iteration and the name lookup grow linear (about 1) or
+# logarithmic (about 0).
+################################################################################
+
+import argparse
+import sys
+import benchmark
+import testimage
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure fls and ifind -n times of TSK against the number of entries "
+                    "in a directory.")
+    parser.add_argument('-n', nargs='+', type=int, metavar='entries',
+                        default=[1000, 10000, 100000, 1000000],
+                        help="entry counts to measure (default = 1000 10000 100000 1000000)")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the images in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    imagetype = 'btrfs_hugedir'
+    dname = "directory_huge"
+    bench = benchmark.Benchmark(args.i, args.r)
+    header = ['entries', 'fls s', 'fls RSS MiB', 'ifind first s', 'ifind middle s',
+              'ifind last s', 'ifind RSS MiB']
+    rows = list()
+    try:
+        for entries in sorted(args.n):
+            variant = "entries_{}".format(entries)
+            bench.fac.HUGEDIR_ENTRIES = entries
+            files = bench.image(imagetype, variant, size=args.s, fast=True)
+            image = files[0]
+
+            inode = bench.inode(image, dname)
+            fls = bench.measure(['fls', image, str(inode)])
+
+            lookups = list()
+            maxrss = 0
+            for i in (0, entries // 2, entries - 1):
+                path = '/' + dname + '/' + testimage.ImageFactory.entry_name(i)
+                m = bench.measure(['ifind', '-n', path, image])
+                lookups.append(m.elapsed)
+                maxrss = max(maxrss, m.maxrss)
+
+            rows.append([entries, fls.elapsed, fls.maxrss / 1024] + lookups + [maxrss / 1024])
+            bench.remove(imagetype, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError) as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    if len(rows) > 1:
+        counts = [row[0] for row in rows]
+        print()
+        print("scaling exponent (0 = logarithmic or constant, 1 = linear):")
+        for col, name in ((1, 'fls'), (3, 'ifind first'), (4, 'ifind middle'),
+                          (5, 'ifind last')):
+            exponent = benchmark.scaling_exponent(counts, [row[col] for row in rows])
+            print("  {:<13} {}".format(name, benchmark.format_value(exponent)))
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
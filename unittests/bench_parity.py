@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_parity.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the TSK btrfs implementation against the ext4 module
+# @details This script creates an ext4 reference image and a btrfs image from
+# the same recipe (standard and deleted files) and payload, runs the same TSK
+# workloads on both (fls -r, ils -a, istat for every file and the recovery of
+# all files) and reports the btrfs/ext4 ratios of time and peak memory. The
+# ext4 module of TSK is mature, so the ratios are a performance target for the
+# btrfs implementation.
+################################################################################
+
+import argparse
+import sys
+import subprocess
+import benchmark
+import testimage
+import textparser
+
+
+##
+# run istat for all files of an image
+#
+# @param bench Benchmark used for the runs
+# @param image image file
+# @param inodes list of inode numbers
+# @throw BenchmarkError if istat failed
+# @return Measurement of the whole batch
+#
+def istat_batch(bench, image, inodes):
+    times = list()
+    maxrss = 0
+    for i in range(0, bench.repeat):
+        elapsed = 0.0
+        for inode in inodes:
+            t, rss = bench.run(['istat', image, str(inode)])
+            elapsed += t
+            maxrss = max(maxrss, rss)
+        times.append(elapsed)
+    return benchmark.Measurement(times, maxrss)
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the TSK times and memory usage of btrfs against ext4 on images "
+                    "with the same files.")
+    parser.add_argument('-p', action='append', default=[], metavar='class=mode',
+                        help="payload of the created files (see testimage.py)")
+    parser.add_argument('-e', type=float, default=1.0, metavar='entropy',
+                        help="fraction of random bytes in random payloads (default = 1.0)")
+    parser.add_argument('--seed', type=int, default=0, metavar='seed',
+                        help="seed of random payloads (default = 0)")
+    parser.add_argument('--full', action='store_true',
+                        help="include the big files (slow image creation)")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the images in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    try:
+        payload = testimage.Payload.from_args(args.p, args.e, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # same variant for both images, different payloads need different variants
+    variant = "parity_" + ("full" if args.full else "fast")
+    if payload:
+        variant += "_" + "_".join("{}-{}-{}-{}".format(c, p.mode, p.entropy, p.seed)
+                                  for c, p in sorted(payload.items()))
+    bench = benchmark.Benchmark(args.i, args.r)
+    fls_parser = textparser.TextParser(True, False)
+
+    results = dict()
+    try:
+        for imagetype in ('ext4', 'btrfs_reference'):
+            files = bench.image(imagetype, variant, size=args.s, fast=not args.full,
+                                payload=payload)
+            image = files[0]
+
+            out = subprocess.check_output(['fls', '-r', '-m', '/', image],
+                                          stderr=subprocess.DEVNULL)
+            inodes = sorted(set(line[1] for line in fls_parser.parse_fls_files(out)))
+
+            recover, nbytes = bench.recover(image)
+            results[imagetype] = {
+                'fls -r': bench.measure(['fls', '-r', '-m', '/', image]),
+                'ils -a': bench.measure(['ils', '-a', image]),
+                'istat batch': istat_batch(bench, image, inodes),
+                'tsk_recover': recover}
+            print(imagetype + ":", len(inodes), "files,",
+                  "{:.1f} MiB recovered".format(nbytes / 1024 ** 2))
+    except (testimage.ImageCreationError, benchmark.BenchmarkError,
+            subprocess.CalledProcessError) as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+
+    header = ['workload', 'ext4 s', 'btrfs s', 'time ratio', 'ext4 RSS MiB', 'btrfs RSS MiB',
+              'memory ratio']
+    rows = list()
+    for workload in results['ext4']:
+        ext4 = results['ext4'][workload]
+        btrfs = results['btrfs_reference'][workload]
+        rows.append([workload, ext4.elapsed, btrfs.elapsed,
+                     btrfs.elapsed / ext4.elapsed if ext4.elapsed else None,
+                     ext4.maxrss / 1024, btrfs.maxrss / 1024,
+                     btrfs.maxrss / ext4.maxrss if ext4.maxrss else None])
+    benchmark.print_table(header, rows)
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_raid_first_member.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of TSK on the first member of raid images
+# @details This script creates raid10, raid5 and raid6 btrfs images with a
+# growing number of devices and measures the time of fls -r, ils -a and
+# tsk_recover on the first member against the device count. TSK opens one
+# member only (further image arguments would be read as segments of a split
+# image, not as devices), so this does not measure a chunk mapping or a
+# reconstruction across all members. It shows how the cost of TSK on one
+# member and the amount of data it recovers change when the file system is
+# spread over more devices.
+################################################################################
+
+import argparse
+import sys
+import benchmark
+import testimage
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure fls -r, ils -a and tsk_recover times of TSK on the first member "
+                    "of raid images against their number of devices.")
+    parser.add_argument('-t', nargs='+', metavar='type',
+                        default=['btrfs_raid10', 'btrfs_raid5', 'btrfs_raid6'],
+                        help="image types (default = btrfs_raid10 btrfs_raid5 btrfs_raid6)")
+    parser.add_argument('-n', nargs='+', type=int, metavar='devices', default=[4, 6, 8],
+                        help="device counts to measure (default = 4 6 8)")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of every member in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    for imagetype in args.t:
+        if imagetype not in testimage.IMAGE_TYPES or \
+                testimage.IMAGE_TYPES[imagetype].min_devices is None:
+            parser.error(imagetype + " is not a raid type with a variable number of devices")
+
+    bench = benchmark.Benchmark(args.i, args.r)
+    header = ['type', 'devices', 'fls -r s', 'fls RSS MiB', 'ils -a s', 'ils RSS MiB',
+              'recover s', 'recover MiB', 'recover MiB/s', 'recover RSS MiB']
+    rows = list()
+    try:
+        for imagetype in args.t:
+            for n in sorted(args.n):
+                if n < testimage.IMAGE_TYPES[imagetype].min_devices:
+                    continue
+                variant = "devices_{}".format(n)
+                bench.fac.RAID_DEVICES = n
+                files = bench.image(imagetype, variant, size=args.s, fast=True)
+                # TSK reads the first member only
+                image = files[0]
+
+                fls = bench.measure(['fls', '-r', '-m', '/', image])
+                ils = bench.measure(['ils', '-a', image])
+                recover, nbytes = bench.recover(image)
+                row = [imagetype, n, fls.elapsed, fls.maxrss / 1024, ils.elapsed,
+                       ils.maxrss / 1024, recover.elapsed, nbytes / 1024 ** 2,
+                       recover.throughput(nbytes), recover.maxrss / 1024]
+                rows.append(row)
+                bench.remove(imagetype, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError) as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    for imagetype in args.t:
+        measured = [row for row in rows if row[0] == imagetype]
+        if len(measured) > 1:
+            print()
+            print("scaling exponent of", imagetype, "against the device count (1 = linear):")
+            for col, name in ((2, 'fls -r'), (4, 'ils -a'), (6, 'tsk_recover')):
+                exponent = benchmark.scaling_exponent([row[1] for row in measured],
+                                                      [row[col] for row in measured])
+                print("  {:<12} {}".format(name, benchmark.format_value(exponent)))
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+################################################################################
+# @file bench_snapshots.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief benchmark of the subvolume enumeration scaling of TSK
+# @details This script creates btrfs images with a growing number of
+# subvolumes and snapshots (all sharing most of their extents) and measures
+# the time of fls -r, ils -a and tsk_recover against the number of subvolumes.
+################################################################################
+
+import argparse
+import sys
+import benchmark
+import testimage
+
+
+##
+# main program of the benchmark
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure fls -r, ils -a and tsk_recover times of TSK against the number "
+                    "of subvolumes and snapshots.")
+    parser.add_argument('-n', nargs='+', type=int, metavar='subvolumes',
+                        default=[10, 100, 1000],
+                        help="subvolume counts to measure (default = 10 100 1000)")
+    parser.add_argument('-m', nargs='+', type=int, metavar='snapshots',
+                        default=[10, 100, 1000],
+                        help="snapshot counts to measure, paired with the subvolume counts "
+                             "(default = 10 100 1000)")
+    parser.add_argument('--grid', action='store_true',
+                        help="measure every combination of subvolume and snapshot count")
+    parser.add_argument('-s', type=int, default=5, metavar='size',
+                        help="size of the images in GiB (default = 5)")
+    parser.add_argument('-r', type=int, default=3, metavar='repeat',
+                        help="number of runs per measurement (default = 3)")
+    parser.add_argument('-i', default=benchmark.Benchmark.ipath, metavar='dir',
+                        help="directory of the benchmark images")
+    parser.add_argument('--csv', metavar='file', help="write the results to a CSV file")
+    args = parser.parse_args()
+
+    if args.grid:
+        counts = [(n, m) for n in args.n for m in args.m]
+    elif len(args.n) == len(args.m):
+        counts = list(zip(args.n, args.m))
+    else:
+        parser.error("subvolume and snapshot counts must be paired (or use --grid)")
+
+    imagetype = 'btrfs_snapshots'
+    bench = benchmark.Benchmark(args.i, args.r)
+    header = ['subvolumes', 'snapshots', 'fls -r s', 'fls RSS MiB', 'ils -a s',
+              'ils RSS MiB', 'recover s', 'recover RSS MiB']
+    rows = list()
+    try:
+        for n, m in sorted(counts):
+            variant = "subvolumes_{}_snapshots_{}".format(n, m)
+            bench.fac.SNAPSHOT_SUBVOLUMES = n
+            bench.fac.SNAPSHOT_COUNT = m
+            files = bench.image(imagetype, variant, size=args.s, fast=True)
+            image = files[0]
+
+            fls = bench.measure(['fls', '-r', '-m', '/', image])
+            ils = bench.measure(['ils', '-a', image])
+            recover, nbytes = bench.recover(image)
+            rows.append([n, m, fls.elapsed, fls.maxrss / 1024, ils.elapsed, ils.maxrss / 1024,
+                         recover.elapsed, recover.maxrss / 1024])
+            bench.remove(imagetype, variant)
+    except (testimage.ImageCreationError, benchmark.BenchmarkError) as e:
+        print("ERROR:", e, file=sys.stderr)
+
+    benchmark.print_table(header, rows)
+    if len(rows) > 1:
+        total = [row[0] + row[1] for row in rows]
+        print()
+        print("scaling exponent against subvolumes + snapshots (1 = linear):")
+        for col, name in ((2, 'fls -r'), (4, 'ils -a'), (6, 'tsk_recover')):
+            exponent = benchmark.scaling_exponent(total, [row[col] for row in rows])
+            print("  {:<12} {}".format(name, benchmark.format_value(exponent)))
+    if args.csv is not None:
+        benchmark.write_csv(args.csv, header, rows)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
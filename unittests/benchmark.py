@@ -0,0 +1,393 @@
+#!/usr/bin/python3
+################################################################################
+# @file benchmark.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief common functions for the benchmarks of the TSK btrfs implementation
+# @details This module provides the parts shared by the benchmark scripts
+# (bench_*.py): creation of benchmark images using the ImageFactory, timed
+# execution of the TSK tools including their peak memory usage, verification
+# of extracted file content against the image manifest ([image].md5) and
+# output of the results as a table or CSV file.
+################################################################################
+
+import os
+import sys
+import csv
+import math
+import time
+import shutil
+import hashlib
+import statistics
+import subprocess
+import threading
+import testimage
+
+
+##
+# exception used in the Benchmark class
+#
+class BenchmarkError(Exception):
+    pass
+
+
+##
+# result of repeated runs of a command
+#
+class Measurement:
+    ##
+    # constructor
+    #
+    # @param times list of wall-clock times in seconds
+    # @param maxrss peak resident set size of the command in KiB
+    # @return a new instance of this class
+    #
+    def __init__(self, times, maxrss):
+        self.times = times
+        self.maxrss = maxrss
+
+    ##
+    # median wall-clock time in seconds
+    #
+    @property
+    def elapsed(self):
+        return statistics.median(self.times)
+
+    ##
+    # throughput in MiB/s for a given amount of data
+    #
+    # @param nbytes number of bytes processed per run
+    # @return throughput based on the median time
+    #
+    def throughput(self, nbytes):
+        if self.elapsed == 0:
+            return float('inf')
+        return nbytes / (1024 ** 2) / self.elapsed
+
+
+##
+# class used to create benchmark images and measure the TSK tools
+#
+class Benchmark:
+    # directory where the benchmark images are stored
+    ipath = "bench_images"
+    # directory where recovered files are stored during a measurement
+    rec_dir = ".bench_files"
+    # number of runs per measurement
+    repeat = 3
+    # keep the images after the benchmark finished
+    keep_images = True
+
+    ##
+    # constructor
+    #
+    # @param ipath directory of the benchmark images (None = default)
+    # @param repeat number of runs per measurement (None = default)
+    # @return a new instance of this class
+    #
+    def __init__(self, ipath=None, repeat=None):
+        if ipath is not None:
+            self.ipath = ipath
+        if repeat is not None:
+            self.repeat = repeat
+        self.fac = testimage.ImageFactory(True)
+
+    ##
+    # create a benchmark image (or reuse an existing one)
+    #
+    # @param imagetype type of the image
+    # @param variant name of the subdirectory for this image variant, images
+    #        created with different parameters must use different variants
+    # @param kwargs parameters passed to ImageFactory.create
+    # @throw ImageCreationError if something went wrong
+    # @return tuple of image files and the md5 file (with path)
+    #
+    def image(self, imagetype, variant="default", **kwargs):
+        path = os.path.join(self.ipath, variant)
+        os.makedirs(path, exist_ok=True)
+        print("creating image", imagetype, "(" + variant + ") ...")
+        files = self.fac.create(imagetype, imagedir=path, **kwargs)
+        return tuple(os.path.join(path, f) for f in files)
+
+    ##
+    # remove a benchmark image unless images are kept
+    #
+    # @param imagetype type of the image
+    # @param variant name of the subdirectory of the image
+    # @return None
+    #
+    def remove(self, imagetype, variant="default"):
+        if not self.keep_images:
+            self.fac.delete(imagetype, os.path.join(self.ipath, variant))
+
+    ##
+    # run a command once
+    #
+    # @param cmd command to run
+    # @param stdout target of the command output
+    # @throw BenchmarkError if the command failed
+    # @return tuple of wall-clock time in seconds and peak memory in KiB
+    #
+    @staticmethod
+    def run(cmd, stdout=subprocess.DEVNULL):
+        start = time.perf_counter()
+        p = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(p.pid, 0)
+        elapsed = time.perf_counter() - start
+        p.returncode = os.waitstatus_to_exitcode(status)
+        if p.returncode != 0:
+            raise BenchmarkError(' '.join(cmd) + " failed with " + str(p.returncode))
+        return elapsed, usage.ru_maxrss
+
+    ##
+    # run a command several times
+    #
+    # @param cmd command to run
+    # @param repeat number of runs (None = default)
+    # @throw BenchmarkError if the command failed
+    # @return Measurement of the runs
+    #
+    def measure(self, cmd, repeat=None):
+        times = list()
+        maxrss = 0
+        for i in range(0, repeat or self.repeat):
+            elapsed, rss = self.run(cmd)
+            times.append(elapsed)
+            maxrss = max(maxrss, rss)
+        return Measurement(times, maxrss)
+
+    ##
+    # measure the recovery of all allocated (or all deleted) files with tsk_recover
+    #
+    # @param image image file
+    # @param repeat number of runs (None = default)
+    # @param unallocated flag to recover the deleted files instead
+    # @param hashes dict filled with the md5 sums of the recovered files by
+    #        relative path, None to skip hashing
+    # @throw BenchmarkError if the recovery failed
+    # @return tuple of Measurement and number of recovered bytes
+    #
+    def recover(self, image, repeat=None, unallocated=False, hashes=None):
+        times = list()
+        maxrss = 0
+        nbytes = 0
+        cmd = ['tsk_recover'] + ([] if unallocated else ['-a']) + [image, self.rec_dir]
+        try:
+            for i in range(0, repeat or self.repeat):
+                shutil.rmtree(self.rec_dir, ignore_errors=True)
+                os.makedirs(self.rec_dir)
+                elapsed, rss = self.run(cmd)
+                times.append(elapsed)
+                maxrss = max(maxrss, rss)
+            for root, dirs, files in os.walk(self.rec_dir):
+                for f in files:
+                    nbytes += os.lstat(os.path.join(root, f)).st_size
+                    if hashes is not None:
+                        hashes[os.path.relpath(os.path.join(root, f), self.rec_dir)] = \
+                            testimage.ImageFactory.md5sum(os.path.join(root, f))
+        finally:
+            shutil.rmtree(self.rec_dir, ignore_errors=True)
+        return Measurement(times, maxrss), nbytes
+
+    ##
+    # look up the inode of a path with ifind
+    #
+    # @param image image file
+    # @param path path of the file, relative to the root directory
+    # @throw BenchmarkError if the file was not found
+    # @return inode number
+    #
+    @staticmethod
+    def inode(image, path):
+        try:
+            out = subprocess.check_output(['ifind', '-n', '/' + path, image],
+                                          stderr=subprocess.DEVNULL)
+            return int(out.split()[0])
+        except (subprocess.CalledProcessError, ValueError, IndexError):
+            raise BenchmarkError("could not find " + path)
+
+    ##
+    # extract a file with icat and hash its content
+    #
+    # @param image image file
+    # @param inode inode number of the file
+    # @throw BenchmarkError if the extraction failed
+    # @return tuple of md5 sum in hex digits and size in bytes
+    #
+    @staticmethod
+    def icat_md5(image, inode):
+        hashsum = hashlib.md5()
+        size = 0
+        p = subprocess.Popen(['icat', image, str(inode)], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL)
+        for chunk in iter(lambda: p.stdout.read(1024 ** 2), b''):
+            hashsum.update(chunk)
+            size += len(chunk)
+        if p.wait() != 0:
+            raise BenchmarkError("icat failed for inode " + str(inode))
+        return hashsum.hexdigest(), size
+
+
+##
+# print rows as aligned table
+#
+# @param header list of column names
+# @param rows list of rows
+# @param out output stream
+# @return None
+#
+def print_table(header, rows, out=sys.stdout):
+    rows = [[format_value(v) for v in row] for row in rows]
+    widths = [len(h) for h in header]
+    for row in rows:
+        widths = [max(w, len(v)) for w, v in zip(widths, row)]
+    print('  '.join(h.ljust(w) for h, w in zip(header, widths)), file=out)
+    print('  '.join('-' * w for w in widths), file=out)
+    for row in rows:
+        print('  '.join(v.ljust(w) for v, w in zip(row, widths)), file=out)
+
+
+##
+# write rows to a CSV file
+#
+# @param fname name of the CSV file
+# @param header list of column names
+# @param rows list of rows
+# @return None
+#
+def write_csv(fname, header, rows):
+    with open(fname, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+##
+# format a value for table output
+#
+# @param value value to format
+# @return string representation
+#
+def format_value(value):
+    if isinstance(value, float):
+        return '{:.3f}'.format(value)
+    return str(value)
+
+
+##
+# estimate how a time grows with a parameter
+# @details The exponent is the slope of a least squares fit in log-log space:
+# about 0 for constant or logarithmic growth, about 1 for linear growth.
+#
+# @param xs list of parameter values
+# @param ys list of measured times
+# @return the exponent, None if it cannot be estimated
+#
+def scaling_exponent(xs, ys):
+    points = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(p[0] for p in points) / len(points)
+    my = sum(p[1] for p in points) / len(points)
+    var = sum((p[0] - mx) ** 2 for p in points)
+    if var == 0:
+        return None
+    return sum((p[0] - mx) * (p[1] - my) for p in points) / var
+
+
+##
+# class used to sample the system memory usage in the background
+# @details The sampler reads /proc/meminfo periodically and keeps the peak
+# of the page cache (Cached + Buffers) and the minimum of the available
+# memory. Use it as context manager around the measured code.
+#
+class MemorySampler:
+    ##
+    # constructor
+    #
+    # @param interval sampling interval in seconds
+    # @return a new instance of this class
+    #
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self.available = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    ##
+    # start sampling
+    #
+    # @return this instance
+    #
+    def __enter__(self):
+        self.start = self.meminfo()
+        self.peak = self.start['Cached'] + self.start['Buffers']
+        self.available = self.start['MemAvailable']
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+        self.__thread.start()
+        return self
+
+    ##
+    # stop sampling
+    #
+    # @return False, exceptions are not suppressed
+    #
+    def __exit__(self, *args):
+        self.__stop.set()
+        self.__thread.join()
+        return False
+
+    ##
+    # growth of the page cache at its peak in KiB
+    #
+    @property
+    def cache_growth(self):
+        return self.peak - self.start['Cached'] - self.start['Buffers']
+
+    ##
+    # drop of the available memory at its minimum in KiB
+    #
+    @property
+    def available_drop(self):
+        return self.start['MemAvailable'] - self.available
+
+    ##
+    # sampling loop of the background thread
+    #
+    # @return None
+    #
+    def __sample(self):
+        while not self.__stop.wait(self.interval):
+            info = self.meminfo()
+            self.peak = max(self.peak, info['Cached'] + info['Buffers'])
+            self.available = min(self.available, info['MemAvailable'])
+
+    ##
+    # read the memory counters of the system
+    #
+    # @return dict of counter name to value in KiB
+    #
+    @staticmethod
+    def meminfo():
+        info = dict()
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                info[name] = int(value.split()[0])
+        return info
+
+    ##
+    # write dirty pages and drop the page cache (needs root)
+    #
+    # @return None
+    #
+    @staticmethod
+    def drop_caches():
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
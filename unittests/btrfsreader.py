@@ -0,0 +1,426 @@
+#!/usr/bin/python3
+################################################################################
+# @file btrfsreader.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief read-only btrfs metadata reader, independent of the kernel and TSK
+# @details This module reads the metadata of all files of a btrfs image
+# without mounting it: the image files are memory-mapped and the superblock,
+# the chunk tree, the root tree and the file system trees are parsed in place.
+# The members of raid images are mapped by their device id, so files on raid
+# 0, 1, 10, 5 and 6 images are found (raid 5 and 6 need all members, the
+# parity is not used). The result has the format of the stat output of
+# ImageFactory.stat_output, so it can replace the mounted image as ground
+# truth of the unit tests, without root and for several images in parallel.
+# Subvolumes, which are not referenced by their parent (the nested
+# subvolumes of a snapshot), are listed as empty directories with inode 2,
+# as the kernel does (new_simple_dir): owner and access time are taken from
+# the parent, the other times are set by the kernel when it creates the
+# directory in memory. They are not on disk, the current time is used.
+# Used stand-alone, the script prints the records of an image.
+################################################################################
+
+import argparse
+import os
+import sys
+import stat
+import time
+import mmap
+import bisect
+import struct
+import collections
+
+
+##
+# main program to support stand-alone script usage
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print the metadata of all files of a btrfs image (all members of raid "
+                    "images) in the format of the stat output of the unit tests, without "
+                    "mounting it.")
+    parser.add_argument('images', nargs='+', metavar='image', help="image files")
+    parser.add_argument('-p', default='', metavar='prefix',
+                        help="path prefix of the files, e.g. the mount path of the unit tests")
+    args = parser.parse_args()
+
+    try:
+        reader = BtrfsReader(args.images)
+        try:
+            sys.stdout.buffer.write(reader.stat_output(args.p))
+        finally:
+            reader.close()
+    except BtrfsReaderError as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+##
+# exception used in the BtrfsReader class
+#
+class BtrfsReaderError(Exception):
+    pass
+
+
+##
+# class used to read the file metadata of a btrfs image
+#
+class BtrfsReader:
+    # position and magic number of the superblock
+    SUPERBLOCK_OFFSET = 0x10000
+    MAGIC = b'_BHRfS_M'
+    # position of the system chunk array in the superblock
+    SYS_CHUNK_ARRAY_OFFSET = 0x32b
+
+    # tree and object ids
+    FS_TREE_OBJECTID = 5
+    EMPTY_SUBVOL_DIR_OBJECTID = 2
+    # item types
+    INODE_ITEM_KEY = 1
+    DIR_INDEX_KEY = 96
+    ROOT_ITEM_KEY = 132
+    ROOT_REF_KEY = 156
+    CHUNK_ITEM_KEY = 228
+    # block group profiles
+    BLOCK_GROUP_RAID0 = 0x8
+    BLOCK_GROUP_RAID10 = 0x40
+    BLOCK_GROUP_RAID5 = 0x80
+    BLOCK_GROUP_RAID6 = 0x100
+
+    # on-disk structures (ctree.h), up to the device id of the superblock
+    SUPERBLOCK = struct.Struct('<32s16sQQ8sQQQQQQQQQIIIIIQQQQHBBBQ')
+    HEADER = struct.Struct('<32s16sQQ16sQQIB')
+    KEY = struct.Struct('<QBQ')
+    ITEM = struct.Struct('<QBQII')
+    KEY_PTR = struct.Struct('<QBQQQ')
+    CHUNK = struct.Struct('<QQQQIIIHH')
+    STRIPE = struct.Struct('<QQ16s')
+    INODE = struct.Struct('<QQQQQIIIIQQQ32sqIqIqIqI')
+    DIR_ITEM = struct.Struct('<QBQQHHB')
+    ROOT_ITEM = struct.Struct('<QQQ')
+    ROOT_ITEM_OFFSET = 160
+    ROOT_REF = struct.Struct('<QQH')
+
+    ##
+    # constructor
+    #
+    # @param images list of image files, all members of raid images
+    # @throw BtrfsReaderError if an image is not a btrfs image or the chunk
+    #        tree cannot be read
+    # @return a new instance of this class
+    #
+    def __init__(self, images):
+        self.__files = list()
+        self.__maps = list()
+        # memory maps by device id
+        self.devices = dict()
+        # chunks sorted by logical address: (logical, length, stripe length,
+        # type, sub stripes, list of (device id, physical address))
+        self.chunks = list()
+        # root items by tree id: (root directory, tree block)
+        self.roots = dict()
+        # root references by (parent tree, tree id): (directory, name)
+        self.refs = dict()
+        # parsed file system trees by tree id
+        self.__trees = dict()
+
+        try:
+            fsid = None
+            for image in images:
+                f = open(image, 'rb')
+                self.__files.append(f)
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__maps.append(mm)
+                sb = self.SUPERBLOCK.unpack_from(mm, self.SUPERBLOCK_OFFSET)
+                if sb[4] != self.MAGIC:
+                    raise BtrfsReaderError(image + " is not a btrfs image")
+                if fsid is None:
+                    fsid = sb[1]
+                    self.superblock = sb
+                    self.nodesize = sb[15]
+                elif sb[1] != fsid:
+                    raise BtrfsReaderError(image + " is not a member of the same file system")
+                self.devices[sb[27]] = mm
+            if fsid is None:
+                raise BtrfsReaderError("no image given")
+
+            # bootstrap the chunk tree from the system chunks of the superblock
+            array = self.__maps[0][self.SUPERBLOCK_OFFSET + self.SYS_CHUNK_ARRAY_OFFSET:
+                                   self.SUPERBLOCK_OFFSET + self.SYS_CHUNK_ARRAY_OFFSET +
+                                   self.superblock[18]]
+            pos = 0
+            while pos < len(array):
+                key = self.KEY.unpack_from(array, pos)
+                pos += self.KEY.size
+                pos = self.__add_chunk(key[2], array, pos)
+            for objectid, itype, offset, data in self.__items(self.superblock[7]):
+                if itype == self.CHUNK_ITEM_KEY:
+                    self.__add_chunk(offset, data, 0)
+
+            for objectid, itype, offset, data in self.__items(self.superblock[6]):
+                if itype == self.ROOT_ITEM_KEY:
+                    root = self.ROOT_ITEM.unpack_from(data, self.ROOT_ITEM_OFFSET)
+                    self.roots[objectid] = (root[1], root[2])
+                elif itype == self.ROOT_REF_KEY:
+                    ref = self.ROOT_REF.unpack_from(data, 0)
+                    name = bytes(data[self.ROOT_REF.size:self.ROOT_REF.size + ref[2]])
+                    self.refs[(objectid, offset)] = (ref[0], name)
+        except (OSError, ValueError, struct.error) as e:
+            self.close()
+            raise BtrfsReaderError("could not read image: " + str(e))
+        except BtrfsReaderError:
+            self.close()
+            raise
+
+    ##
+    # unmap and close the image files
+    #
+    # @return None
+    #
+    def close(self):
+        for mm in self.__maps:
+            try:
+                mm.close()
+            except BufferError:
+                # still referenced by an unfinished tree walk, unmapped when released
+                pass
+        for f in self.__files:
+            f.close()
+        self.__maps = list()
+        self.__files = list()
+        self.devices = dict()
+
+    ##
+    # get the metadata of all files
+    # @details The records are ordered by directory, the path is relative to
+    # the root of the file system. The modification, change and creation times
+    # of the placeholders of unreferenced subvolumes are the current time, as
+    # the kernel sets them when it looks them up (they do not match stat).
+    #
+    # @throw BtrfsReaderError if a tree cannot be read
+    # @return list of (path, inode, uid, gid, mtime, atime, ctime, crtime,
+    #         access rights in octal, links, size) tuples, the path as bytes
+    #
+    def records(self):
+        records = list()
+        now = int(time.time())
+        try:
+            stack = [(b'', self.FS_TREE_OBJECTID, self.roots[self.FS_TREE_OBJECTID][0])]
+            while stack:
+                path, treeid, dirid = stack.pop()
+                inodes, entries = self.__tree(treeid)
+                for name, objectid, ktype in entries.get(dirid, ()):
+                    p = path + b'/' + name if path else name
+                    if ktype == self.ROOT_ITEM_KEY:
+                        # only subvolumes referenced by this directory are shown
+                        if self.refs.get((treeid, objectid)) == (dirid, name):
+                            rootdir = self.roots[objectid][0]
+                            records.append(self.__record(p, rootdir,
+                                                         self.__tree(objectid)[0][rootdir]))
+                            stack.append((p, objectid, rootdir))
+                        else:
+                            parent = inodes[dirid]
+                            records.append((p, self.EMPTY_SUBVOL_DIR_OBJECTID, parent[6],
+                                            parent[7], now, parent[13], now, now, '755', 1,
+                                            0))
+                    else:
+                        inode = inodes[objectid]
+                        records.append(self.__record(p, objectid, inode))
+                        if stat.S_ISDIR(inode[8]):
+                            stack.append((p, treeid, objectid))
+        except KeyError as e:
+            raise BtrfsReaderError("missing inode or tree " + str(e))
+        return records
+
+    ##
+    # check if a range of the logical address space is mapped by the chunk map
+    #
+    # @param logical logical address
+    # @param size number of bytes
+    # @return True if all bytes of the range lie in chunks
+    #
+    def mapped(self, logical, size):
+        while size > 0:
+            i = bisect.bisect_right(self.chunks, (logical, float('inf'))) - 1
+            if i < 0 or logical >= self.chunks[i][0] + self.chunks[i][1]:
+                return False
+            n = min(size, self.chunks[i][0] + self.chunks[i][1] - logical)
+            logical += n
+            size -= n
+        return True
+
+    ##
+    # get the metadata of all files in the format of ImageFactory.stat_output
+    #
+    # @param prefix path prefix of the files (e.g. the mount path)
+    # @throw BtrfsReaderError if a tree cannot be read
+    # @return the records as bytes, one line per file
+    #
+    def stat_output(self, prefix=''):
+        prefix = os.fsencode(prefix)
+        if prefix and not prefix.endswith(b'/'):
+            prefix += b'/'
+        lines = list()
+        for record in self.records():
+            lines.append(b'|'.join([prefix + record[0], str(record[1]).encode(), b'a'] +
+                                   [str(v).encode() for v in record[2:]]))
+        return b''.join(line + b'\n' for line in lines)
+
+    ##
+    # create the record of a file
+    #
+    # @param path path of the file
+    # @param objectid inode number
+    # @param inode unpacked inode item
+    # @return the record
+    #
+    @staticmethod
+    def __record(path, objectid, inode):
+        return (path, objectid, inode[6], inode[7], inode[17], inode[13], inode[15], inode[19],
+                format(inode[8] & 0o7777, 'o'), inode[5], inode[2])
+
+    ##
+    # parse the inodes and directory entries of a file system tree
+    #
+    # @param treeid id of the tree
+    # @throw BtrfsReaderError if the tree cannot be read
+    # @return tuple of a dict of inode number to inode item and a dict of
+    #         directory to list of (name, object id, key type) entries
+    #
+    def __tree(self, treeid):
+        if treeid not in self.__trees:
+            inodes = dict()
+            entries = collections.defaultdict(list)
+            for objectid, itype, offset, data in self.__items(self.roots[treeid][1]):
+                if itype == self.INODE_ITEM_KEY:
+                    inodes[objectid] = self.INODE.unpack_from(data, 0)
+                elif itype == self.DIR_INDEX_KEY:
+                    d = self.DIR_ITEM.unpack_from(data, 0)
+                    name = bytes(data[self.DIR_ITEM.size:self.DIR_ITEM.size + d[5]])
+                    entries[objectid].append((name, d[0], d[1]))
+            self.__trees[treeid] = (inodes, entries)
+        return self.__trees[treeid]
+
+    ##
+    # iterate over the items of a tree in key order
+    #
+    # @param bytenr logical address of the root block of the tree
+    # @throw BtrfsReaderError if a block cannot be read
+    # @return generator of (object id, type, offset, data) tuples
+    #
+    def __items(self, bytenr):
+        stack = [bytenr]
+        while stack:
+            logical = stack.pop()
+            block = self.__read(logical, self.nodesize)
+            header = self.HEADER.unpack_from(block, 0)
+            if header[2] != logical:
+                raise BtrfsReaderError("invalid tree block at {}".format(logical))
+            if header[8] == 0:
+                for i in range(0, header[7]):
+                    item = self.ITEM.unpack_from(block, self.HEADER.size + i * self.ITEM.size)
+                    start = self.HEADER.size + item[3]
+                    yield item[0], item[1], item[2], block[start:start + item[4]]
+            else:
+                # children in reverse order, so they are popped in key order
+                for i in range(header[7] - 1, -1, -1):
+                    ptr = self.KEY_PTR.unpack_from(block, self.HEADER.size + i * self.KEY_PTR.size)
+                    stack.append(ptr[3])
+
+    ##
+    # read a block of the logical address space
+    # @details Blocks within one stripe are returned without copying them.
+    #
+    # @param logical logical address
+    # @param size number of bytes
+    # @throw BtrfsReaderError if the address is not mapped or its device is missing
+    # @return the data as memoryview or bytes
+    #
+    def __read(self, logical, size):
+        parts = list()
+        while size > 0:
+            mm, physical, n = self.__map(logical, size)
+            if physical + n > len(mm):
+                raise BtrfsReaderError("logical address {} beyond its device".format(logical))
+            parts.append(memoryview(mm)[physical:physical + n])
+            logical += n
+            size -= n
+        if len(parts) == 1:
+            return parts[0]
+        return b''.join(parts)
+
+    ##
+    # map a logical address to a device
+    #
+    # @param logical logical address
+    # @param size number of bytes wanted
+    # @throw BtrfsReaderError if the address is not mapped or its device is missing
+    # @return tuple of memory map, physical address and number of contiguous bytes
+    #
+    def __map(self, logical, size):
+        i = bisect.bisect_right(self.chunks, (logical, float('inf'))) - 1
+        if i < 0 or logical >= self.chunks[i][0] + self.chunks[i][1]:
+            raise BtrfsReaderError("logical address {} not mapped".format(logical))
+        start, length, stripe_len, ctype, sub_stripes, stripes = self.chunks[i]
+        offset = logical - start
+        nstripes = len(stripes)
+        stripe_nr = offset // stripe_len
+        in_stripe = offset % stripe_len
+
+        if ctype & self.BLOCK_GROUP_RAID0:
+            candidates = [stripe_nr % nstripes]
+            row = stripe_nr // nstripes
+        elif ctype & self.BLOCK_GROUP_RAID10:
+            factor = nstripes // sub_stripes
+            first = (stripe_nr % factor) * sub_stripes
+            candidates = range(first, first + sub_stripes)
+            row = stripe_nr // factor
+        elif ctype & (self.BLOCK_GROUP_RAID5 | self.BLOCK_GROUP_RAID6):
+            ndata = nstripes - (1 if ctype & self.BLOCK_GROUP_RAID5 else 2)
+            row = stripe_nr // ndata
+            # the stripes rotate by one device per row
+            candidates = [(stripe_nr % ndata + row) % nstripes]
+        else:
+            # single, dup and mirrors: every stripe holds the whole chunk
+            for devid, physical in stripes:
+                if devid in self.devices:
+                    return self.devices[devid], physical + offset, min(size, length - offset)
+            raise BtrfsReaderError("no device of logical address {}".format(logical))
+
+        for k in candidates:
+            devid, physical = stripes[k]
+            if devid in self.devices:
+                return (self.devices[devid], physical + row * stripe_len + in_stripe,
+                        min(size, stripe_len - in_stripe))
+        raise BtrfsReaderError("device of logical address {} is missing".format(logical))
+
+    ##
+    # add a chunk item to the chunk map
+    #
+    # @param logical logical address of the chunk
+    # @param data buffer with the chunk item
+    # @param pos position of the chunk item in the buffer
+    # @return position after the chunk item
+    #
+    def __add_chunk(self, logical, data, pos):
+        chunk = self.CHUNK.unpack_from(data, pos)
+        pos += self.CHUNK.size
+        stripes = list()
+        for i in range(0, chunk[7]):
+            stripe = self.STRIPE.unpack_from(data, pos)
+            stripes.append((stripe[0], stripe[1]))
+            pos += self.STRIPE.size
+        entry = (logical, chunk[0], chunk[2], chunk[3], chunk[8], stripes)
+        i = bisect.bisect_left(self.chunks, (logical,))
+        if i < len(self.chunks) and self.chunks[i][0] == logical:
+            self.chunks[i] = entry
+        else:
+            self.chunks.insert(i, entry)
+        return pos
+
+
+# start the program
+if __name__ == '__main__':
+    main()
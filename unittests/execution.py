@@ -0,0 +1,561 @@
+#!/usr/bin/python3
+################################################################################
+# @file execution.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief execution of external tools with timeouts and resource limits
+# @details This module runs the external tools of the unit tests and of the
+# image creation (TSK tools, mkfs, mount, losetup, ...) under a watchdog: every
+# tool has a wall-clock limit and optionally limits of its address space
+# (RLIMIT_AS) and CPU time (RLIMIT_CPU). A tool exceeding its wall-clock
+# limit is killed together with its children (it runs in a session of its
+# own). The limits are applied by prlimit, which executes the tool, so no
+# Python code runs in the forked child (the executor is used from threads).
+# The output is read as a stream while the tool runs, so the partial
+# output of a killed tool is kept in the raised exception. Timeouts and limit
+# hits are raised as ExecutionTimeout and ExecutionLimitError with the
+# elapsed time and the peak memory, so they are reported as outcomes of their
+# own (ExecutionResult shows them as TIMEOUT and LIMIT in the test results of
+# all test scripts), and registered clean-up functions (e.g. releasing mounts and loop
+# devices) are called before. The limits can be scaled with the environment
+# variable TSK_TIMEOUT_SCALE (e.g. on slow machines).
+################################################################################
+
+import os
+import sys
+import time
+import signal
+import shutil
+import resource
+import threading
+import contextlib
+import subprocess
+import unittest
+
+
+##
+# exception used if a tool was aborted by the Executor
+#
+class ExecutionError(Exception):
+    # outcome reported for this exception
+    outcome = 'aborted'
+
+    ##
+    # constructor
+    #
+    # @param cmd command of the tool
+    # @param reason why the tool was aborted
+    # @param elapsed wall-clock time of the tool in seconds
+    # @param maxrss peak resident set size of the tool in KiB
+    # @param output output of the tool read before it was aborted (bytes)
+    # @return a new instance of this class
+    #
+    def __init__(self, cmd, reason, elapsed, maxrss, output=b''):
+        super().__init__("{} {} after {:.1f} s (peak memory {:.1f} MiB)".format(
+            os.path.basename(cmd[0]), reason, elapsed, maxrss / 1024))
+        self.cmd = cmd
+        self.reason = reason
+        self.elapsed = elapsed
+        self.maxrss = maxrss
+        self.output = output
+
+
+##
+# exception used if a tool exceeded its wall-clock limit (a hang)
+#
+class ExecutionTimeout(ExecutionError):
+    outcome = 'timeout'
+
+
+##
+# exception used if a tool exceeded its memory or CPU time limit
+#
+class ExecutionLimitError(ExecutionError):
+    outcome = 'limit'
+
+
+##
+# test result showing aborted tools as outcomes of their own
+# @details Errors raised because of a timeout or a limit hit still count as
+# errors, but they are shown as TIMEOUT or LIMIT instead of ERROR and listed
+# separately after the other errors.
+#
+class ExecutionResult(unittest.TextTestResult):
+    # status of the outcomes in verbose mode and as dot
+    STATUS = {'timeout': ('TIMEOUT', 'T'), 'limit': ('LIMIT', 'L'), 'aborted': ('ABORTED', 'A')}
+
+    ##
+    # constructor
+    #
+    # @return a new instance of this class
+    #
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # list of (test, outcome) of the errors of aborted tools
+        self.aborted = list()
+
+    ##
+    # record a test case with an error, aborted tools with their outcome
+    #
+    def addError(self, test, err):
+        if not isinstance(err[1], ExecutionError):
+            super().addError(test, err)
+            return
+        unittest.TestResult.addError(self, test, err)
+        self.aborted.append((test, err[1].outcome))
+        status, dot = self.STATUS.get(err[1].outcome, self.STATUS['aborted'])
+        if self.showAll:
+            self.stream.writeln(status)
+        elif self.dots:
+            self.stream.write(dot)
+        self.stream.flush()
+
+    ##
+    # print the errors, those of aborted tools in lists of their own
+    #
+    def printErrors(self):
+        outcomes = dict((id(test), outcome) for test, outcome in self.aborted)
+        errors = self.errors
+        try:
+            self.errors = [e for e in errors if id(e[0]) not in outcomes]
+            super().printErrors()
+        finally:
+            self.errors = errors
+        for outcome, (status, _) in self.STATUS.items():
+            self.printErrorList(status, [e for e in errors if outcomes.get(id(e[0])) == outcome])
+        if self.aborted:
+            counts = [outcome for _, outcome in self.aborted]
+            self.stream.writeln("of the errors: {} timeouts, {} limit hits".format(
+                counts.count('timeout'), counts.count('limit')))
+
+
+##
+# class used to run external tools under a watchdog
+#
+class Executor:
+    # limits of the tools: wall-clock time and CPU time in seconds and
+    # address space in bytes (None = unlimited), by name of the tool
+    LIMITS = {
+        'fls': (1800, 1800, 16 * 1024 ** 3),
+        'ils': (1800, 1800, 16 * 1024 ** 3),
+        'istat': (300, 300, 4 * 1024 ** 3),
+        'icat': (3600, 3600, 4 * 1024 ** 3),
+        'ifind': (300, 300, 4 * 1024 ** 3),
+        'tsk_recover': (7200, 7200, 16 * 1024 ** 3),
+        'mkfs.btrfs': (600, None, None),
+        'btrfs-convert': (3600, None, None),
+        'btrfs': (600, None, None),
+        'mount': (300, None, None),
+        'umount': (300, None, None),
+        'losetup': (60, None, None),
+    }
+    # limits of all other tools
+    DEFAULT_LIMITS = (3600, None, None)
+    # profiling wrappers of the tools (see profiling.Profiler) and their
+    # options taking a value, the wrapped command follows '--' or the options
+    WRAPPERS = {'perf': ('-o',), 'time': ('-o', '-f', '--output', '--format')}
+    # tool setting the limits of the tools, it executes the tool itself
+    PRLIMIT = 'prlimit'
+    # time between SIGTERM and SIGKILL when killing a tool
+    KILL_GRACE = 5
+    # number of bytes of the error output kept to detect memory limit hits
+    STDERR_TAIL = 64 * 1024
+    # error messages of tools which failed to allocate memory
+    MEMORY_MESSAGES = (b'Cannot allocate memory', b'bad_alloc', b'out of memory',
+                       b'Out of memory')
+    # size of the chunks read from the output
+    CHUNK = 1024 ** 2
+
+    ##
+    # constructor
+    #
+    # @param limits dict of tool name to limits overriding LIMITS
+    # @param scale factor of all time limits (None = $TSK_TIMEOUT_SCALE or 1)
+    # @return a new instance of this class
+    #
+    def __init__(self, limits=None, scale=None):
+        self.limits = dict(self.LIMITS)
+        if limits is not None:
+            self.limits.update(limits)
+        if scale is None:
+            scale = float(os.getenv('TSK_TIMEOUT_SCALE', '1'))
+        self.scale = scale
+        # without prlimit the limits are set on the started tool
+        self.prlimit = shutil.which(self.PRLIMIT)
+        # clean-up functions called after a timeout or limit hit
+        self.cleanups = list()
+        self.__lock = threading.Lock()
+
+    ##
+    # get the limits of a command
+    # @details Wrapped commands (by a profiler) get the limits of the wrapped
+    # tool.
+    #
+    # @param cmd command as list
+    # @return tuple of wall-clock limit, CPU limit and memory limit
+    #
+    def limits_of(self, cmd):
+        timeout, cpu, memory = self.limits.get(self.tool_of(cmd), self.DEFAULT_LIMITS)
+        return (timeout * self.scale if timeout is not None else None,
+                cpu * self.scale if cpu is not None else None, memory)
+
+    ##
+    # get the name of the tool of a command
+    # @details Only the known profiling wrappers are skipped, the arguments
+    # (e.g. paths named like a tool) are never taken as the tool.
+    #
+    # @param cmd command as list
+    # @return the name of the tool, None for an empty command
+    #
+    @classmethod
+    def tool_of(cls, cmd):
+        i = 0
+        while i < len(cmd) and os.path.basename(cmd[i]) in cls.WRAPPERS:
+            values = cls.WRAPPERS[os.path.basename(cmd[i])]
+            if '--' in cmd[i + 1:]:
+                i = cmd.index('--', i + 1) + 1
+                continue
+            i += 1
+            while i < len(cmd) and cmd[i].startswith('-'):
+                i += 2 if cmd[i] in values else 1
+        return os.path.basename(cmd[i]) if i < len(cmd) else None
+
+    ##
+    # register a clean-up function while a block runs
+    # @details The function is called if a tool of this executor is aborted
+    # by a timeout or a limit hit while the block runs, before the exception
+    # is raised.
+    #
+    # @param func function without parameters
+    # @return context manager
+    #
+    @contextlib.contextmanager
+    def cleanup(self, func):
+        with self.__lock:
+            self.cleanups.append(func)
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.cleanups.remove(func)
+
+    ##
+    # run a tool and return its exit code (like subprocess.call)
+    #
+    # @param cmd command as list
+    # @param stdout target of the output (None = inherited)
+    # @param stderr target of the error output (None = inherited)
+    # @param env environment of the tool (None = inherited)
+    # @throw ExecutionTimeout if the tool exceeded its wall-clock limit
+    # @throw ExecutionLimitError if the tool exceeded its memory or CPU limit
+    # @return the exit code
+    #
+    def call(self, cmd, stdout=None, stderr=None, env=None):
+        returncode, _ = self.__run(cmd, stdout, stderr, env, False)
+        return returncode
+
+    ##
+    # run a tool and return its output (like subprocess.check_output)
+    #
+    # @param cmd command as list
+    # @param stderr target of the error output (None = inherited)
+    # @param env environment of the tool (None = inherited)
+    # @param universal_newlines flag to return the output as string
+    # @throw CalledProcessError if the tool failed
+    # @throw ExecutionTimeout if the tool exceeded its wall-clock limit
+    # @throw ExecutionLimitError if the tool exceeded its memory or CPU limit
+    # @return the output
+    #
+    def check_output(self, cmd, stderr=None, env=None, universal_newlines=False):
+        returncode, output = self.__run(cmd, subprocess.PIPE, stderr, env, True)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output)
+        if universal_newlines:
+            return output.decode('utf-8')
+        return output
+
+    ##
+    # run a tool and yield its output in chunks
+    # @details Closing the generator early kills the tool.
+    #
+    # @param cmd command as list
+    # @param stderr target of the error output (None = inherited)
+    # @throw CalledProcessError if the tool failed (after the last chunk)
+    # @throw ExecutionTimeout if the tool exceeded its wall-clock limit
+    # @throw ExecutionLimitError if the tool exceeded its memory or CPU limit
+    # @return generator of the output chunks (bytes)
+    #
+    def stream(self, cmd, stderr=None):
+        p, watchdog = self.__start(cmd, subprocess.PIPE, stderr, None)
+        finished = False
+        try:
+            for chunk in iter(lambda: p.stdout.read(self.CHUNK), b''):
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                watchdog.kill()
+            returncode = self.__finish(p, watchdog)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+
+    ##
+    # run a tool until it terminated
+    #
+    # @param cmd command as list
+    # @param stdout target of the output
+    # @param stderr target of the error output
+    # @param env environment of the tool
+    # @param capture flag to read the output
+    # @throw ExecutionTimeout if the tool exceeded its wall-clock limit
+    # @throw ExecutionLimitError if the tool exceeded its memory or CPU limit
+    # @return tuple of the exit code and the output read
+    #
+    def __run(self, cmd, stdout, stderr, env, capture):
+        p, watchdog = self.__start(cmd, stdout, stderr, env)
+        if capture:
+            # read the output in a thread, so it is kept if the tool is killed
+            watchdog.read(p.stdout)
+        return self.__finish(p, watchdog), watchdog.output()
+
+    ##
+    # prefix a command with prlimit
+    #
+    # @param cmd command as list
+    # @param cpu CPU limit in seconds, None for none
+    # @param memory memory limit in bytes, None for none
+    # @return the command setting the limits
+    #
+    def __limited(self, cmd, cpu, memory):
+        opt = list()
+        if cpu is not None:
+            opt.append('--cpu={}:{}'.format(int(cpu), int(cpu) + 1))
+        if memory is not None:
+            opt.append('--as={}'.format(memory))
+        if not opt or self.prlimit is None:
+            return cmd
+        return [self.prlimit] + opt + ['--'] + list(cmd)
+
+    ##
+    # start a tool under a watchdog
+    # @details If prlimit is not installed, the limits are set with
+    # resource.prlimit right after the start (the tool may run shortly
+    # without them).
+    #
+    # @param cmd command as list
+    # @param stdout target of the output
+    # @param stderr target of the error output
+    # @param env environment of the tool
+    # @return tuple of the Popen object and its watchdog
+    #
+    def __start(self, cmd, stdout, stderr, env):
+        timeout, cpu, memory = self.limits_of(cmd)
+        # the error output is read to detect failed allocations
+        tail = stderr is None or stderr == subprocess.DEVNULL
+
+        p = subprocess.Popen(self.__limited(cmd, cpu, memory), stdout=stdout,
+                             stderr=subprocess.PIPE if tail else stderr, env=env,
+                             start_new_session=True)
+        if self.prlimit is None:
+            try:
+                if cpu is not None:
+                    resource.prlimit(p.pid, resource.RLIMIT_CPU, (int(cpu), int(cpu) + 1))
+                if memory is not None:
+                    resource.prlimit(p.pid, resource.RLIMIT_AS, (memory, memory))
+            except ProcessLookupError:
+                # already terminated
+                pass
+        watchdog = _Watchdog(p, cmd, timeout, cpu, memory, self.KILL_GRACE)
+        if tail:
+            forward = None
+            if stderr is None:
+                forward = getattr(sys.stderr, 'buffer', None)
+            watchdog.read(p.stderr, lambda chunk: watchdog.keep_stderr(
+                chunk, self.STDERR_TAIL, forward))
+        return p, watchdog
+
+    ##
+    # wait for a tool and check for timeouts and limit hits
+    #
+    # @param p Popen object of the tool
+    # @param watchdog watchdog of the tool
+    # @throw ExecutionTimeout if the tool exceeded its wall-clock limit
+    # @throw ExecutionLimitError if the tool exceeded its memory or CPU limit
+    # @return the exit code
+    #
+    def __finish(self, p, watchdog):
+        _, status, usage = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = watchdog.stop()
+        maxrss = usage.ru_maxrss
+        cputime = usage.ru_utime + usage.ru_stime
+
+        error = None
+        if watchdog.timed_out:
+            error = ExecutionTimeout(watchdog.cmd, "timed out", elapsed, maxrss,
+                                     watchdog.output())
+        elif watchdog.cpu is not None and (p.returncode == -signal.SIGXCPU or
+                                           (p.returncode < 0 and cputime >= watchdog.cpu)):
+            error = ExecutionLimitError(watchdog.cmd, "exceeded its CPU limit", elapsed, maxrss,
+                                        watchdog.output())
+        elif watchdog.memory is not None and p.returncode != 0 and \
+                any(m in watchdog.stderr for m in self.MEMORY_MESSAGES):
+            error = ExecutionLimitError(watchdog.cmd, "exceeded its memory limit", elapsed, maxrss,
+                                        watchdog.output())
+        if error is not None:
+            with self.__lock:
+                cleanups = list(self.cleanups)
+            for func in reversed(cleanups):
+                try:
+                    func()
+                except Exception as e:
+                    print("clean-up after", error, "failed:", e, file=sys.stderr)
+            raise error
+        return p.returncode
+
+
+##
+# watchdog of a running tool (used by the Executor)
+#
+class _Watchdog:
+    # interval of the checks whether a killed tool terminated in seconds
+    POLL_INTERVAL = 0.05
+
+    ##
+    # constructor, starts the timer of the wall-clock limit
+    #
+    # @param p Popen object of the tool
+    # @param cmd command of the tool (without the limits)
+    # @param timeout wall-clock limit in seconds, None for none
+    # @param cpu CPU limit in seconds, None for none
+    # @param memory memory limit in bytes, None for none
+    # @param grace time between SIGTERM and SIGKILL in seconds
+    # @return a new instance of this class
+    #
+    def __init__(self, p, cmd, timeout, cpu, memory, grace):
+        self.p = p
+        self.cmd = cmd
+        self.cpu = cpu
+        self.memory = memory
+        self.grace = grace
+        self.timed_out = False
+        self.stderr = b''
+        self.started = time.perf_counter()
+        self.__chunks = list()
+        self.__readers = list()
+        self.__done = threading.Event()
+        self.__timer = None
+        if timeout is not None:
+            self.__timer = threading.Timer(timeout, self.__expire)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    ##
+    # read a stream of the tool in a thread
+    #
+    # @param stream pipe of the tool
+    # @param consumer function called with every chunk, None to keep the
+    #        chunks as output
+    # @return None
+    #
+    def read(self, stream, consumer=None):
+        def reader():
+            for chunk in iter(lambda: stream.read1(Executor.CHUNK), b''):
+                if consumer is None:
+                    self.__chunks.append(chunk)
+                else:
+                    consumer(chunk)
+            stream.close()
+        t = threading.Thread(target=reader, daemon=True)
+        t.start()
+        self.__readers.append(t)
+
+    ##
+    # keep the tail of the error output and forward it
+    #
+    # @param chunk chunk of the error output
+    # @param size number of bytes kept
+    # @param forward binary stream the chunk is written to, None for none
+    # @return None
+    #
+    def keep_stderr(self, chunk, size, forward):
+        self.stderr = (self.stderr + chunk)[-size:]
+        if forward is not None:
+            forward.write(chunk)
+            forward.flush()
+
+    ##
+    # get the output read so far
+    #
+    # @return output as bytes
+    #
+    def output(self):
+        return b''.join(self.__chunks)
+
+    ##
+    # kill the tool and its children
+    #
+    # @return None
+    #
+    def kill(self):
+        self.__signal(signal.SIGTERM)
+        deadline = time.perf_counter() + self.grace
+        while not self.__terminated():
+            if time.perf_counter() >= deadline:
+                self.__signal(signal.SIGKILL)
+                return
+            time.sleep(self.POLL_INTERVAL)
+
+    ##
+    # stop the watchdog after the tool terminated
+    #
+    # @return elapsed wall-clock time of the tool in seconds
+    #
+    def stop(self):
+        elapsed = time.perf_counter() - self.started
+        for t in self.__readers:
+            t.join()
+        self.__done.set()
+        if self.__timer is not None:
+            self.__timer.cancel()
+        return elapsed
+
+    ##
+    # kill the tool after its wall-clock limit expired
+    #
+    # @return None
+    #
+    def __expire(self):
+        self.timed_out = True
+        self.kill()
+
+    ##
+    # check if the tool terminated
+    # @details The tool is not reaped (WNOWAIT), the Executor collects its
+    # exit status and resource usage with wait4.
+    #
+    # @return True if the tool terminated
+    #
+    def __terminated(self):
+        if self.__done.is_set():
+            return True
+        try:
+            return os.waitid(os.P_PID, self.p.pid,
+                             os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+        except ChildProcessError:
+            # already reaped
+            return True
+
+    ##
+    # send a signal to the session of the tool
+    #
+    # @param sig the signal
+    # @return None
+    #
+    def __signal(self, sig):
+        try:
+            os.killpg(self.p.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+################################################################################
+# @file history.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief performance history of the TSK tools
+# @details This module stores the timings of the TSK tools measured by the unit
+# tests (fls, ils, the istat batch and tsk_recover) per image type in a local
+# SQLite database. Every timing is tagged with a hash of the TSK binaries, the
+# digest of the image content and information about the host. The content
+# digest is taken from the file sums of the md5 file, so it stays the same
+# when an image is rebuilt with the same parameters (the image sums change
+# with every build, as timestamps and UUIDs do). The gate compares a timing
+# with the rolling baseline of the same tool on the same image type, content
+# and host: it fails if the timing is slower than the baseline median by more
+# than a threshold factor and lies outside the noise of the baseline (median
+# absolute deviation). Without enough runs in the baseline, the result is
+# reported as "no baseline". Used stand-alone, the script reports the history or
+# checks the latest timings against the gate. The build time and the total
+# test time of every image type are recorded as well, they serve as measured
+# cost for the scheduler.
+################################################################################
+
+import argparse
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import hashlib
+import platform
+import statistics
+import subprocess
+
+
+##
+# main program to support stand-alone script usage
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the performance history of the TSK tools or check the latest "
+                    "timings against the regression gate.")
+    parser.add_argument('command', choices=['report', 'gate'],
+                        help="report: print the timings, gate: check the latest timings")
+    parser.add_argument('-d', default=History.DATABASE, metavar='database',
+                        help="history database (default = " + History.DATABASE + ")")
+    parser.add_argument('-t', metavar='type', help="only this image type")
+    parser.add_argument('--threshold', type=float, default=History.THRESHOLD, metavar='factor',
+                        help="allowed slowdown factor (default = " + str(History.THRESHOLD) + ")")
+    parser.add_argument('--window', type=int, default=History.WINDOW, metavar='runs',
+                        help="number of runs in the baseline (default = " +
+                             str(History.WINDOW) + ")")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.d):
+        print("ERROR: history database", args.d, "does not exist", file=sys.stderr)
+        sys.exit(2)
+    history = History(args.d, args.threshold, args.window)
+
+    failed = False
+    for row in history.latest(args.t):
+        if args.command == 'report':
+            print("{:<20} {:<12} {:>10.3f} s  {}  {}".format(
+                row['imagetype'], row['tool'], row['elapsed'],
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(row['time'])), row['host']))
+        elif row['tool'] in History.GATED:
+            result = history.check(row['imagetype'], row['tool'], row['elapsed'],
+                                   row['image_digest'], before=row['id'])
+            print(result)
+            failed = failed or result.regressed
+    history.close()
+    sys.exit(1 if failed else 0)
+
+
+##
+# result of a regression check
+#
+class GateResult:
+    ##
+    # constructor
+    #
+    # @param imagetype type of the image
+    # @param tool name of the tool
+    # @param elapsed checked time in seconds
+    # @param baseline list of baseline times in seconds
+    # @param threshold allowed slowdown factor
+    # @return a new instance of this class
+    #
+    def __init__(self, imagetype, tool, elapsed, baseline, threshold):
+        self.imagetype = imagetype
+        self.tool = tool
+        self.elapsed = elapsed
+        self.baseline = baseline
+        self.threshold = threshold
+        self.median = statistics.median(baseline) if baseline else None
+        self.noise = None
+        self.regressed = False
+        if len(baseline) >= History.MIN_RUNS:
+            # median absolute deviation, scaled to a standard deviation
+            self.noise = 1.4826 * statistics.median([abs(t - self.median) for t in baseline])
+            slower = elapsed > self.median * threshold
+            beyond_noise = elapsed - self.median > History.NOISE_SIGMAS * self.noise
+            self.regressed = slower and beyond_noise
+
+    ##
+    # ratio of the checked time to the baseline median
+    #
+    @property
+    def ratio(self):
+        if not self.median:
+            return None
+        return self.elapsed / self.median
+
+    ##
+    # one-line description of the result
+    #
+    # @return the description
+    #
+    def __str__(self):
+        if self.noise is None:
+            state = "no baseline ({} runs)".format(len(self.baseline))
+        else:
+            state = "{:.2f}x of median {:.3f} s (noise {:.3f} s)".format(
+                self.ratio, self.median, self.noise)
+            state = ("REGRESSION " if self.regressed else "ok ") + state
+        return "{:<20} {:<12} {:>10.3f} s  {}".format(self.imagetype, self.tool,
+                                                      self.elapsed, state)
+
+
+##
+# class used to record and check the timings of the TSK tools
+#
+class History:
+    # default database file
+    DATABASE = "perf_history.sqlite"
+    # default allowed slowdown factor
+    THRESHOLD = 1.25
+    # default number of runs in the rolling baseline
+    WINDOW = 10
+    # minimum number of runs in the baseline for a check
+    MIN_RUNS = 3
+    # a regression has to exceed the baseline noise by this many deviations
+    NOISE_SIGMAS = 3.0
+    # tools hashed to identify the TSK build
+    TSK_TOOLS = ('fls', 'ils', 'istat', 'icat', 'tsk_recover')
+    # timings checked by the gate (build and total times are only recorded)
+    GATED = ('fls', 'ils', 'istat', 'tsk_recover')
+
+    __tsk_hash = None
+
+    ##
+    # constructor
+    #
+    # @param fname name of the database file
+    # @param threshold allowed slowdown factor
+    # @param window number of runs in the rolling baseline
+    # @return a new instance of this class
+    #
+    def __init__(self, fname=DATABASE, threshold=THRESHOLD, window=WINDOW):
+        self.threshold = threshold
+        self.window = window
+        self.db = sqlite3.connect(fname)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("CREATE TABLE IF NOT EXISTS timings ("
+                        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                        "time REAL NOT NULL, "
+                        "imagetype TEXT NOT NULL, "
+                        "tool TEXT NOT NULL, "
+                        "elapsed REAL NOT NULL, "
+                        "tsk_hash TEXT NOT NULL, "
+                        "image_digest TEXT NOT NULL, "
+                        "host TEXT NOT NULL, "
+                        "kernel TEXT NOT NULL, "
+                        "cpu TEXT NOT NULL)")
+        self.db.execute("DROP INDEX IF EXISTS timings_baseline")
+        self.db.execute("CREATE INDEX IF NOT EXISTS timings_gate "
+                        "ON timings (imagetype, image_digest, tool, host, id)")
+        self.db.commit()
+
+    ##
+    # close the database
+    #
+    # @return None
+    #
+    def close(self):
+        self.db.close()
+
+    ##
+    # append timings of an image type
+    #
+    # @param imagetype type of the image
+    # @param timings dict of tool name to time in seconds
+    # @param image_digest content digest of the image (see image_digest)
+    # @return None
+    #
+    def record(self, imagetype, timings, image_digest):
+        now = time.time()
+        tsk_hash = self.tsk_hash()
+        for tool in sorted(timings):
+            self.db.execute("INSERT INTO timings (time, imagetype, tool, elapsed, tsk_hash, "
+                            "image_digest, host, kernel, cpu) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (now, imagetype, tool, timings[tool], tsk_hash, image_digest,
+                             platform.node(), platform.release(), self.cpu()))
+        self.db.commit()
+
+    ##
+    # check a timing against the rolling baseline
+    # @details The baseline consists of the last runs of the same tool on the
+    # same image type, image content and host.
+    #
+    # @param imagetype type of the image
+    # @param tool name of the tool
+    # @param elapsed time in seconds
+    # @param image_digest content digest of the image (see image_digest)
+    # @param before only use runs recorded before this id (None = all runs)
+    # @return GateResult of the check
+    #
+    def check(self, imagetype, tool, elapsed, image_digest, before=None):
+        query = ("SELECT elapsed FROM timings WHERE imagetype = ? AND image_digest = ? "
+                 "AND tool = ? AND host = ?")
+        params = [imagetype, image_digest, tool, platform.node()]
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(self.window)
+        baseline = [row['elapsed'] for row in self.db.execute(query, params)]
+        return GateResult(imagetype, tool, elapsed, baseline, self.threshold)
+
+    ##
+    # get the typical time of a tool on an image type
+    # @details The median of the last runs on this host, regardless of the
+    # image digest, is used as measured cost by the scheduler.
+    #
+    # @param imagetype type of the image
+    # @param tool name of the tool
+    # @return median time in seconds or None without runs
+    #
+    def median(self, imagetype, tool):
+        rows = self.db.execute("SELECT elapsed FROM timings WHERE imagetype = ? AND tool = ? "
+                               "AND host = ? ORDER BY id DESC LIMIT ?",
+                               (imagetype, tool, platform.node(), self.window))
+        elapsed = [row['elapsed'] for row in rows]
+        return statistics.median(elapsed) if elapsed else None
+
+    ##
+    # get the latest timing of every image type and tool
+    #
+    # @param imagetype only this image type (None = all)
+    # @return list of rows
+    #
+    def latest(self, imagetype=None):
+        query = ("SELECT * FROM timings WHERE id IN "
+                 "(SELECT MAX(id) FROM timings GROUP BY imagetype, tool)")
+        params = list()
+        if imagetype is not None:
+            query += " AND imagetype = ?"
+            params.append(imagetype)
+        return self.db.execute(query + " ORDER BY imagetype, tool", params).fetchall()
+
+    ##
+    # hash the TSK tools and the TSK library they are linked to
+    #
+    # @return sha256 in hex digits
+    #
+    @classmethod
+    def tsk_hash(cls):
+        if cls.__tsk_hash is None:
+            files = set()
+            for tool in cls.TSK_TOOLS:
+                path = shutil.which(tool)
+                if path is not None:
+                    files.add(os.path.realpath(path))
+            # shared TSK library, if the tools are linked dynamically
+            if files:
+                try:
+                    out = subprocess.check_output(['ldd', sorted(files)[0]],
+                                                  universal_newlines=True,
+                                                  stderr=subprocess.DEVNULL)
+                    for line in out.splitlines():
+                        if 'libtsk' in line and '=>' in line:
+                            files.add(os.path.realpath(line.split('=>')[1].split()[0]))
+                except (subprocess.CalledProcessError, OSError, IndexError):
+                    pass
+
+            hashsum = hashlib.sha256()
+            for fname in sorted(files):
+                with open(fname, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 ** 2), b''):
+                        hashsum.update(chunk)
+            cls.__tsk_hash = hashsum.hexdigest()
+        return cls.__tsk_hash
+
+    ##
+    # get the processor model of the host
+    #
+    # @return the model name
+    #
+    @staticmethod
+    def cpu():
+        try:
+            with open('/proc/cpuinfo') as f:
+                for line in f:
+                    if line.startswith('model name'):
+                        return line.partition(':')[2].strip() + " x" + str(os.cpu_count())
+        except IOError:
+            pass
+        return platform.machine() + " x" + str(os.cpu_count())
+
+    ##
+    # content digest of an image from its md5 file
+    # @details Only the file sums are hashed, the image sums differ between
+    # two builds of the same image.
+    #
+    # @param fname md5 file of the image
+    # @return md5 of the file sums in the md5 file
+    #
+    @staticmethod
+    def image_digest(fname):
+        hashsum = hashlib.md5()
+        with open(fname) as f:
+            for line in f:
+                if line.startswith('-'):
+                    break
+                hashsum.update(line.encode('utf-8'))
+        return hashsum.hexdigest()
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/python3
+################################################################################
+# @file imageserver.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief image server keeping test images mounted between test runs
+# @details This script runs a local daemon, reachable over a Unix socket, that
+# owns the test images, their loop devices and mount points. An image is
+# created (if needed) and mounted on its first request and stays mounted, the
+# output of stat for all its files (the ground truth of the unit tests) is read
+# once and kept in memory. The unit tests use the server if the environment
+# variable TSK_IMAGE_SERVER is set to its socket: they get the image files and
+# the cached stat output and only run the TSK tools themselves. An image is
+# mounted again if its md5 file changed. The protocol is one JSON request and
+# one JSON response per connection, each terminated by a newline.
+################################################################################
+
+import argparse
+import os
+import sys
+import json
+import signal
+import socket
+import hashlib
+import threading
+import subprocess
+import socketserver
+import testimage
+
+
+##
+# main program to support stand-alone script usage
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the image server, or send a request to a running server.")
+    parser.add_argument('command', choices=['serve', 'status', 'release', 'stop'],
+                        help="serve: run the server, status: list the mounted images, "
+                             "release: unmount an image, stop: stop the server")
+    parser.add_argument('type', nargs='?', help="image type (or path of a custom image) "
+                                                "to release")
+    parser.add_argument('-s', default=ImageServer.SOCKET, metavar='socket',
+                        help="socket of the server (default = " + ImageServer.SOCKET + ")")
+    parser.add_argument('-i', default=ImageServer.IMAGE_DIR, metavar='dir',
+                        help="directory of the images (default = " + ImageServer.IMAGE_DIR + ")")
+    parser.add_argument('-c', action='store_true', help="the released image is a custom image")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'serve':
+            if os.getuid() != 0:
+                print("ERROR: the image server needs root", file=sys.stderr)
+                sys.exit(2)
+            # unmount the images also if terminated
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            ImageServer(args.s, args.i).serve()
+        elif args.command == 'status':
+            for image in ImageClient(args.s).status():
+                print("{:<20} {:>6} requests  {}".format(image['type'], image['requests'],
+                                                         image['mpath']))
+        elif args.command == 'release':
+            if args.type is None:
+                parser.error("the image type is required")
+            ImageClient(args.s).release(args.type, args.c)
+        else:
+            ImageClient(args.s).stop()
+    except testimage.ImageCreationError as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+
+
+##
+# class used to keep images mounted and serve them to the unit tests
+#
+class ImageServer:
+    # configurable constants
+    # default socket of the server
+    SOCKET = "/run/tsk_imageserver.sock"
+    # default directory of the images
+    IMAGE_DIR = "images"
+    # mount paths of the images (the image name is appended)
+    MOUNT_PATH = "/mnt/tsk_served"
+
+    ##
+    # constructor
+    #
+    # @param path socket of the server
+    # @param ipath directory of the images
+    # @param payload payload of created images (see ImageFactory.create)
+    # @return a new instance of this class
+    #
+    def __init__(self, path=SOCKET, ipath=IMAGE_DIR, payload=None):
+        self.path = path
+        self.ipath = ipath
+        self.payload = payload
+        self.fac = testimage.ImageFactory(True)
+        # mounted images by image type (or absolute path of custom images)
+        self.images = dict()
+        # mounting and unmounting is done one request at a time
+        self.lock = threading.Lock()
+
+    ##
+    # get a mounted image, mount (and create) it if needed
+    #
+    # @param imagetype type of the image, or absolute path of a custom image
+    # @param custom flag to indicate a custom image
+    # @throw ImageCreationError if something went wrong
+    # @return dict with the image files, the mount path and the stat output
+    #
+    def acquire(self, imagetype, custom=False):
+        with self.lock:
+            image = self.images.get(imagetype)
+            # the image was created again since it was mounted
+            if image is not None and image['mtime'] != os.path.getmtime(image['files'][-1]):
+                self.__release(imagetype)
+                image = None
+            if image is None:
+                image = self.__mount(imagetype, custom)
+                self.images[imagetype] = image
+            image['requests'] += 1
+            return {'files': image['files'], 'mpath': image['mpath'], 'stat': image['stat']}
+
+    ##
+    # unmount an image
+    #
+    # @param imagetype type of the image, or absolute path of a custom image
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def release(self, imagetype):
+        with self.lock:
+            if imagetype not in self.images:
+                raise testimage.ImageCreationError("image " + imagetype + " is not mounted")
+            self.__release(imagetype)
+
+    ##
+    # list the mounted images
+    #
+    # @return list of dicts with type, mount path and number of requests
+    #
+    def status(self):
+        with self.lock:
+            return [{'type': t, 'mpath': i['mpath'], 'requests': i['requests']}
+                    for t, i in sorted(self.images.items())]
+
+    ##
+    # unmount all images
+    #
+    # @return None
+    #
+    def close(self):
+        with self.lock:
+            for imagetype in list(self.images):
+                try:
+                    self.__release(imagetype)
+                except testimage.ImageCreationError as e:
+                    print("could not release", imagetype + ":", e, file=sys.stderr)
+
+    ##
+    # answer a request
+    #
+    # @param request dict with the operation 'op' and its arguments
+    # @return dict with the result or the error
+    #
+    def handle(self, request):
+        try:
+            op = request.get('op')
+            if op == 'acquire':
+                return self.acquire(request['type'], request.get('custom', False))
+            elif op == 'release':
+                self.release(request['type'])
+                return {}
+            elif op == 'status':
+                return {'images': self.status()}
+            else:
+                return {'error': "unknown operation " + str(op)}
+        except (testimage.ImageCreationError, subprocess.CalledProcessError, ValueError, KeyError,
+                OSError) as e:
+            return {'error': str(e)}
+
+    ##
+    # run the server until it is stopped
+    #
+    # @throw ImageCreationError if the socket is in use
+    # @return None
+    #
+    def serve(self):
+        if os.path.exists(self.path):
+            try:
+                ImageClient(self.path).status()
+            except testimage.ImageCreationError:
+                # socket of a server that was not stopped
+                os.remove(self.path)
+            else:
+                raise testimage.ImageCreationError("an image server is already running")
+
+        server = ImageServer.SocketServer(self.path, ImageServer.RequestHandler)
+        server.image_server = self
+        os.chmod(self.path, 0o600)
+        print("image server listening on", self.path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(self.path)
+            self.close()
+
+    ##
+    # mount an image and read its stat output
+    #
+    # @param imagetype type of the image, or absolute path of a custom image
+    # @param custom flag to indicate a custom image
+    # @throw ImageCreationError if something went wrong
+    # @return dict describing the mounted image
+    #
+    def __mount(self, imagetype, custom):
+        if custom:
+            name = "custom_" + hashlib.md5(imagetype.encode('utf-8')).hexdigest()[0:8]
+        else:
+            name = imagetype
+        mpath = self.MOUNT_PATH + "_" + name
+
+        loopdev = None
+        if custom:
+            files = [imagetype, imagetype + ".md5"]
+            self.fac.mount(imagetype, None, mpath)
+        else:
+            os.makedirs(self.ipath, exist_ok=True)
+            # the image is built on its own mount point
+            self.fac.MOUNT_PATH = mpath
+            files = [os.path.abspath(os.path.join(self.ipath, f)) for f in
+                     self.fac.create(imagetype, imagedir=self.ipath, payload=self.payload)]
+            if self.fac.devices(imagetype) > 1:
+                loopdev = self.fac.mount_raid(imagetype, self.ipath, mpath)
+            else:
+                self.fac.mount(imagetype, self.ipath, mpath)
+
+        try:
+            stat = self.fac.stat_output(mpath).decode('utf-8')
+            # write back the atime updates of the scan, so TSK sees the same
+            os.sync()
+        except Exception:
+            self.fac.umount(mpath)
+            raise
+        return {'files': files, 'mpath': mpath, 'loopdev': loopdev, 'stat': stat,
+                'mtime': os.path.getmtime(files[-1]), 'requests': 0}
+
+    ##
+    # unmount an image and remove its mount point
+    #
+    # @param imagetype type of the image, or absolute path of a custom image
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def __release(self, imagetype):
+        image = self.images.pop(imagetype)
+        if image['loopdev'] is not None:
+            self.fac.umount_raid(image['mpath'], image['loopdev'])
+        else:
+            self.fac.umount(image['mpath'])
+        try:
+            os.rmdir(image['mpath'])
+        except OSError:
+            pass
+
+    ##
+    # socket server handling every connection in its own thread
+    #
+    class SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    ##
+    # handler of one connection, one request and one response
+    #
+    class RequestHandler(socketserver.StreamRequestHandler):
+        ##
+        # read the request and write the response
+        #
+        # @return None
+        #
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline().decode('utf-8'))
+            except ValueError as e:
+                response = {'error': "invalid request: " + str(e)}
+            else:
+                if request.get('op') == 'stop':
+                    response = {}
+                    # shutdown waits for the serving loop, which runs in another thread
+                    threading.Thread(target=self.server.shutdown).start()
+                else:
+                    response = self.server.image_server.handle(request)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+##
+# class used to send requests to the image server
+#
+class ImageClient:
+    ##
+    # constructor
+    #
+    # @param path socket of the server
+    # @return a new instance of this class
+    #
+    def __init__(self, path=ImageServer.SOCKET):
+        self.path = path
+
+    ##
+    # send a request to the server
+    #
+    # @param request dict with the operation 'op' and its arguments
+    # @throw ImageCreationError if the server is not reachable or failed
+    # @return the response as dict
+    #
+    def request(self, request):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(self.path)
+                s.sendall(json.dumps(request).encode('utf-8') + b'\n')
+                with s.makefile('rb') as f:
+                    response = json.loads(f.readline().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise testimage.ImageCreationError("image server not reachable: " + str(e))
+        if 'error' in response:
+            raise testimage.ImageCreationError("image server: " + response['error'])
+        return response
+
+    ##
+    # get a mounted image
+    #
+    # @param imagetype type of the image, or path of a custom image
+    # @param custom flag to indicate a custom image
+    # @throw ImageCreationError if something went wrong
+    # @return dict with the image files, the mount path and the stat output
+    #
+    def acquire(self, imagetype, custom=False):
+        if custom:
+            imagetype = os.path.abspath(imagetype)
+        return self.request({'op': 'acquire', 'type': imagetype, 'custom': custom})
+
+    ##
+    # unmount an image
+    #
+    # @param imagetype type of the image, or path of a custom image
+    # @param custom flag to indicate a custom image
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def release(self, imagetype, custom=False):
+        if custom:
+            imagetype = os.path.abspath(imagetype)
+        self.request({'op': 'release', 'type': imagetype})
+
+    ##
+    # list the mounted images
+    #
+    # @throw ImageCreationError if something went wrong
+    # @return list of dicts with type, mount path and number of requests
+    #
+    def status(self):
+        return self.request({'op': 'status'})['images']
+
+    ##
+    # stop the server, it unmounts all images
+    #
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def stop(self):
+        self.request({'op': 'stop'})
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+################################################################################
+# @file journal.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief run journal to resume interrupted test runs
+# @details This module keeps a journal of a test run of several image types:
+# the completed phases of every image type (build, mount, metadata, recover)
+# with the data needed to undo them, and the test results of finished image
+# types. The journal is written after every change (atomically, by renaming
+# a temporary file), so it survives a crashed or interrupted run. A resumed
+# run skips the finished image types and reports their recorded results,
+# reuses the images built completely and the cached stat output of the image
+# types started before, and first removes the mounts, loop devices and
+# recovery directories left behind. Used stand-alone, the script prints the
+# state of a journal.
+################################################################################
+
+import argparse
+import os
+import sys
+import json
+import shutil
+import testimage
+
+
+##
+# main program to print the state of a journal
+#
+def main():
+    parser = argparse.ArgumentParser(description="Print the state of a run journal.")
+    parser.add_argument('journal', help="journal file")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.journal):
+        print("ERROR: journal", args.journal, "does not exist", file=sys.stderr)
+        sys.exit(2)
+    journal = RunJournal(args.journal, resume=True)
+    for imagetype, entry in sorted(journal.types.items()):
+        if 'result' in entry:
+            state = "passed" if entry['result']['success'] else "failed"
+        else:
+            state = "interrupted after " + (entry['phases'][-1] if entry['phases'] else "start")
+        print("{:<20} {}".format(imagetype, state))
+
+
+##
+# class used to record and resume the progress of a test run
+#
+class RunJournal:
+    # default journal file, formatted with the shard index
+    PATH = "journal-{}.json"
+
+    ##
+    # constructor
+    #
+    # @param fname journal file
+    # @param resume flag to continue an existing journal, else a new one is started
+    # @return a new instance of this class
+    #
+    def __init__(self, fname, resume=False):
+        self.fname = fname
+        # entries by image type: completed phases, their data and the result
+        self.types = dict()
+        if resume and os.path.isfile(fname):
+            with open(fname) as f:
+                self.types = json.load(f)['types']
+        else:
+            self.save()
+
+    ##
+    # record a completed phase of an image type
+    #
+    # @param imagetype type of the image
+    # @param phase name of the phase
+    # @param data data of the phase (e.g. the mount path)
+    # @return None
+    #
+    def phase(self, imagetype, phase, **data):
+        entry = self.types.setdefault(imagetype, {'phases': list(), 'data': dict()})
+        if phase not in entry['phases']:
+            entry['phases'].append(phase)
+        entry['data'].update(data)
+        self.save()
+
+    ##
+    # check if a phase of an image type was completed
+    #
+    # @param imagetype type of the image
+    # @param phase name of the phase
+    # @return True if the phase was completed
+    #
+    def done(self, imagetype, phase):
+        return phase in self.types.get(imagetype, {}).get('phases', ())
+
+    ##
+    # check if an image type was started but not finished
+    #
+    # @param imagetype type of the image
+    # @return True if the image type is unfinished
+    #
+    def unfinished(self, imagetype):
+        return imagetype in self.types and 'result' not in self.types[imagetype]
+
+    ##
+    # forget the phases of an image type (e.g. if its image is built again)
+    #
+    # @param imagetype type of the image
+    # @return None
+    #
+    def reset(self, imagetype):
+        self.__remove_cache(imagetype)
+        self.types.pop(imagetype, None)
+        self.save()
+
+    ##
+    # record the result of a finished image type
+    #
+    # @param imagetype type of the image
+    # @param result dict with the test cases, the elapsed time, the timings
+    #        and the success flag
+    # @return None
+    #
+    def finish(self, imagetype, result):
+        self.__remove_cache(imagetype)
+        entry = self.types.setdefault(imagetype, {'phases': list(), 'data': dict()})
+        entry['result'] = result
+        self.save()
+
+    ##
+    # get the result of a finished image type
+    #
+    # @param imagetype type of the image
+    # @return the result dict, None if the image type is not finished
+    #
+    def result(self, imagetype):
+        return self.types.get(imagetype, {}).get('result')
+
+    ##
+    # cache the stat output of an image type
+    #
+    # @param imagetype type of the image
+    # @param data stat output as bytes
+    # @param mpath mount path the stat output was read from
+    # @return None
+    #
+    def cache_stat(self, imagetype, data, mpath):
+        fname = "{}.{}.stat".format(self.fname,
+                                    ''.join(c if c.isalnum() else '_' for c in imagetype))
+        with open(fname, 'wb') as f:
+            f.write(data)
+        self.phase(imagetype, 'metadata', stat=fname, stat_mpath=mpath)
+
+    ##
+    # get the cached stat output of an image type
+    #
+    # @param imagetype type of the image
+    # @param mpath mount path the stat output has to be read from
+    # @return stat output as bytes, None if not cached
+    #
+    def cached_stat(self, imagetype, mpath):
+        data = self.types.get(imagetype, {}).get('data', {})
+        fname = data.get('stat')
+        if not self.done(imagetype, 'metadata') or data.get('stat_mpath') != mpath or \
+                fname is None or not os.path.isfile(fname):
+            return None
+        with open(fname, 'rb') as f:
+            return f.read()
+
+    ##
+    # remove what the unfinished image types left behind
+    # @details Mount points are unmounted, loop devices of the image files
+    # are detached and recovery directories are removed.
+    #
+    # @param fac ImageFactory used for unmounting
+    # @return None
+    #
+    def cleanup(self, fac):
+        for imagetype, entry in sorted(self.types.items()):
+            if 'result' in entry:
+                continue
+            data = entry['data']
+            if data.get('mpath') and os.path.ismount(data['mpath']):
+                print("unmounting stale mount", data['mpath'])
+                try:
+                    fac.umount(data['mpath'])
+                except testimage.ImageCreationError as e:
+                    print("could not unmount", data['mpath'] + ":", e, file=sys.stderr)
+            for fname in data.get('images', ()):
+                for dev in fac.detach_loops(fname):
+                    print("detached stale loop device", dev)
+            if data.get('rec_dir'):
+                shutil.rmtree(data['rec_dir'], ignore_errors=True)
+
+    ##
+    # remove the journal after a complete run
+    #
+    # @return None
+    #
+    def remove(self):
+        for imagetype in self.types:
+            self.__remove_cache(imagetype)
+        if os.path.isfile(self.fname):
+            os.remove(self.fname)
+
+    ##
+    # write the journal
+    #
+    # @return None
+    #
+    def save(self):
+        tmp = self.fname + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'types': self.types}, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.fname)
+
+    ##
+    # remove the cached stat output of an image type
+    #
+    # @param imagetype type of the image
+    # @return None
+    #
+    def __remove_cache(self, imagetype):
+        fname = self.types.get(imagetype, {}).get('data', {}).get('stat')
+        if fname is not None and os.path.isfile(fname):
+            os.remove(fname)
+
+
+# start the program
+if __name__ == '__main__':
+    main()
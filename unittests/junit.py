@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+################################################################################
+# @file junit.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief JUnit XML results of the unit tests and the merge of shard results
+# @details This module provides a test result class collecting every test case
+# with its duration and outcome, and writes them as JUnit XML, one test suite
+# per image type. Every shard of a sharded test run writes such an XML file
+# and a JSON file with its timing data. Used stand-alone, the script merges
+# the files of all shards into one JUnit report and one timing file, which can
+# be given to the next sharded run to balance the shards by measured cost.
+# Errors caused by a hanging tool or a tool exceeding its resource limits (see
+# execution.py) are typed as 'timeout' or 'limit' and counted separately
+# (the result class is based on execution.ExecutionResult).
+################################################################################
+
+import argparse
+import os
+import sys
+import json
+import glob
+import time
+import unittest
+import traceback
+import xml.etree.ElementTree as ElementTree
+import execution
+
+# default directory of the shard results
+RESULT_DIR = "results"
+
+
+##
+# main program to merge the results of the shards
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge the JUnit XML and timing files of all shards of a test run.")
+    parser.add_argument('-d', default=RESULT_DIR, metavar='dir',
+                        help="directory of the shard results (default = " + RESULT_DIR + ")")
+    parser.add_argument('-o', default='junit.xml', metavar='file',
+                        help="merged JUnit XML file (default = junit.xml)")
+    parser.add_argument('-t', default='timings.json', metavar='file',
+                        help="merged timing file (default = timings.json)")
+    parser.add_argument('-n', type=int, metavar='count',
+                        help="expected number of shards, missing shards are an error")
+    args = parser.parse_args()
+
+    shards = sorted(glob.glob(os.path.join(args.d, 'shard-*.xml')))
+    if not shards:
+        print("ERROR: no shard results in", args.d, file=sys.stderr)
+        sys.exit(2)
+
+    root = merge_xml(shards)
+    ElementTree.ElementTree(root).write(args.o, encoding='utf-8', xml_declaration=True)
+    timings = merge_timings([os.path.splitext(f)[0] + '.json' for f in shards])
+    with open(args.t, 'w') as f:
+        json.dump(timings, f, indent=2, sort_keys=True)
+
+    print("{} shards: {} tests, {} failures, {} errors, {} skipped in {:.0f} s".format(
+        len(shards), root.get('tests'), root.get('failures'), root.get('errors'),
+        root.get('skipped'), float(root.get('time'))))
+    aborted = [e.get('type') for e in root.iter('error')]
+    if aborted.count('timeout') or aborted.count('limit'):
+        print("of the errors: {} timeouts, {} limit hits".format(
+            aborted.count('timeout'), aborted.count('limit')))
+
+    failed = root.get('failures') != '0' or root.get('errors') != '0'
+    missing = sorted(set(range(args.n)) - set(timings['shards'])) if args.n else []
+    if missing:
+        print("ERROR: missing shards", *missing, file=sys.stderr)
+    sys.exit(1 if failed or missing else 0)
+
+
+##
+# test result collecting the test cases for a JUnit report
+#
+class JUnitResult(execution.ExecutionResult):
+    ##
+    # constructor
+    #
+    # @return a new instance of this class
+    #
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # list of dicts with classname, name, time, outcome, type, message and detail
+        self.cases = list()
+        self.__start = None
+
+    ##
+    # start timing a test case
+    #
+    def startTest(self, test):
+        super().startTest(test)
+        self.__start = time.perf_counter()
+
+    ##
+    # record a passed test case
+    #
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self.__record(test, 'success')
+
+    ##
+    # record a failed test case
+    #
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self.__record(test, 'failure', err)
+
+    ##
+    # record a test case with an error
+    #
+    def addError(self, test, err):
+        super().addError(test, err)
+        self.__record(test, 'error', err)
+
+    ##
+    # record a skipped test case
+    #
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self.__record(test, 'skipped', message=reason)
+
+    ##
+    # record an expected failure as passed
+    #
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self.__record(test, 'success')
+
+    ##
+    # record an unexpected success as failure
+    #
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self.__record(test, 'failure', message="unexpected success")
+
+    ##
+    # record the outcome of a test case
+    # @details Errors of the class set-up and tear-down are reported without a
+    # test case, they are recorded with their description as name. Errors of
+    # aborted tools get the outcome of the abort as type.
+    #
+    # @param test the test case
+    # @param outcome 'success', 'failure', 'error' or 'skipped'
+    # @param err exception info of failures and errors
+    # @param message message of the outcome
+    # @return None
+    #
+    def __record(self, test, outcome, err=None, message=None):
+        if isinstance(test, unittest.TestCase):
+            classname = type(test).__name__
+            name = test._testMethodName
+            elapsed = time.perf_counter() - self.__start if self.__start else 0.0
+        else:
+            classname = ''
+            name = str(test)
+            elapsed = 0.0
+        detail = None
+        kind = None
+        if err is not None:
+            message = str(err[1])
+            detail = ''.join(traceback.format_exception(*err))
+            if isinstance(err[1], execution.ExecutionError):
+                kind = err[1].outcome
+        self.cases.append({'classname': classname, 'name': name, 'time': elapsed,
+                           'outcome': outcome, 'type': kind, 'message': message,
+                           'detail': detail})
+        self.__start = None
+
+
+##
+# create the JUnit element of a test suite
+#
+# @param name name of the test suite
+# @param cases list of test case dicts (see JUnitResult)
+# @param elapsed run time of the test suite in seconds
+# @return the testsuite element
+#
+def suite_element(name, cases, elapsed):
+    suite = ElementTree.Element('testsuite', name=name, time="{:.3f}".format(elapsed))
+    counts = {'failure': 0, 'error': 0, 'skipped': 0}
+    for case in cases:
+        e = ElementTree.SubElement(suite, 'testcase', classname=case['classname'] or name,
+                                   name=case['name'], time="{:.3f}".format(case['time']))
+        if case['outcome'] in counts:
+            counts[case['outcome']] += 1
+            o = ElementTree.SubElement(e, case['outcome'], message=case['message'] or '')
+            if case.get('type'):
+                o.set('type', case['type'])
+            if case['detail']:
+                o.text = case['detail']
+    suite.set('tests', str(len(cases)))
+    suite.set('failures', str(counts['failure']))
+    suite.set('errors', str(counts['error']))
+    suite.set('skipped', str(counts['skipped']))
+    return suite
+
+
+##
+# create the root element of a JUnit report and sum up its test suites
+#
+# @param suites list of testsuite elements
+# @return the testsuites element
+#
+def report_element(suites):
+    root = ElementTree.Element('testsuites')
+    totals = {'tests': 0, 'failures': 0, 'errors': 0, 'skipped': 0}
+    elapsed = 0.0
+    for suite in suites:
+        root.append(suite)
+        for key in totals:
+            totals[key] += int(suite.get(key, '0'))
+        elapsed += float(suite.get('time', '0'))
+    for key in totals:
+        root.set(key, str(totals[key]))
+    root.set('time', "{:.3f}".format(elapsed))
+    return root
+
+
+##
+# merge JUnit XML files
+#
+# @param fnames list of JUnit XML files
+# @return the merged testsuites element
+#
+def merge_xml(fnames):
+    suites = list()
+    for fname in fnames:
+        root = ElementTree.parse(fname).getroot()
+        if root.tag == 'testsuite':
+            suites.append(root)
+        else:
+            suites.extend(root.findall('testsuite'))
+    return report_element(suites)
+
+
+##
+# merge the timing files of the shards
+# @details The total time of every image type is its measured cost.
+#
+# @param fnames list of timing files (missing files are ignored)
+# @return dict with the shard indexes, the timings and the costs per image type
+#
+def merge_timings(fnames):
+    merged = {'shards': list(), 'types': dict(), 'costs': dict()}
+    for fname in fnames:
+        if not os.path.isfile(fname):
+            continue
+        with open(fname) as f:
+            shard = json.load(f)
+        merged['shards'].append(shard['shard'])
+        for imagetype, data in shard['types'].items():
+            merged['types'][imagetype] = data
+            merged['costs'][imagetype] = data['elapsed']
+    merged['shards'].sort()
+    return merged
+
+
+# start the program
+if __name__ == '__main__':
+    main()
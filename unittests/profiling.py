@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+################################################################################
+# @file profiling.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief opt-in profiling of the test harness and the TSK tools it runs
+# @details This module profiles the phases of the unit tests of an image type
+# (build, mount, TSK metadata, stat metadata, recovery, clean-up): every phase
+# runs under cProfile and tracemalloc and writes a .prof file (for pstats or
+# snakeviz), a text summary of the most expensive functions and the top
+# allocations of the phase. The TSK tools started in a phase can be wrapped
+# with perf stat, perf record or /usr/bin/time -v, their reports are named
+# after the image type, the phase and the tool. Wrappers that are not
+# installed are skipped.
+################################################################################
+
+import os
+import sys
+import shutil
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+import collections
+
+
+##
+# class used to profile the phases of a test run
+#
+class Profiler:
+    # wrappers of the child processes, '{out}' is replaced by the report file
+    WRAPPERS = {
+        'perf-stat': (['perf', 'stat', '-o', '{out}', '--'], '.perfstat.txt'),
+        'perf-record': (['perf', 'record', '-g', '-o', '{out}', '--'], '.perf.data'),
+        'time': (['/usr/bin/time', '-v', '-o', '{out}'], '.time.txt'),
+    }
+    # number of functions and allocations listed in the text reports
+    TOP = 30
+
+    ##
+    # constructor
+    #
+    # @param outdir directory of the reports, None to disable profiling
+    # @param name name of the profiled run (e.g. the image type)
+    # @param wrapper wrapper of the child processes (see WRAPPERS), None for none
+    # @throw ValueError if received an invalid parameter
+    # @return a new instance of this class
+    #
+    def __init__(self, outdir=None, name="harness", wrapper=None):
+        if wrapper is not None and wrapper not in self.WRAPPERS:
+            raise ValueError("unknown wrapper " + wrapper)
+        self.outdir = outdir
+        self.name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+        self.wrapper = wrapper if outdir is not None else None
+        if self.wrapper is not None and shutil.which(self.WRAPPERS[wrapper][0][0]) is None:
+            print("profiling wrapper", wrapper, "is not installed", file=sys.stderr)
+            self.wrapper = None
+        if outdir is not None:
+            os.makedirs(outdir, exist_ok=True)
+        # phase currently profiled and number of wrapped children per phase
+        self.current = None
+        self.children = collections.Counter()
+
+    ##
+    # profile a phase
+    # @details Used as context manager around the code of the phase. Does
+    # nothing if profiling is disabled.
+    #
+    # @param phase name of the phase
+    # @return context manager
+    #
+    @contextlib.contextmanager
+    def phase(self, phase):
+        if self.outdir is None:
+            yield
+            return
+
+        prefix = os.path.join(self.outdir, "{}.{}".format(self.name, phase))
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        self.current = phase
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.current = None
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+            self.__write_reports(prefix, profile, before, after, peak)
+
+    ##
+    # wrap a command of a child process with the profiling wrapper
+    #
+    # @param cmd command as list
+    # @return the wrapped command, or the command if no wrapper is used
+    #
+    def wrap(self, cmd):
+        if self.wrapper is None:
+            return cmd
+        phase = self.current or "none"
+        self.children[phase] += 1
+        args, suffix = self.WRAPPERS[self.wrapper]
+        out = os.path.join(self.outdir, "{}.{}.{}-{}{}".format(
+            self.name, phase, os.path.basename(cmd[0]), self.children[phase], suffix))
+        return [a.format(out=out) for a in args] + list(cmd)
+
+    ##
+    # write the reports of a phase
+    #
+    # @param prefix path prefix of the report files
+    # @param profile cProfile.Profile of the phase
+    # @param before tracemalloc snapshot at the start of the phase
+    # @param after tracemalloc snapshot at the end of the phase
+    # @param peak peak of the traced memory in bytes
+    # @return None
+    #
+    def __write_reports(self, prefix, profile, before, after, peak):
+        profile.dump_stats(prefix + ".prof")
+        with open(prefix + ".prof.txt", 'w') as f:
+            pstats.Stats(profile, stream=f).sort_stats('cumulative').print_stats(self.TOP)
+        with open(prefix + ".alloc.txt", 'w') as f:
+            print("peak traced memory: {:.1f} MiB".format(peak / 1024 ** 2), file=f)
+            print("top allocations of the phase:", file=f)
+            for stat in after.compare_to(before, 'lineno')[0:self.TOP]:
+                print(stat, file=f)
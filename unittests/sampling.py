@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+################################################################################
+# @file sampling.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief stratified random sample of the files of an image
+# @details This module selects a seeded random sample of the files of a large
+# image, stratified by top-level directory, size class and file type, so the
+# sample is spread over the whole image. The files are ordered such that
+# every prefix of the order is a proportionally allocated sample which covers
+# all strata as early as possible; the files are verified in this order until
+# a time budget is spent, so the sample size adapts to the budget. The
+# mismatch rate of the image is estimated from the stratified sample, with a
+# confidence interval (Wilson score interval on the effective sample size,
+# widened by the weight of strata the budget did not reach).
+################################################################################
+
+import time
+import math
+import random
+import statistics
+
+
+##
+# class used to draw and evaluate a stratified sample
+#
+class StratifiedSample:
+    # upper bounds of the size classes in bytes (the last class is unbounded)
+    SIZE_CLASSES = (0, 4096, 64 * 1024, 1024 ** 2, 64 * 1024 ** 2)
+    # number of leading path components of the directory strata
+    DEPTH = 1
+    # confidence level of the interval of the mismatch rate
+    CONFIDENCE = 0.95
+
+    ##
+    # constructor
+    #
+    # @param files iterable of (path, type, size) tuples of the population
+    # @param seed seed of the random order
+    # @return a new instance of this class
+    #
+    def __init__(self, files, seed=0):
+        self.seed = seed
+        # paths of every stratum, in random order
+        self.strata = dict()
+        for path, ftype, size in sorted(files):
+            self.strata.setdefault(self.stratum(path, ftype, size), list()).append(path)
+        rnd = random.Random(seed)
+        keys = list()
+        for key in sorted(self.strata):
+            paths = self.strata[key]
+            rnd.shuffle(paths)
+            # the i-th file of a stratum follows after i/N of all files, the
+            # first files of all strata come first
+            keys += [(i / len(paths), rnd.random(), key, p) for i, p in enumerate(paths)]
+        self.order = [(key, p) for _, _, key, p in sorted(keys)]
+        # verified paths and mismatching paths per stratum
+        self.verified = dict((key, 0) for key in self.strata)
+        self.mismatches = dict((key, list()) for key in self.strata)
+        self.elapsed = 0.0
+
+    ##
+    # get the stratum of a file
+    #
+    # @param path relative path of the file
+    # @param ftype type of the file (e.g. 'r', 'd', 'l')
+    # @param size size of the file in bytes
+    # @return the stratum as (directory, size class, type) tuple
+    #
+    @classmethod
+    def stratum(cls, path, ftype, size):
+        parts = path.split('/')
+        directory = '/'.join(parts[0:min(cls.DEPTH, len(parts) - 1)])
+        sclass = next((i for i, bound in enumerate(cls.SIZE_CLASSES) if size <= bound),
+                      len(cls.SIZE_CLASSES))
+        return directory, sclass, ftype
+
+    ##
+    # size of the population
+    #
+    @property
+    def population(self):
+        return len(self.order)
+
+    ##
+    # number of verified files
+    #
+    @property
+    def size(self):
+        return sum(self.verified.values())
+
+    ##
+    # verify files in the sample order until the budget is spent
+    # @details A file is only started if the mean time per file so far still
+    # fits into the budget.
+    #
+    # @param verify function called with the path of a file, returns True if
+    #        the file mismatches
+    # @param budget time budget in seconds, None for no limit
+    # @param maximum maximum number of files, None for no limit
+    # @return list of the verified paths
+    #
+    def run(self, verify, budget=None, maximum=None):
+        paths = list()
+        start = time.perf_counter()
+        for key, path in self.order:
+            elapsed = time.perf_counter() - start
+            if maximum is not None and len(paths) >= maximum:
+                break
+            if budget is not None and paths and elapsed + elapsed / len(paths) > budget:
+                break
+            if verify(path):
+                self.mismatches[key].append(path)
+            self.verified[key] += 1
+            paths.append(path)
+        self.elapsed = time.perf_counter() - start
+        return paths
+
+    ##
+    # estimate the mismatch rate of the population
+    # @details The rate is the weighted mean of the rates of the sampled
+    # strata. Its interval is the Wilson score interval for the effective
+    # sample size of the stratified estimate (with finite population
+    # correction); strata without verified files may mismatch completely, so
+    # their weight widens the interval. A complete census has the exact rate.
+    #
+    # @return tuple of the estimated rate and the lower and upper bound
+    #
+    def estimate(self):
+        total = self.population
+        if total == 0:
+            return 0.0, 0.0, 0.0
+        sampled = [key for key in self.strata if self.verified[key] > 0]
+        unsampled = sum(len(self.strata[key]) for key in self.strata
+                        if self.verified[key] == 0) / total
+        if not sampled:
+            return None, 0.0, 1.0
+
+        weight = sum(len(self.strata[key]) for key in sampled)
+        rate = 0.0
+        variance = 0.0
+        for key in sampled:
+            w = len(self.strata[key]) / weight
+            n = self.verified[key]
+            p = len(self.mismatches[key]) / n
+            rate += w * p
+            variance += w ** 2 * (1 - n / len(self.strata[key])) * p * (1 - p) / n
+        n = self.size
+        if n == total:
+            return rate, rate, rate
+        if variance > 0:
+            n = min(n, rate * (1 - rate) / variance)
+        low, high = self.wilson(rate, n, self.CONFIDENCE)
+        return rate, low * (1 - unsampled), high * (1 - unsampled) + unsampled
+
+    ##
+    # report of the sample and the estimated mismatch rate
+    #
+    # @return the report as string
+    #
+    def report(self):
+        rate, low, high = self.estimate()
+        covered = sum(1 for key in self.strata if self.verified[key] > 0)
+        nmismatches = sum(len(m) for m in self.mismatches.values())
+        return ("{} of {} files verified in {:.1f} s (seed {}, {} of {} strata), "
+                "{} mismatching: rate {}, {:.0%} interval [{:.4%}, {:.4%}]").format(
+            self.size, self.population, self.elapsed, self.seed, covered, len(self.strata),
+            nmismatches, "{:.4%}".format(rate) if rate is not None else "unknown",
+            self.CONFIDENCE, low, high)
+
+    ##
+    # Wilson score interval of a proportion
+    #
+    # @param p observed proportion
+    # @param n sample size
+    # @param confidence confidence level
+    # @return tuple of the lower and upper bound
+    #
+    @staticmethod
+    def wilson(p, n, confidence):
+        if n <= 0:
+            return 0.0, 1.0
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        denominator = 1 + z ** 2 / n
+        center = (p + z ** 2 / (2 * n)) / denominator
+        half = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+        return max(0.0, center - half), min(1.0, center + half)
@@ -0,0 +1,376 @@
+#!/usr/bin/python3
+################################################################################
+# @file scheduler.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief cost-aware scheduler for the unit tests of all image types
+# @details This script runs the unit tests of several image types in parallel,
+# one process per image type, each with its own mount point and recovery
+# directory. The jobs are ordered by their cost, longest first, so the total
+# run time gets close to the longest job (the critical path). The cost of a
+# job is the median build and test time from the performance history, or the
+# estimate of the image type registry if there is no history yet (the build
+# time is left out if the image already exists). A job is only started if
+# there is enough free disk space and there are enough free loop devices for
+# it, otherwise a smaller job that fits is started instead. The output of
+# every job is written to a log file.
+################################################################################
+
+import argparse
+import os
+import sys
+import time
+import glob
+import shutil
+import sqlite3
+import subprocess
+import unittest
+import execution
+import testimage
+import history
+import test_btrfs
+
+
+##
+# main program to support stand-alone script usage
+#
+def main():
+    suite = [t.name for t in testimage.IMAGE_TYPES.values() if t.suite]
+    parser = argparse.ArgumentParser(
+        description="Run the unit tests of several image types in parallel, longest jobs "
+                    "first, with admission control on free disk space and loop devices.")
+    parser.add_argument('types', nargs='*', metavar='type',
+                        help="image types to test (default = all types of the complete suite: " +
+                             ' '.join(suite) + ")")
+    parser.add_argument('-j', type=int, default=Scheduler.JOBS, metavar='jobs',
+                        help="maximum number of parallel jobs (default = " +
+                             str(Scheduler.JOBS) + ")")
+    parser.add_argument('-i', default=test_btrfs.TestBtrfs.ipath, metavar='dir',
+                        help="directory of the images (default = " +
+                             test_btrfs.TestBtrfs.ipath + ")")
+    parser.add_argument('-l', default=Scheduler.LOG_DIR, metavar='dir',
+                        help="directory of the log files (default = " + Scheduler.LOG_DIR + ")")
+    parser.add_argument('--reserve', type=float, default=Scheduler.RESERVE / 1024 ** 3,
+                        metavar='GiB', help="disk space kept free (default = " +
+                                            str(Scheduler.RESERVE // 1024 ** 3) + ")")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only print the order and the estimated costs")
+    parser.add_argument('--run', metavar='type', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # job process, started by the scheduler
+    if args.run is not None:
+        sys.exit(0 if run_type(args.run, args.i) else 1)
+
+    for imagetype in args.types:
+        if imagetype not in testimage.IMAGE_TYPES:
+            parser.error("unknown image type " + imagetype)
+    if args.j < 1:
+        parser.error("at least one job is needed")
+
+    scheduler = Scheduler(args.types or suite, args.j, args.i, args.l,
+                          int(args.reserve * 1024 ** 3))
+    scheduler.print_plan()
+    if args.dry_run:
+        return
+    if os.getuid() != 0:
+        print("ERROR: the tests need root", file=sys.stderr)
+        sys.exit(2)
+    scheduler.run()
+    scheduler.print_summary()
+    sys.exit(0 if all(job.passed for job in scheduler.jobs) else 1)
+
+
+##
+# run the unit tests of one image type in this process
+# @details The mount point and the recovery directory get the image type as
+# suffix, so several of these processes can run at the same time.
+#
+# @param imagetype type of the image
+# @param ipath directory of the images
+# @return True if all tests passed
+#
+def run_type(imagetype, ipath):
+    cls = test_btrfs.type_class(imagetype, ipath=ipath,
+                                mpath=test_btrfs.TestBtrfs.mpath + "_" + imagetype,
+                                rec_dir=test_btrfs.TestBtrfs.rec_dir + "_" + imagetype)
+    # the image is built on the same mount point
+    cls.fac.MOUNT_PATH = cls.mpath
+    suite = unittest.TestLoader().loadTestsFromTestCase(cls)
+    result = unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite)
+    try:
+        os.rmdir(cls.mpath)
+    except OSError:
+        pass
+    return result.wasSuccessful()
+
+
+##
+# unit tests of one image type, scheduled as one process
+#
+class Job:
+    ##
+    # constructor
+    #
+    # @param itype ImageType of the job
+    # @param cost estimated run time in seconds
+    # @param disk estimated disk space needed in bytes
+    # @param loops number of loop devices needed
+    # @return a new instance of this class
+    #
+    def __init__(self, itype, cost, disk, loops):
+        self.itype = itype
+        self.cost = cost
+        self.disk = disk
+        self.loops = loops
+        self.process = None
+        self.log = None
+        self.start = None
+        self.elapsed = None
+        self.result = None
+        # reason why the job cannot run, None if it can
+        self.skipped = itype.unsupported()
+
+    ##
+    # flag if the job ran and all tests passed
+    #
+    @property
+    def passed(self):
+        return self.result == 0
+
+
+##
+# class used to order and run the jobs
+#
+class Scheduler:
+    # configurable constants
+    # default maximum number of parallel jobs
+    JOBS = 2
+    # default directory of the log files
+    LOG_DIR = "logs"
+    # default disk space kept free in bytes
+    RESERVE = 1024 ** 3
+    # size of the test images in bytes (the default of ImageFactory.create)
+    IMAGE_SIZE = 5 * 1024 ** 3
+    # maximum number of loop devices, if new ones can be created on demand
+    MAX_LOOP_DEVICES = 64
+    # interval between checks of the running jobs in seconds
+    POLL_INTERVAL = 1.0
+
+    ##
+    # constructor
+    #
+    # @param imagetypes list of image types to test
+    # @param jobs maximum number of parallel jobs
+    # @param ipath directory of the images
+    # @param logdir directory of the log files
+    # @param reserve disk space kept free in bytes
+    # @return a new instance of this class
+    #
+    def __init__(self, imagetypes, jobs=JOBS, ipath=test_btrfs.TestBtrfs.ipath,
+                 logdir=LOG_DIR, reserve=RESERVE):
+        self.max_jobs = jobs
+        self.ipath = ipath
+        self.logdir = logdir
+        self.reserve = reserve
+        self.measured = self.__measured_costs(imagetypes)
+
+        self.jobs = list()
+        for imagetype in imagetypes:
+            itype = testimage.IMAGE_TYPES[imagetype]
+            built = os.path.isfile(os.path.join(ipath, itype.names()[-1]))
+            build, test = self.measured.get(imagetype, (None, None))
+            cost = test if test is not None else itype.test_cost
+            disk = 0
+            if not built:
+                cost += build if build is not None else itype.build_cost
+                # sparse images, but they may fill up completely
+                disk = itype.devices * self.IMAGE_SIZE
+            # the recovered files take about the space of the data
+            disk += self.IMAGE_SIZE // 4
+            # image devices and the loop device of the direct io mount
+            self.jobs.append(Job(itype, cost, disk, itype.devices + 1))
+        # longest processing time first
+        self.jobs.sort(key=lambda j: j.cost, reverse=True)
+
+    ##
+    # read the measured build and test times from the performance history
+    #
+    # @param imagetypes list of image types
+    # @return dict of image type to (build, test) median times (None if unknown)
+    #
+    @staticmethod
+    def __measured_costs(imagetypes):
+        costs = dict()
+        db = test_btrfs.TestBtrfs.history_db
+        if db is None or not os.path.isfile(db):
+            return costs
+        try:
+            h = history.History(db)
+            for imagetype in imagetypes:
+                build, test = h.median(imagetype, 'build'), h.median(imagetype, 'total')
+                if build is not None or test is not None:
+                    costs[imagetype] = (build, test)
+            h.close()
+        except sqlite3.Error as e:
+            print("could not read the performance history:", e, file=sys.stderr)
+        return costs
+
+    ##
+    # get the free disk space of the image directory
+    #
+    # @return free space in bytes
+    #
+    def free_disk(self):
+        path = self.ipath if os.path.isdir(self.ipath) else '.'
+        return shutil.disk_usage(path).free
+
+    ##
+    # get the number of free loop devices
+    # @details Unbound loop devices are free, if loop devices are created on
+    # demand (loop-control), up to MAX_LOOP_DEVICES are counted.
+    #
+    # @return number of free loop devices
+    #
+    @classmethod
+    def free_loops(cls):
+        devices = glob.glob('/sys/block/loop[0-9]*')
+        free = sum(1 for d in devices if not os.path.exists(os.path.join(d, 'loop',
+                                                                         'backing_file')))
+        if os.path.exists('/dev/loop-control'):
+            free += max(0, cls.MAX_LOOP_DEVICES - len(devices))
+        return free
+
+    ##
+    # check if a job can be started next to the running jobs
+    # @details The disk space and loop devices of the running jobs count as
+    # used, even if they are not yet taken.
+    #
+    # @param job Job to check
+    # @param running list of running jobs
+    # @return True if the job can be started
+    #
+    def admissible(self, job, running):
+        disk = sum(j.disk for j in running)
+        loops = sum(j.loops for j in running)
+        return self.free_disk() - disk >= job.disk + self.reserve and \
+            self.free_loops() - loops >= job.loops
+
+    ##
+    # estimate the total run time without resource limits
+    # @details The jobs are simulated in the scheduled order, each one is
+    # started as soon as one of the parallel slots is free.
+    #
+    # @return tuple of the estimated total and the critical path in seconds
+    #
+    def estimate(self):
+        slots = [0.0] * self.max_jobs
+        for job in self.jobs:
+            if job.skipped is None:
+                slots.sort()
+                slots[0] += job.cost
+        costs = [job.cost for job in self.jobs if job.skipped is None]
+        critical = max(max(costs, default=0.0), sum(costs) / self.max_jobs)
+        return max(slots), critical
+
+    ##
+    # run all jobs
+    #
+    # @return None
+    #
+    def run(self):
+        os.makedirs(self.logdir, exist_ok=True)
+        os.makedirs(self.ipath, exist_ok=True)
+        pending = [job for job in self.jobs if job.skipped is None]
+        running = list()
+
+        while pending or running:
+            # longest job that fits first
+            for job in list(pending):
+                if len(running) >= self.max_jobs:
+                    break
+                if self.admissible(job, running):
+                    self.__start(job)
+                    pending.remove(job)
+                    running.append(job)
+                elif not running:
+                    # nothing will be freed, the job can never start
+                    job.skipped = "not enough disk space or loop devices"
+                    pending.remove(job)
+                    print(job.itype.name, "skipped:", job.skipped, file=sys.stderr)
+
+            time.sleep(self.POLL_INTERVAL)
+            for job in list(running):
+                if job.process.poll() is not None:
+                    self.__finish(job)
+                    running.remove(job)
+
+    ##
+    # start the process of a job
+    #
+    # @param job Job to start
+    # @return None
+    #
+    def __start(self, job):
+        print("starting", job.itype.name, "(estimated {:.0f} s)".format(job.cost))
+        job.log = open(os.path.join(self.logdir, job.itype.name + ".log"), 'w')
+        cmd = [sys.executable, os.path.abspath(__file__), '--run', job.itype.name,
+               '-i', self.ipath]
+        job.start = time.perf_counter()
+        job.process = subprocess.Popen(cmd, stdout=job.log, stderr=subprocess.STDOUT)
+
+    ##
+    # collect the result of a finished job
+    #
+    # @param job Job that finished
+    # @return None
+    #
+    def __finish(self, job):
+        job.elapsed = time.perf_counter() - job.start
+        job.result = job.process.returncode
+        job.log.close()
+        print("finished", job.itype.name, "in {:.0f} s:".format(job.elapsed),
+              "ok" if job.passed else "FAILED (see " + job.log.name + ")")
+
+    ##
+    # print the order of the jobs and the estimated run time
+    #
+    # @return None
+    #
+    def print_plan(self):
+        print("{:<18} {:>10} {:>8} {:>6}".format('type', 'cost s', 'disk GiB', 'loops'))
+        for job in self.jobs:
+            line = "{:<18} {:>10.0f} {:>8.1f} {:>6}".format(job.itype.name, job.cost,
+                                                             job.disk / 1024 ** 3, job.loops)
+            if job.itype.name in self.measured:
+                line += "  measured"
+            if job.skipped is not None:
+                line += "  skipped: " + job.skipped
+            print(line)
+        total, critical = self.estimate()
+        print("estimated total {:.0f} s with {} jobs (critical path {:.0f} s)".format(
+            total, self.max_jobs, critical))
+
+    ##
+    # print the results of all jobs
+    #
+    # @return None
+    #
+    def print_summary(self):
+        print()
+        print("{:<18} {:>10} {:>10}  {}".format('type', 'cost s', 'actual s', 'result'))
+        for job in self.jobs:
+            if job.skipped is not None:
+                result = "skipped: " + job.skipped
+            else:
+                result = "ok" if job.passed else "FAILED"
+            elapsed = "{:.0f}".format(job.elapsed) if job.elapsed is not None else "-"
+            print("{:<18} {:>10.0f} {:>10}  {}".format(job.itype.name, job.cost, elapsed,
+                                                       result))
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,9 @@
 # It provides custom set-up and tear-down methods to prepare the testing
 # environment an implements all test methods, used to test the file data, the
 # file meta data and the structure of the image.
+# The TSK tools run with timeouts and resource limits (see execution.py): a
+# hanging tool or one exceeding its limits fails the test (or the set-up) with
+# an error of its own, and the mount and loop devices are released.
 ################################################################################
 
 import unittest
@@ -17,8 +20,19 @@ import subprocess
 import os
 import sys
 import shutil
+import time
+import sqlite3
+import hashlib
+import itertools
+import concurrent.futures
 import testimage
 import textparser
+import history
+import imageserver
+import btrfsreader
+import profiling
+import execution
+import sampling
 
 
 class TestBtrfs(unittest.TestCase):
@@ -37,6 +51,39 @@ class TestBtrfs(unittest.TestCase):
     fix_subvols = True
     # ignore the zero-size of directories, subvolumes and snapshots in TSK
     fix_size = True
+    # payload of the created files per file class (see testimage.Payload), None for the line pattern
+    payload = None
+    # maximum number of differing paths listed in a failure message
+    max_diff = 20
+    # database where the timings of the TSK tools are appended, None to disable
+    history_db = history.History.DATABASE
+    # allowed slowdown factor of the TSK tools against their history
+    history_threshold = history.History.THRESHOLD
+    # socket of a running image server (see imageserver.py), None to mount the images directly
+    image_server = os.getenv('TSK_IMAGE_SERVER')
+    # md5 file of a custom image, None for [image].md5
+    custom_md5 = None
+    # read the expected metadata with btrfsreader.py instead of stat on the mounted image
+    # (btrfs images only, custom images are not mounted and need no root)
+    metadata_reader = False
+    # number of files compared at once and number of parallel istat runs of the extent test
+    extent_batch = 256
+    extent_workers = os.cpu_count() or 1
+    # journal of the run (see journal.py) recording the completed phases, None to disable
+    journal = None
+    # directory of the profiles of the set-up phases (see profiling.py), None to disable
+    profile_dir = os.getenv('TSK_PROFILE')
+    # wrapper of the TSK tools while profiling ('perf-stat', 'perf-record' or 'time')
+    profile_wrapper = os.getenv('TSK_PROFILE_WRAPPER')
+    # runs the TSK tools with timeouts and resource limits (see execution.py)
+    executor = execution.Executor()
+    # time budget in seconds to verify a stratified random sample of the files of custom
+    # images instead of all files (see sampling.py), None to verify all files
+    sample_budget = float(os.getenv('TSK_SAMPLE_BUDGET')) if os.getenv('TSK_SAMPLE_BUDGET') \
+        else None
+    # seed of the sample and maximum number of sampled files (None = as the budget allows)
+    sample_seed = int(os.getenv('TSK_SAMPLE_SEED', '0'))
+    sample_max = None
     
     fac = testimage.ImageFactory(True)
     parser = textparser.TextParser(ignore_ext_backup, fix_subvols)
@@ -45,86 +92,177 @@ class TestBtrfs(unittest.TestCase):
 
     tsk = set()
     stat = set()
+    timings = dict()
+    # StratifiedSample of the sampling mode, inode found by istat and md5 sum of the
+    # data read by icat of every sampled file
+    sample = None
+    sample_inodes = dict()
+    sample_data = dict()
 
     ##
     # prepare everything before the tests are started
     # @details This function creates and mounts a new test image (or uses
-    # a given custom image). Then it reads the image metadata using the TSK
-    # tools fls and ils and the Linux tool stat. Finally, all files are
-    # recovered to a directory.
+    # a given custom image), or gets an image kept mounted by the image server.
+    # Then it reads the image metadata using the TSK tools fls and ils and the
+    # Linux tool stat (the server returns its cached stat output) or reads it
+    # from the image files with the metadata reader, which needs no mount.
+    # Finally, all files are recovered to a directory. The times of the TSK
+    # tools (and of the build) are kept for the performance history. With a
+    # journal, every completed phase is recorded; an image of an interrupted
+    # run is reused if it was built completely, and so is its stat output.
+    # In the sampling mode of custom images, only a stratified random sample
+    # of the files is verified with targeted tools instead of the stat walk
+    # and the recovery of all files, as far as the time budget allows.
+    # With a profile directory, every phase is profiled and the TSK tools can
+    # be wrapped by a profiler; the timings of profiled runs are not recorded.
     #
     # @param imagetype type of the test image to use
     # @param custom flag to indicate a custom image
     # @return None
     #
     def setUpClassCustom(self, imagetype, custom=False):
-        # create directory for image files
-        if not os.path.exists(self.ipath):
-            try:
-                os.mkdir(self.ipath)
-            except OSError as e:
-                print(e, file=sys.stderr)
-                raise testimage.ImageCreationError("could not create image directory")
-
-        if custom:
+        image = None
+        built = False
+        self.profiler = profiling.Profiler(self.profile_dir, imagetype, self.profile_wrapper)
+        if self.image_server is not None:
+            print("using image server", self.image_server)
+            image = imageserver.ImageClient(self.image_server).acquire(imagetype, custom)
+            self.files = tuple(image['files'])
+        elif custom:
             print("using custom image", imagetype)
-            self.files = (imagetype, imagetype + ".md5")
+            self.files = (imagetype, self.custom_md5 or imagetype + ".md5")
             self.ipath = None
         else:
+            # create directory for image files
+            if not os.path.exists(self.ipath):
+                try:
+                    os.mkdir(self.ipath)
+                except OSError as e:
+                    print(e, file=sys.stderr)
+                    raise testimage.ImageCreationError("could not create image directory")
+
+            # an image of an interrupted run is only reused if it was built completely
+            if self.journal is not None and self.journal.unfinished(imagetype) and \
+                    not self.journal.done(imagetype, 'build'):
+                for f in self.fac.names(imagetype):
+                    if os.path.isfile(os.path.join(self.ipath, f)):
+                        os.remove(os.path.join(self.ipath, f))
+                self.journal.reset(imagetype)
+
             print("creating image ...")
-            self.files = self.fac.create(imagetype, imagedir=self.ipath)
+            built = not os.path.isfile(os.path.join(self.ipath, self.fac.names(imagetype)[-1]))
+            start = time.perf_counter()
+            with self.profiler.phase('build'):
+                self.files = self.fac.create(imagetype, imagedir=self.ipath,
+                                             payload=self.payload)
+            build = time.perf_counter() - start
 
             # add path to file names
             self.files = list(self.files)
             for i in range(0, len(self.files)):
                 self.files[i] = os.path.join(self.ipath, self.files[i])
             self.files = tuple(self.files)
+            if self.journal is not None:
+                # a new image invalidates the cached data of an earlier one
+                if built:
+                    self.journal.reset(imagetype)
+                self.journal.phase(imagetype, 'build', images=list(self.files[0:-1]))
+        self.imagetype = imagetype
+        # own records per test class, the class attributes are shared
+        self.tsk = set()
+        self.stat = set()
+        self.timings = dict()
+        self.sample = None
+        self.sample_inodes = dict()
+        self.sample_data = dict()
+        self.started = time.perf_counter()
+        # only a real build is a measure of the build cost
+        if not custom and built:
+            self.timings['build'] = build
+
+        # served images are already mounted, the metadata reader needs no mount
+        self.served = image is not None
+        self.mounted = not self.served and not self.metadata_reader
+        self.fs_path = image['mpath'] if self.served else self.mpath
+        with self.profiler.phase('mount'):
+            if self.mounted:
+                if self.fac.devices(imagetype) > 1:
+                    self.loopdev = self.fac.mount_raid(imagetype, self.ipath, self.mpath)
+                else:
+                    self.fac.mount(imagetype, self.ipath, self.mpath)
+        if self.journal is not None:
+            self.journal.phase(imagetype, 'mount', mpath=self.mpath if self.mounted else None,
+                               rec_dir=self.rec_dir)
 
-        if "raid" in imagetype:
-            self.loopdev = self.fac.mount_raid(imagetype, self.ipath, self.mpath)
-        else:
-            self.fac.mount(imagetype, self.ipath, self.mpath)
-        
         try:
             print("retrieving metadata from image using tsk")
-            out = subprocess.check_output(['fls', '-r', '-m', '/', self.files[0]])
-            tsk_files = self.parser.parse_fls_files(out)
-            out = subprocess.check_output(['ils', '-a', self.files[0]])
-            tsk_inodes = self.parser.parse_ils(out)
-            for line in tsk_files:
-                line.extend(tsk_inodes[line[1]])
-                self.tsk.add(tuple(line))
+            types = dict()
+            with self.profiler.phase('tsk'):
+                start = time.perf_counter()
+                out = self.executor.check_output(
+                    self.profiler.wrap(['fls', '-r', '-m', '/', self.files[0]]))
+                self.timings['fls'] = time.perf_counter() - start
+                tsk_files = self.parser.parse_fls_files(out, types)
+                start = time.perf_counter()
+                out = self.executor.check_output(self.profiler.wrap(['ils', '-a', self.files[0]]))
+                self.timings['ils'] = time.perf_counter() - start
+                tsk_inodes = self.parser.parse_ils(out)
+                for line in tsk_files:
+                    line.extend(tsk_inodes[line[1]])
+                    self.tsk.add(tuple(line))
             # print("TSK")
             # print(*self.tsk, sep='\n')
-            
-            print("retrieving metadata from filesystem using stat")
-            stat_cmd = "stat -c '%n|%i|a|%u|%g|%Y|%X|%Z|%W|%a|%h|%s' "
-            cmd = [stat_cmd + os.path.join(self.mpath, '*')]
-            out = subprocess.check_output(cmd, shell=True)
-            stat_inodes = self.parser.parse_stat(out, self.mpath)
-            
-            for root, dirs, files in os.walk(self.mpath):
-                for dname in dirs:
-                    try:
-                        cmd = [stat_cmd + os.path.join(os.path.join(root, dname), '*')]
-                        out = subprocess.check_output(cmd, shell=True, stderr=subprocess.DEVNULL)
-                        stat_inodes.extend(self.parser.parse_stat(out, self.mpath))
-                    except subprocess.CalledProcessError:
-                        continue
-            for line in stat_inodes:
-                self.stat.add(tuple(line))
+
+            if self.sampling(custom):
+                print("verifying a sample of the files ...")
+                with self.profiler.phase('sample'):
+                    self.verify_sample(types)
+                print(self.sample.report())
+            else:
+                print("retrieving metadata from filesystem using stat")
+                with self.profiler.phase('stat'):
+                    if image is not None:
+                        stat_inodes = self.parser.parse_stat(image['stat'].encode('utf-8'),
+                                                             image['mpath'])
+                    elif self.metadata_reader:
+                        reader = btrfsreader.BtrfsReader(self.files[0:-1])
+                        try:
+                            stat_inodes = self.parser.parse_stat(reader.stat_output(self.mpath),
+                                                                 self.mpath)
+                        finally:
+                            reader.close()
+                    else:
+                        data = None
+                        if self.journal is not None:
+                            data = self.journal.cached_stat(imagetype, self.mpath)
+                        if data is None:
+                            data = self.fac.stat_output(self.mpath)
+                            if self.journal is not None:
+                                self.journal.cache_stat(imagetype, data, self.mpath)
+                        stat_inodes = self.parser.parse_stat(data, self.mpath)
+                    for line in stat_inodes:
+                        self.stat.add(tuple(line))
             # print("STAT")
             # print(*self.stat, sep='\n')
-            
-            print("recovering files ...")
-            if os.path.exists(self.rec_dir):
-                raise Exception("file recovery directory already exits")
-            os.makedirs(self.rec_dir)
-            cmd = ['tsk_recover', '-a', self.files[0], self.rec_dir]
-            subprocess.call(cmd, stdout=subprocess.DEVNULL)
+
+            with self.profiler.phase('recover'):
+                if os.path.exists(self.rec_dir):
+                    raise Exception("file recovery directory already exits")
+                os.makedirs(self.rec_dir)
+                # the holes of sparse files of TiB size would be written, the
+                # data of a sample is read with icat
+                itype = testimage.IMAGE_TYPES.get(imagetype)
+                if self.sample is None and (itype is None or itype.recover):
+                    print("recovering files ...")
+                    cmd = self.profiler.wrap(['tsk_recover', '-a', self.files[0], self.rec_dir])
+                    start = time.perf_counter()
+                    self.executor.call(cmd, stdout=subprocess.DEVNULL)
+                    self.timings['tsk_recover'] = time.perf_counter() - start
+            if self.journal is not None:
+                self.journal.phase(imagetype, 'recover')
         except Exception:
-            self.fac.umount(self.mpath)
-            shutil.rmtree(self.rec_dir, ignore_errors=True)
+            # also after a hanging or killed tool, so no mount or loop device is left
+            self.release(imagetype)
             raise
 
     ##
@@ -137,21 +275,191 @@ class TestBtrfs(unittest.TestCase):
     def tearDownClassCustom(self, imagetype, custom=False):
         print("cleaning up files ...")
 
-        # unmount
-        if "raid" in imagetype:
-            self.fac.umount_raid(self.mpath, self.loopdev)
-        else:
-            self.fac.umount(self.mpath)
+        with self.profiler.phase('teardown'):
+            self.release(imagetype)
 
-        # delete recovered files
-        shutil.rmtree(self.rec_dir, ignore_errors=True)
+        # append the timings to the performance history (not comparable if profiled)
+        self.timings['total'] = time.perf_counter() - self.started
+        if self.history_db is not None and self.profiler.outdir is None:
+            try:
+                h = history.History(self.history_db, self.history_threshold)
+                h.record(imagetype, self.timings, history.History.image_digest(self.files[-1]))
+                h.close()
+            except (sqlite3.Error, IOError) as e:
+                print("could not record timings:", e, file=sys.stderr)
 
         # delete created image
-        if not self.keep_images and not custom:
+        if not self.keep_images and not custom and not self.served:
             print("removing image ...", imagetype + ".img")
             self.fac.delete(imagetype, self.ipath)
-            shutil.rmtree(self.ipath, ignore_errors=True)
+            # other test classes may still use the directory
+            try:
+                os.rmdir(self.ipath)
+            except OSError:
+                pass
     
+    ##
+    # unmount the image and delete the recovered files
+    # @details Served images stay mounted. The raid members are detached from
+    # their loop devices.
+    #
+    # @param imagetype name of the image used
+    # @return None
+    #
+    @classmethod
+    def release(cls, imagetype):
+        if cls.mounted and os.path.ismount(cls.mpath):
+            if cls.fac.devices(imagetype) > 1:
+                cls.fac.umount_raid(cls.mpath, cls.loopdev)
+            else:
+                cls.fac.umount(cls.mpath)
+        shutil.rmtree(cls.rec_dir, ignore_errors=True)
+
+    ##
+    # check if a sample of the files is verified instead of all files
+    #
+    # @param custom flag to indicate a custom image
+    # @return True for the sampling mode
+    #
+    @classmethod
+    def sampling(cls, custom):
+        return custom and cls.sample_budget is not None
+
+    ##
+    # verify a stratified random sample of the files
+    # @details The files listed by TSK are sampled, stratified by directory,
+    # size and type, and verified one by one until the time budget is spent:
+    # their metadata is read with a targeted stat (or taken from the metadata
+    # reader), their inode with istat and the data of regular files listed in
+    # the manifest with icat. The records of the tests are reduced to the
+    # sampled files, so the other tests compare the sample as usual.
+    #
+    # @param types dict of path to file type listed by fls
+    # @return None
+    #
+    @classmethod
+    def verify_sample(cls, types):
+        records = dict((line[0], line) for line in cls.tsk)
+        cls.sample = sampling.StratifiedSample(
+            ((p, types.get(p, '-'), r[11]) for p, r in records.items()), cls.sample_seed)
+        expected = cls.fac.read_manifest(cls.files[-1])
+        known = None
+        if cls.metadata_reader:
+            reader = btrfsreader.BtrfsReader(cls.files[0:-1])
+            try:
+                known = dict((line[0], tuple(line)) for line in cls.parser.parse_stat(
+                    reader.stat_output(cls.mpath), cls.mpath))
+            finally:
+                reader.close()
+        stat = dict()
+
+        def verify(path):
+            tsk = records[path]
+            if known is not None:
+                stat[path] = known.get(path)
+            else:
+                try:
+                    lines = cls.parser.parse_stat(cls.fac.stat_output(cls.fs_path, [path]),
+                                                  cls.fs_path)
+                    stat[path] = tuple(lines[0]) if lines else None
+                except subprocess.CalledProcessError:
+                    stat[path] = None
+            try:
+                out = cls.executor.check_output(['istat', cls.files[0], str(tsk[1])],
+                                                stderr=subprocess.DEVNULL)
+                cls.sample_inodes[path] = int(out.splitlines()[2].decode('utf-8').split(' ')[2])
+            except (subprocess.CalledProcessError, IndexError, ValueError):
+                cls.sample_inodes[path] = None
+            if types.get(path) == 'r' and path in expected:
+                hashsum = hashlib.md5()
+                try:
+                    for chunk in cls.executor.stream(['icat', cls.files[0], str(tsk[1])],
+                                                     stderr=subprocess.DEVNULL):
+                        hashsum.update(chunk)
+                    cls.sample_data[path] = hashsum.hexdigest()
+                except subprocess.CalledProcessError:
+                    cls.sample_data[path] = None
+            return stat[path] is None or cls.record_mismatch(tsk, stat[path]) or \
+                cls.sample_inodes[path] != stat[path][1] or \
+                cls.sample_data.get(path, expected.get(path)) != expected.get(path)
+
+        paths = set(cls.sample.run(verify, cls.sample_budget, cls.sample_max))
+        cls.tsk = set(line for line in cls.tsk if line[0] in paths)
+        cls.stat = set(line for line in stat.values() if line is not None)
+
+    ##
+    # check if the metadata of a file listed by TSK differs from stat
+    # @details The fields of the metadata tests are compared: uid, gid, times,
+    # mode, link count and size.
+    #
+    # @param tsk record of TSK
+    # @param stat record of stat
+    # @return True if a field differs
+    #
+    @classmethod
+    def record_mismatch(cls, tsk, stat):
+        return tsk[3:11] != stat[3:11] or tsk[11] != cls.expected_size(stat)
+
+    ##
+    # get the size TSK is expected to report for a file
+    #
+    # @param record record of stat
+    # @return the size, 0 for directories, subvolumes and snapshots if fix_size is set
+    #
+    @classmethod
+    def expected_size(cls, record):
+        # fix snapshot, subvolume and directory sizes if desired
+        if cls.fix_size:
+            last = record[0].split('/')[-1]
+            if "directory" in last or "subvolume" in last or "snapshot" in last:
+                return 0
+        return record[11]
+
+    ##
+    # compare records of tsk and stat indexed by path
+    # @details Both sides are indexed by path, so missing, additional and
+    # differing paths are found in a single pass, also on images with many
+    # thousands of files. Only the first differences are listed on failure.
+    #
+    # @param stat dict of path to expected value
+    # @param tsk dict of path to value found by tsk
+    # @return None
+    #
+    def assertIndexEqual(self, stat, tsk):
+        missing = sorted(stat.keys() - tsk.keys())
+        additional = sorted(tsk.keys() - stat.keys())
+        differing = sorted(p for p in stat.keys() & tsk.keys() if stat[p] != tsk[p])
+        if missing or additional or differing:
+            msg = "{} missing, {} additional, {} differing paths".format(
+                len(missing), len(additional), len(differing))
+            for p in missing[0:self.max_diff]:
+                msg += "\n- " + p
+            for p in additional[0:self.max_diff]:
+                msg += "\n+ " + p
+            for p in differing[0:self.max_diff]:
+                msg += "\n! {}: {!r} != {!r}".format(p, stat[p], tsk[p])
+            self.fail(msg)
+
+    ##
+    # index a field of the records by path
+    # @details Paths listed more than once with different values map to a set
+    # of all their values, so they cannot match a single expected value.
+    #
+    # @param records iterable of records with the path as first element
+    # @param index index of the field
+    # @return dict of path to value
+    #
+    @staticmethod
+    def index_field(records, index):
+        values = dict()
+        for line in records:
+            value = line[index]
+            if line[0] in values and values[line[0]] != value:
+                old = values[line[0]]
+                value = (old if isinstance(old, frozenset) else frozenset([old])) | {value}
+            values[line[0]] = value
+        return values
+
     ##
     # test if the file structure matches
     #
@@ -170,159 +478,135 @@ class TestBtrfs(unittest.TestCase):
     # test if the inode number of the files matches
     #
     def test_metadata_inode(self):
-        tsk = set()
+        if self.sample is not None:
+            tsk = [(p, i) for p, i in self.sample_inodes.items() if i is not None]
+            self.assertIndexEqual(self.index_field(self.stat, 1), self.index_field(tsk, 1))
+            return
+        tsk = list()
+        start = time.perf_counter()
         for line in self.tsk:
             try:
                 cmd = ['istat', self.files[0], str(line[1])]
-                istat = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
+                istat = self.executor.check_output(cmd, stderr=subprocess.DEVNULL)
             except subprocess.CalledProcessError as e:
                 istat = e.output
             istat = istat.splitlines()
             istat = istat[2].decode('utf-8').split(' ')
-            tsk.add((line[0], int(istat[2])))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[1]))
+            tsk.append((line[0], int(istat[2])))
+        self.timings['istat'] = time.perf_counter() - start
         
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 1), self.index_field(tsk, 1))
     
     ##
     # test if the UID of the files matches
     #
     def test_metadata_uid(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[3]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[3]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 3), self.index_field(self.tsk, 3))
     
     ##
     # test if the GID of the files matches
     #
     def test_metadata_gid(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[4]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[4]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 4), self.index_field(self.tsk, 4))
     
     ##
     # test if the modification time of the files matches
     #
     def test_metadata_mtime(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[5]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[5]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 5), self.index_field(self.tsk, 5))
     
     ##
     # test if the access time of the files matches
     #
     def test_metadata_atime(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[6]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[6]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 6), self.index_field(self.tsk, 6))
     
     ##
     # test if the change time of the files matches
     #
     def test_metadata_ctime(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[7]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[7]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 7), self.index_field(self.tsk, 7))
     
     ##
     # test if the creation time of the files matches
     #
     def test_metadata_crtime(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[8]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[8]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 8), self.index_field(self.tsk, 8))
     
     ##
     # test if the mode of the files matches
     #
     def test_metadata_mode(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[9]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[9]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 9), self.index_field(self.tsk, 9))
     
     ##
     # test if the link count of the files matches
     #
     def test_metadata_links(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[10]))
-        
-        stat = set()
-        for line in self.stat:
-            stat.add((line[0], line[10]))
-        
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(self.stat, 10), self.index_field(self.tsk, 10))
     
     ##
     # test if the size of the files matches
     #
     def test_metadata_size(self):
-        tsk = set()
-        for line in self.tsk:
-            tsk.add((line[0], line[11]))
-        
-        stat = set()
+        stat = list()
         for line in self.stat:
-            value = line[11]
-            # fix snapshot, subvolume and directory sizes if desired
-            if self.fix_size:
-                last = line[0].split('/')[-1]
-                if "directory" in last or "subvolume" in last or "snapshot" in last:
-                    value = 0
-            stat.add((line[0], value))
+            stat.append((line[0], self.expected_size(line)))
         
-        self.assertEqual(stat, tsk)
+        self.assertIndexEqual(self.index_field(stat, 1), self.index_field(self.tsk, 11))
     
+    ##
+    # test if the TSK tools are not slower than their history
+    # @details The times measured for this image are checked against the
+    # rolling baseline of the same image type and content in the performance
+    # history (rebuilt images keep their content digest). The test is skipped
+    # as long as there is no baseline.
+    #
+    def test_performance(self):
+        if self.history_db is None:
+            self.skipTest("performance history disabled")
+        if self.profile_dir is not None:
+            self.skipTest("timings of profiled runs are not comparable")
+        try:
+            h = history.History(self.history_db, self.history_threshold)
+            digest = history.History.image_digest(self.files[-1])
+            results = [h.check(self.imagetype, tool, self.timings[tool], digest)
+                       for tool in sorted(self.timings) if tool in history.History.GATED]
+            h.close()
+        except (sqlite3.Error, IOError) as e:
+            self.skipTest("performance history not available: " + str(e))
+
+        regressed = [str(r) for r in results if r.regressed]
+        self.assertFalse(regressed, "\n".join(regressed))
+        # a check without baseline is not a pass
+        missing = [str(r) for r in results if r.noise is None]
+        if not results or missing:
+            self.skipTest("no baseline:\n" + "\n".join(missing))
+
+    ##
+    # test if none of the sampled files mismatches
+    # @details The message reports the estimated mismatch rate of the whole
+    # image with its confidence interval.
+    #
+    def test_sample(self):
+        if self.sample is None:
+            self.skipTest("all files verified")
+        mismatches = sorted(p for m in self.sample.mismatches.values() for p in m)
+        msg = self.sample.report()
+        for p in mismatches[0:self.max_diff]:
+            msg += "\n! " + p
+        self.assertFalse(mismatches, msg)
+
     ##
     # test if the data of the files matches (by comparing their md5 sums)
     #
     def test_filedata(self):
+        if self.sample is not None:
+            expected = self.fac.read_manifest(self.files[-1])
+            self.assertIndexEqual(dict((p, expected[p]) for p in self.sample_data),
+                                  dict((p, d) for p, d in self.sample_data.items()
+                                       if d is not None))
+            return
         stat = set()
         with open(self.files[-1]) as f:
             line = f.readline()
@@ -349,3 +633,205 @@ class TestBtrfs(unittest.TestCase):
                     tsk.add((os.path.relpath(fpath, self.rec_dir), h))
         
         self.assertEqual(stat, tsk)
+
+    ##
+    # test if TSK maps the files to the same blocks as the kernel
+    # @details The extents of all regular files are read with FIEMAP in one
+    # pass over the mounted image and compared in batches with the block runs
+    # of istat -r, which are read in parallel, so only a batch is kept in
+    # memory. Files with extents that are not plain blocks (inline, compressed,
+    # unwritten, ...) are not compared, the test is skipped if no file is left.
+    # On btrfs, the physical address of FIEMAP is an address of the logical
+    # address space of the chunk tree, not an offset in a member image. TSK
+    # addresses the blocks of btrfs in the same logical address space (which
+    # spans all members of raid images), so the runs are compared as they are;
+    # every run of TSK is checked to lie in a chunk of the chunk map.
+    #
+    def test_extents(self):
+        if not self.mounted and not self.served:
+            self.skipTest("image not mounted")
+        bsize = os.statvfs(self.fs_path).f_bsize
+        inodes = self.index_field(self.tsk, 1)
+        try:
+            reader = btrfsreader.BtrfsReader(self.files[0:-1])
+        except btrfsreader.BtrfsReaderError as e:
+            self.fail("could not read the chunk map: " + str(e))
+
+        def kernel_runs(extents):
+            runs = list()
+            for logical, physical, length, flags in extents:
+                if flags & self.fac.FIEMAP_EXTENT_NOT_BLOCKS:
+                    return None
+                runs.append((logical // bsize, physical // bsize, -(-length // bsize)))
+            return self.merge_runs(runs)
+
+        def tsk_runs(inode):
+            try:
+                out = self.executor.check_output(['istat', '-r', self.files[0], str(inode)],
+                                                 stderr=subprocess.DEVNULL)
+            except subprocess.CalledProcessError:
+                return None
+            runs = list()
+            logical = 0
+            for start, length, sparse in self.parser.parse_istat_runs(out):
+                if not sparse:
+                    runs.append((logical, start, length))
+                logical += length
+            return self.merge_runs(runs)
+
+        compared = 0
+        ndiffering = 0
+        differing = list()
+        unmapped = list()
+        # only the sampled files in the sampling mode
+        paths = sorted(inodes) if self.sample is not None else None
+        files = ((p, kernel_runs(e)) for p, e in self.fac.extent_map(self.fs_path, paths))
+        # paths listed by TSK with a single inode, with plain extents
+        files = ((p, r) for p, r in files if r is not None and isinstance(inodes.get(p), int))
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.extent_workers) as pool:
+                while True:
+                    batch = list(itertools.islice(files, self.extent_batch))
+                    if not batch:
+                        break
+                    for (p, runs), tsk in zip(batch, pool.map(tsk_runs,
+                                                              [inodes[p] for p, r in batch])):
+                        compared += 1
+                        if tsk is not None and len(unmapped) < self.max_diff:
+                            unmapped += [(p, run) for run in tsk if not reader.mapped(
+                                run[1] * bsize, run[2] * bsize)]
+                        if runs != tsk:
+                            ndiffering += 1
+                            if len(differing) < self.max_diff:
+                                differing.append((p, runs, tsk))
+        finally:
+            reader.close()
+
+        if unmapped:
+            msg = "block runs of TSK outside the logical address space of btrfs"
+            for p, run in unmapped[0:self.max_diff]:
+                msg += "\n! {}: {!r}".format(p, run)
+            self.fail(msg)
+        if compared == 0:
+            self.skipTest("no file with plain block extents (inline, compressed, ...)")
+        if ndiffering:
+            msg = "{} of {} files with differing block runs".format(ndiffering, compared)
+            for p, runs, tsk in differing:
+                msg += "\n! {}: {!r} != {!r}".format(p, runs, tsk)
+            self.fail(msg)
+
+    ##
+    # merge adjacent block runs
+    #
+    # @param runs list of (logical block, physical block, length) tuples
+    # @return sorted list of merged runs
+    #
+    @staticmethod
+    def merge_runs(runs):
+        merged = list()
+        for logical, physical, length in sorted(runs):
+            if merged and merged[-1][0] + merged[-1][2] == logical and \
+                    merged[-1][1] + merged[-1][2] == physical:
+                merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + length)
+            else:
+                merged.append((logical, physical, length))
+        return merged
+
+    ##
+    # test if TSK lists the deleted files
+    # @details Only the files deleted by the scaled deleted-file profile are
+    # checked, their names have to be listed by fls -d. Whether their content
+    # can still be recovered is measured by bench_deleted.py.
+    #
+    def test_deleted_files(self):
+        stat = dict((p, 'deleted') for p in
+                    self.fac.read_manifest(self.files[-1], 'deleted'))
+        if not stat:
+            self.skipTest("no deleted files recorded for this image")
+
+        out = self.executor.check_output(['fls', '-r', '-d', '-p', self.files[0]])
+        tsk = dict((p, 'deleted') for p in self.parser.parse_fls_names(out) if p in stat)
+        self.assertIndexEqual(stat, tsk)
+
+    ##
+    # test if the data of the sparse files matches (by comparing their sparse digests)
+    # @details The data islands are located with the block runs of istat -r
+    # and only their blocks are read with blkcat, the holes (up to a TiB of
+    # zeros) are never read. The sparse digest covers the offsets of the data
+    # blocks; the byte ranges of the islands are compared as well, for the
+    # files of SPARSE_FILES.
+    #
+    def test_sparse_data(self):
+        expected = self.fac.read_manifest(self.files[-1], 'sparse')
+        if not expected:
+            self.skipTest("no sparse files in this image")
+        out = self.executor.check_output(['blkcat', '-s', self.files[0]])
+        bsize = int(out.split(b':')[0])
+        offsets = dict((name, islands) for name, size, islands in self.fac.SPARSE_FILES)
+
+        # byte ranges rounded to blocks, clipped to the size and merged
+        def ranges(extents, size):
+            merged = list()
+            for start, end in sorted(extents):
+                start, end = start - start % bsize, min(size, -(-end // bsize) * bsize)
+                if merged and merged[-1][1] >= start:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            return merged
+
+        stat = dict()
+        for fname, (digest, size) in expected.items():
+            islands = offsets.get(os.path.basename(fname))
+            if islands is not None:
+                islands = ranges([(o, o + self.fac.SPARSE_ISLAND) for o in islands], size)
+            stat[fname] = (digest, size, islands)
+
+        inodes = self.index_field(self.tsk, 1)
+        sizes = self.index_field(self.tsk, 11)
+        tsk = dict()
+        for fname in stat:
+            # missing or listed with several inodes
+            if not isinstance(inodes.get(fname), int) or not isinstance(sizes.get(fname), int):
+                continue
+            size = sizes[fname]
+            out = self.executor.check_output(['istat', '-r', self.files[0], str(inodes[fname])],
+                                             stderr=subprocess.DEVNULL)
+            data = list()
+            extents = list()
+            logical = 0
+            for start, length, sparse in self.parser.parse_istat_runs(out):
+                offset = logical * bsize
+                logical += length
+                if sparse or offset >= size:
+                    continue
+                block = self.executor.check_output(['blkcat', self.files[0], str(start),
+                                                    str(length)], stderr=subprocess.DEVNULL)
+                data.append((offset, block[0:size - offset]))
+                extents.append((offset, offset + length * bsize))
+            tsk[fname] = (self.fac.sparse_digest(size, data), size,
+                          ranges(extents, size) if stat[fname][2] is not None else None)
+
+        self.assertIndexEqual(stat, tsk)
+
+
+##
+# create a test class for an image type
+# @details The class gets its own collected metadata, so several classes can
+# be run in the same process.
+#
+# @param imagetype type of the test image
+# @param custom flag to indicate a custom image
+# @param attrs class attributes to override (e.g. mpath, rec_dir, journal)
+# @return the new test class
+#
+def type_class(imagetype, custom=False, **attrs):
+    attrs.update({
+        'tsk': set(),
+        'stat': set(),
+        'timings': dict(),
+        'setUpClass': classmethod(lambda cls: cls.setUpClassCustom(cls, imagetype, custom)),
+        'tearDownClass': classmethod(lambda cls: cls.tearDownClassCustom(cls, imagetype, custom))
+    })
+    name = 'Test_' + ''.join(c if c.isalnum() else '_' for c in imagetype)
+    return type(name, (TestBtrfs,), attrs)
@@ -1,48 +1,184 @@
 #!/usr/bin/python3
 ################################################################################
-# @file test_btrfs.py
+# @file test_btrfs_all.py
 # @author Gerhard Hechenberger <gerhard.hechenberger@student.tuwien.ac.at>
 # @date 2016-10-17
 # @version 1.0
 #
 # @brief unit test module for all tests
+# @details This script runs the unit tests of all image types of the complete
+# suite (see testimage.IMAGE_TYPES) or of the given image types. The run can
+# be split into shards, e.g. over several CI machines: the image types are
+# distributed deterministically over the shards, balanced by their estimated
+# cost (from a timing file of an earlier run or from the registry), and only
+# the image types of the selected shard are run. Index and count of the shard
+# are taken from the arguments or the environment variables TSK_SHARD_INDEX
+# and TSK_SHARD_COUNT. Every shard writes a JUnit XML file and a timing file,
+# which are merged by junit.py.
+# The progress of a shard is kept in a run journal (see journal.py), which is
+# removed when the shard completed. After an interrupted run, the shard can be
+# resumed: finished image types are skipped (their recorded results are
+# reported again), images and metadata are reused and stale mounts and loop
+# devices of the interrupted run are removed first.
 ################################################################################
 
+import argparse
+import os
+import sys
+import json
+import time
 import unittest
-import test_btrfs_standard
-import test_btrfs_zlib
-import test_btrfs_lzo
-import test_btrfs_mixed
-import test_btrfs_nofeature
-import test_btrfs_nodemin
-import test_btrfs_nodemax
-import test_btrfs_noextref
-import test_btrfs_noskinny
-import test_btrfs_noholes
-import test_btrfs_raid0DM
-import test_btrfs_raid1D
-import test_btrfs_raid1DM
-import test_btrfs_ext2_btrfs
-import test_btrfs_ext3_btrfs
-import test_btrfs_ext4_btrfs
-
-allsuite = unittest.TestSuite([
-    test_btrfs_standard.suite(),
-    test_btrfs_zlib.suite(),
-    test_btrfs_lzo.suite(),
-    test_btrfs_mixed.suite(),
-    test_btrfs_nofeature.suite(),
-    test_btrfs_nodemin.suite(),
-    test_btrfs_nodemax.suite(),
-    test_btrfs_noextref.suite(),
-    test_btrfs_noskinny.suite(),
-    test_btrfs_noholes.suite(),
-    test_btrfs_raid0DM.suite(),
-    test_btrfs_raid1D.suite(),
-    test_btrfs_raid1DM.suite(),
-    test_btrfs_ext2_btrfs.suite(),
-    test_btrfs_ext3_btrfs.suite(),
-    test_btrfs_ext4_btrfs.suite()
-    ])
-
-unittest.TextTestRunner(verbosity=2).run(allsuite)
+import testimage
+import test_btrfs
+import junit
+import journal
+
+
+##
+# main program to run the unit tests
+#
+def main():
+    suite = [t.name for t in testimage.IMAGE_TYPES.values() if t.suite]
+    parser = argparse.ArgumentParser(
+        description="Run the unit tests of all image types, or of one shard of them.")
+    parser.add_argument('types', nargs='*', metavar='type',
+                        help="image types to test (default = all types of the complete suite)")
+    parser.add_argument('--shard-index', type=int,
+                        default=int(os.getenv('TSK_SHARD_INDEX', '0')), metavar='index',
+                        help="index of the shard to run, from 0 (default = $TSK_SHARD_INDEX or 0)")
+    parser.add_argument('--shard-count', type=int,
+                        default=int(os.getenv('TSK_SHARD_COUNT', '1')), metavar='count',
+                        help="number of shards (default = $TSK_SHARD_COUNT or 1)")
+    parser.add_argument('--costs', metavar='file',
+                        help="timing file of an earlier run (see junit.py) to balance the shards")
+    parser.add_argument('-o', metavar='dir',
+                        help="directory of the JUnit XML and timing files (default = " +
+                             junit.RESULT_DIR + " if sharded, else none are written)")
+    parser.add_argument('--list', action='store_true',
+                        help="only print the image types of all shards")
+    parser.add_argument('--journal', metavar='file',
+                        help="journal of the run (default = " +
+                             journal.RunJournal.PATH.format('INDEX') + ")")
+    parser.add_argument('--resume', action='store_true',
+                        help="resume an interrupted run from its journal")
+    args = parser.parse_args()
+
+    for imagetype in args.types:
+        if imagetype not in testimage.IMAGE_TYPES:
+            parser.error("unknown image type " + imagetype)
+    if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+        parser.error("shard index must be between 0 and the shard count - 1")
+    if args.o is None and args.shard_count > 1:
+        args.o = junit.RESULT_DIR
+
+    costs = estimate_costs(args.types or suite, args.costs)
+    shards, loads = partition(args.types or suite, args.shard_count, costs)
+    if args.list:
+        for i, (types, load) in enumerate(zip(shards, loads)):
+            print("shard {} ({:.0f} s): {}".format(i, load, ' '.join(types)))
+        return
+
+    print("shard {} of {} ({:.0f} s estimated): {}".format(
+        args.shard_index, args.shard_count, loads[args.shard_index],
+        ' '.join(shards[args.shard_index])))
+    fname = args.journal or journal.RunJournal.PATH.format(args.shard_index)
+    run_journal = journal.RunJournal(fname, args.resume)
+    success = run_shard(shards[args.shard_index], args.shard_index, args.shard_count, args.o,
+                        run_journal)
+    sys.exit(0 if success else 1)
+
+
+##
+# estimate the cost of every image type
+# @details Measured costs are only taken from a timing file, so all shards
+# get the same estimates on every machine.
+#
+# @param imagetypes list of image types
+# @param fname timing file (merged by junit.py) or None
+# @return dict of image type to cost in seconds
+#
+def estimate_costs(imagetypes, fname=None):
+    measured = dict()
+    if fname is not None:
+        with open(fname) as f:
+            measured = json.load(f).get('costs', dict())
+    costs = dict()
+    for imagetype in imagetypes:
+        itype = testimage.IMAGE_TYPES[imagetype]
+        costs[imagetype] = measured.get(imagetype, itype.build_cost + itype.test_cost)
+    return costs
+
+
+##
+# distribute the image types over the shards
+# @details The image types are assigned longest first to the shard with the
+# least cost so far, ties are broken by name and index, so the result only
+# depends on the arguments.
+#
+# @param imagetypes list of image types
+# @param count number of shards
+# @param costs dict of image type to cost
+# @return tuple of the list of image types per shard and the cost per shard
+#
+def partition(imagetypes, count, costs):
+    shards = [list() for _ in range(count)]
+    loads = [0.0] * count
+    for imagetype in sorted(set(imagetypes), key=lambda t: (-costs[t], t)):
+        i = min(range(count), key=lambda k: (loads[k], k))
+        shards[i].append(imagetype)
+        loads[i] += costs[imagetype]
+    return shards, loads
+
+
+##
+# run the unit tests of the image types of a shard
+#
+# @param imagetypes list of image types
+# @param index index of the shard
+# @param count number of shards
+# @param outdir directory of the JUnit XML and timing files, None for none
+# @param run_journal RunJournal of the shard, None to disable
+# @return True if all tests passed
+#
+def run_shard(imagetypes, index, count, outdir, run_journal=None):
+    suites = list()
+    timings = {'shard': index, 'count': count, 'types': dict()}
+    success = True
+    if run_journal is not None:
+        run_journal.cleanup(test_btrfs.TestBtrfs.fac)
+    for imagetype in imagetypes:
+        recorded = run_journal.result(imagetype) if run_journal is not None else None
+        if recorded is not None:
+            print("skipping finished image type", imagetype)
+        else:
+            cls = test_btrfs.type_class(imagetype, journal=run_journal)
+            runner = unittest.TextTestRunner(verbosity=2, resultclass=junit.JUnitResult)
+            start = time.perf_counter()
+            result = runner.run(unittest.TestLoader().loadTestsFromTestCase(cls))
+            recorded = {'cases': result.cases, 'elapsed': time.perf_counter() - start,
+                        'timings': dict(cls.timings), 'success': result.wasSuccessful()}
+            # failed set-ups (e.g. a full disk) are run again when resumed
+            if run_journal is not None and all(c['classname'] for c in result.cases):
+                run_journal.finish(imagetype, recorded)
+        success = success and recorded['success']
+
+        suites.append(junit.suite_element(imagetype, recorded['cases'], recorded['elapsed']))
+        timings['types'][imagetype] = {'elapsed': recorded['elapsed'],
+                                       'timings': recorded['timings']}
+
+    if outdir is not None:
+        os.makedirs(outdir, exist_ok=True)
+        fname = os.path.join(outdir, "shard-{}".format(index))
+        junit.ElementTree.ElementTree(junit.report_element(suites)).write(
+            fname + '.xml', encoding='utf-8', xml_declaration=True)
+        with open(fname + '.json', 'w') as f:
+            json.dump(timings, f, indent=2, sort_keys=True)
+    # nothing to resume
+    if run_journal is not None and all(run_journal.result(t) for t in imagetypes):
+        run_journal.remove()
+    return success
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+################################################################################
+# @file test_btrfs_corpus.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief unit tests of a corpus of custom images
+# @details This script verifies many custom images (e.g. real-world evidence)
+# in parallel. The images are given as paths or glob patterns, or in a
+# manifest file with one image per line, optionally followed by its md5 file
+# (default [image].md5); empty lines and lines starting with '#' are ignored.
+# A test class is created for every image and run in a process of its own,
+# with its own mount point, recovery directory and loop devices. Every job
+# writes a log file and a JUnit XML file, at the end the results of the corpus
+# are merged into one JUnit report and summed up with their run times. The
+# sampling mode of custom images (TSK_SAMPLE_BUDGET) applies to every image.
+################################################################################
+
+import argparse
+import os
+import sys
+import glob
+import time
+import subprocess
+import unittest
+import concurrent.futures
+import test_btrfs
+import junit
+
+
+##
+# main program to verify a corpus of custom images
+#
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the unit tests of many custom images in parallel.")
+    parser.add_argument('images', nargs='*', metavar='image',
+                        help="custom images or glob patterns of custom images")
+    parser.add_argument('-m', metavar='manifest',
+                        help="file listing one image per line, optionally followed by its "
+                             "md5 file")
+    parser.add_argument('-j', type=int, default=2, metavar='jobs',
+                        help="maximum number of parallel jobs (default = 2)")
+    parser.add_argument('-l', default="logs", metavar='dir',
+                        help="directory of the log files (default = logs)")
+    parser.add_argument('-o', default=junit.RESULT_DIR, metavar='dir',
+                        help="directory of the JUnit XML files (default = " +
+                             junit.RESULT_DIR + ")")
+    parser.add_argument('--metadata-reader', action='store_true',
+                        help="read the expected metadata with btrfsreader.py instead of "
+                             "mounting the images (needs no root)")
+    parser.add_argument('--run', metavar='image', help=argparse.SUPPRESS)
+    parser.add_argument('--md5', metavar='file', help=argparse.SUPPRESS)
+    parser.add_argument('--name', metavar='name', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # job process, started for every image
+    if args.run is not None:
+        sys.exit(0 if run_image(args.run, args.md5, args.name, args.o,
+                                args.metadata_reader) else 1)
+
+    try:
+        corpus = read_corpus(args.images, args.m)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+    if not corpus:
+        parser.error("no images given")
+    if args.j < 1:
+        parser.error("at least one job is needed")
+    if os.getuid() != 0 and not args.metadata_reader:
+        print("ERROR: mounting the images needs root", file=sys.stderr)
+        sys.exit(2)
+
+    os.makedirs(args.l, exist_ok=True)
+    os.makedirs(args.o, exist_ok=True)
+    with concurrent.futures.ThreadPoolExecutor(args.j) as pool:
+        futures = [pool.submit(run_job, i, image, md5, args) for i, (image, md5)
+                   in enumerate(corpus)]
+        results = [f.result() for f in futures]
+
+    suites = print_summary(results)
+    fname = os.path.join(args.o, "corpus.xml")
+    junit.ElementTree.ElementTree(junit.report_element(suites)).write(
+        fname, encoding='utf-8', xml_declaration=True)
+    print("JUnit report written to", fname)
+    sys.exit(0 if all(r['passed'] for r in results) else 1)
+
+
+##
+# read the images of the corpus
+#
+# @param patterns list of image paths or glob patterns
+# @param manifest manifest file, None for none
+# @throw ValueError if an image or md5 file does not exist
+# @return list of (image, md5 file) tuples
+#
+def read_corpus(patterns, manifest=None):
+    corpus = list()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise ValueError("no image matches " + pattern)
+        corpus += [(image, image + ".md5") for image in matches]
+    if manifest is not None:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                fields = line.split()
+                image = fields[0]
+                corpus.append((image, fields[1] if len(fields) > 1 else image + ".md5"))
+    for image, md5 in corpus:
+        if not os.path.isfile(image):
+            raise ValueError("image " + image + " does not exist")
+        if not os.path.isfile(md5):
+            raise ValueError("md5 file " + md5 + " does not exist")
+    return corpus
+
+
+##
+# run the job of an image as a process
+#
+# @param index index of the image in the corpus
+# @param image custom image
+# @param md5 md5 file of the image
+# @param args parsed arguments of the main program
+# @return dict with image, name, log and result file, elapsed time and success
+#
+def run_job(index, image, md5, args):
+    # mount point, recovery directory and files of the job are named after it
+    name = "{:03d}_{}".format(index, ''.join(c if c.isalnum() else '_'
+                                             for c in os.path.basename(image)))
+    log = os.path.join(args.l, name + ".log")
+    cmd = [sys.executable, os.path.abspath(__file__), '--run', image, '--md5', md5,
+           '--name', name, '-o', args.o]
+    if args.metadata_reader:
+        cmd.append('--metadata-reader')
+    print("starting", image)
+    start = time.perf_counter()
+    with open(log, 'w') as f:
+        returncode = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    elapsed = time.perf_counter() - start
+    print("finished", image, "in {:.0f} s:".format(elapsed),
+          "ok" if returncode == 0 else "FAILED (see " + log + ")")
+    return {'image': image, 'name': name, 'log': log, 'xml': os.path.join(args.o, name + ".xml"),
+            'elapsed': elapsed, 'passed': returncode == 0}
+
+
+##
+# run the unit tests of one custom image in this process
+#
+# @param image custom image
+# @param md5 md5 file of the image
+# @param name name of the job
+# @param outdir directory of the JUnit XML file
+# @param metadata_reader flag to read the metadata without mounting the image
+# @return True if all tests passed
+#
+def run_image(image, md5, name, outdir, metadata_reader=False):
+    cls = test_btrfs.type_class(image, custom=True, custom_md5=md5,
+                                metadata_reader=metadata_reader,
+                                mpath=test_btrfs.TestBtrfs.mpath + "_" + name,
+                                rec_dir=test_btrfs.TestBtrfs.rec_dir + "_" + name)
+    runner = unittest.TextTestRunner(verbosity=2, resultclass=junit.JUnitResult)
+    start = time.perf_counter()
+    result = runner.run(unittest.TestLoader().loadTestsFromTestCase(cls))
+    elapsed = time.perf_counter() - start
+    suite = junit.suite_element(image, result.cases, elapsed)
+    junit.ElementTree.ElementTree(junit.report_element([suite])).write(
+        os.path.join(outdir, name + ".xml"), encoding='utf-8', xml_declaration=True)
+    try:
+        os.rmdir(cls.mpath)
+    except OSError:
+        pass
+    return result.wasSuccessful()
+
+
+##
+# print the results of the corpus
+#
+# @param results list of job results (see run_job)
+# @return list of the testsuite elements of the images
+#
+def print_summary(results):
+    suites = list()
+    print()
+    print("{:<40} {:>6} {:>6} {:>6} {:>8} {:>10}  {}".format(
+        'image', 'tests', 'fail', 'error', 'timeout', 'elapsed s', 'result'))
+    for r in results:
+        tests = failures = errors = timeouts = '-'
+        if os.path.isfile(r['xml']):
+            suite = junit.merge_xml([r['xml']]).find('testsuite')
+            suites.append(suite)
+            tests, failures, errors = suite.get('tests'), suite.get('failures'), suite.get('errors')
+            timeouts = sum(1 for e in suite.iter('error') if e.get('type') in ('timeout', 'limit'))
+        print("{:<40} {:>6} {:>6} {:>6} {:>8} {:>10.0f}  {}".format(
+            r['image'][-40:], tests, failures, errors, timeouts, r['elapsed'],
+            "ok" if r['passed'] else "FAILED"))
+    passed = sum(1 for r in results if r['passed'])
+    print("{} of {} images passed, {:.0f} s in total, {:.0f} s for the slowest image".format(
+        passed, len(results), sum(r['elapsed'] for r in results),
+        max(r['elapsed'] for r in results)))
+    return suites
+
+
+# start the program
+if __name__ == '__main__':
+    main()
@@ -10,25 +10,33 @@
 # It inherits its test functions from its parent and provides functions to run
 # on its own or return a test suite to another script. The custom image have to
 # consist of an IMAGE.img and a corresponding IMAGE.img.md5 file and have to be
-# stated using its absolute or relative path in the parameters.
+# stated using its absolute or relative path in the parameters (or in the
+# environment variable TSK_CUSTOM_IMAGE). For very large images, set
+# TSK_SAMPLE_BUDGET to a time budget in seconds to verify only a stratified
+# random sample of the files (seeded by TSK_SAMPLE_SEED).
 ################################################################################
 
+import os
 import unittest
+import execution
 import test_btrfs
 
+# path of the custom image
+IMAGE = os.getenv('TSK_CUSTOM_IMAGE', "./btrfs_custom.img")
+
 
 class TestBtrfsCustom(test_btrfs.TestBtrfs):
     @classmethod
     def setUpClass(cls):
-        super().setUpClassCustom(cls, "./btrfs_custom.img", True)
+        super().setUpClassCustom(cls, IMAGE, True)
     
     @classmethod
     def tearDownClass(cls):
-        super().tearDownClassCustom(cls, "./btrfs_custom.img", True)
+        super().tearDownClassCustom(cls, IMAGE, True)
 
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TestBtrfsCustom)
 
 if __name__ == '__main__':
-    unittest.TextTestRunner(verbosity=2).run(suite())
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
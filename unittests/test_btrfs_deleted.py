@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+################################################################################
+# @file test_btrfs_deleted.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief unit test module using an btrfs image with thousands of deleted files
+# @details This test class represents a unit test using a standard btrfs
+# image, on which thousands of files of mixed sizes were created and deleted
+# (ImageFactory.DELETED_FILES). Besides the standard tests, the deleted files
+# have to be listed by TSK. It inherits its test functions from its parent and
+# provides functions to run on its own or return a test suite to another
+# script.
+################################################################################
+
+import unittest
+import execution
+import test_btrfs
+
+
+class BtrfsDeleted(test_btrfs.TestBtrfs):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClassCustom(cls, "btrfs_deleted")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClassCustom(cls, "btrfs_deleted")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BtrfsDeleted)
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
@@ -12,6 +12,7 @@
 ################################################################################
 
 import unittest
+import execution
 import test_btrfs
 
 
@@ -29,4 +30,4 @@ def suite():
     return unittest.TestLoader().loadTestsFromTestCase(BtrfsExt3Btrfs)
 
 if __name__ == '__main__':
-    unittest.TextTestRunner(verbosity=2).run(suite())
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
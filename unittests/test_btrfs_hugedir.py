@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+################################################################################
+# @file test_btrfs_hugedir.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief unit test module using a btrfs image with a huge directory
+# @details This test class represents a unit test using a standard btrfs image
+# with a directory of many entries. It inherits its test functions from its
+# parent and provides functions to run on its own or return a test suite to
+# another script.
+################################################################################
+
+import unittest
+import execution
+import test_btrfs
+
+
+class BtrfsHugedir(test_btrfs.TestBtrfs):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClassCustom(cls, "btrfs_hugedir")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClassCustom(cls, "btrfs_hugedir")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BtrfsHugedir)
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
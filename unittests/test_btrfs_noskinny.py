@@ -13,6 +13,7 @@
 ################################################################################
 
 import unittest
+import execution
 import test_btrfs
 
 
@@ -30,4 +31,4 @@ def suite():
     return unittest.TestLoader().loadTestsFromTestCase(BtrfsSkinny)
 
 if __name__ == '__main__':
-    unittest.TextTestRunner(verbosity=2).run(suite())
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+################################################################################
+# @file test_btrfs_raid5.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief unit test module using an btrfs image with raid 5
+# @details This test class represents a unit test using a btrfs image with
+# raid 5 enabled for data and meta data over 4 devices (or the number set in
+# ImageFactory.RAID_DEVICES). It inherits its test functions from its parent
+# and provides functions to run on its own or return a test suite to another
+# script.
+################################################################################
+
+import unittest
+import execution
+import test_btrfs
+
+
+class BtrfsRaid5(test_btrfs.TestBtrfs):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClassCustom(cls, "btrfs_raid5")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClassCustom(cls, "btrfs_raid5")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BtrfsRaid5)
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
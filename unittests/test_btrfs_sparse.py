@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+################################################################################
+# @file test_btrfs_sparse.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief unit test module using an btrfs image with sparse files of TiB size
+# @details This test class represents a unit test using a btrfs image with
+# sparse files of up to 1 TiB, holding small data islands right below and
+# above 4 GiB and 1 TiB, which tests the handling of large file offsets. The
+# files are not recovered, their data is checked by streaming it with icat. It
+# inherits its test functions from its parent and provides functions to run on
+# its own or return a test suite to another script.
+################################################################################
+
+import unittest
+import execution
+import test_btrfs
+
+
+class BtrfsSparse(test_btrfs.TestBtrfs):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClassCustom(cls, "btrfs_sparse")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClassCustom(cls, "btrfs_sparse")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BtrfsSparse)
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
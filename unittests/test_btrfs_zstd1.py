@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+################################################################################
+# @file test_btrfs_zstd1.py
+# @author agent <agent@local>
+# @date 2026-10-18
+# @version 1.0
+#
+# @brief unit test module using a zstd compressed btrfs image
+# @details This test class represents a unit test using a zstd compressed btrfs
+# image (compression level 1). It inherits its test functions from its parent
+# and provides functions to run on its own or return a test suite to another
+# script.
+################################################################################
+
+import unittest
+import execution
+import test_btrfs
+
+
+class BtrfsZstd1(test_btrfs.TestBtrfs):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClassCustom(cls, "btrfs_zstd1")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClassCustom(cls, "btrfs_zstd1")
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BtrfsZstd1)
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2, resultclass=execution.ExecutionResult).run(suite())
@@ -8,16 +8,26 @@
 # @brief test image creation script for btrfs
 # @details This script creates file system images for testing a btrfs implemen-
 # tation. Size of the image and the test-type can be chosen, the filenames
-# correspond to the test-types ([type].img or [type].x.img for raid with x as 1
-# or 2). All created files are hashed as md5-sums, these are written to an extra
-# file named [image-name].md5. Also the complete image file is hashed and saved
-# to this file (this process can take some time, according to the image size).
+# correspond to the test-types ([type].img or [type].x.img for raid with x from
+# 1 to the number of devices). All created files are hashed as md5-sums, these
+# are written to an extra file named [image-name].md5. Also the complete image
+# file is hashed and saved to this file (this process can take some time,
+# according to the image size, the members of raid images are created and
+# hashed in parallel).
+# The extent count of every file (as reported by FIEMAP) is written to an extra
+# section of this file. Sparse files of TiB size with small data islands at
+# large offsets are not hashed as a whole: their digest is calculated from the
+# written islands and written to another section. The sums of the files
+# deleted by the scaled deleted-file profile are kept in a section as well.
 # For the images, various different types are supported:
 # - ext4            ext4 as a reference
 # - btrfs           btrfs with standard features (as in 3.18, needs 3.10)
 # - btrfs_nofeature btrfs with filesystem features disabled
 # - btrfs_zlib      fully zlib compressed standard btrfs
 # - btrfs_lzo       fully lzo compressed standard btrfs
+# - btrfs_zstd      fully zstd compressed standard btrfs (default level, needs 4.14)
+# - btrfs_zstd1     fully zstd compressed standard btrfs, level 1 (needs 5.1)
+# - btrfs_zstd15    fully zstd compressed standard btrfs, level 15 (needs 5.1)
 # - btrfs_mixed     standard btrfs in mixed mode
 # - btrfs_nodemin   standard btrfs with minimum inode size
 # - btrfs_nodemax   standard btrfs with maximum inode size
@@ -27,9 +37,37 @@
 # - btrfs_raid0DM   standard btrfs raid 0 for data and metadata
 # - btrfs_raid1D    standard btrfs raid 1 for data only
 # - btrfs_raid1DM   standard btrfs raid 1 for data and metadata
+# - btrfs_raid10    standard btrfs raid 10 for data and metadata (4 or more devices)
+# - btrfs_raid5     standard btrfs raid 5 for data and metadata (needs 3.19)
+# - btrfs_raid6     standard btrfs raid 6 for data and metadata (needs 3.19)
 # - ext2_btrfs      created as ext2 and converted to standard btrfs
-# - ext3_btrfs      created as ext2 and converted to standard btrfs
-# - ext4_btrfs      created as ext2 and converted to standard btrfs
+# - ext3_btrfs      created as ext3 and converted to standard btrfs
+# - ext4_btrfs      created as ext4 and converted to standard btrfs
+# - btrfs_hugedir   standard btrfs with a directory of many entries
+# - btrfs_fragmented standard btrfs with heavily fragmented files
+# - btrfs_snapshots standard btrfs with many subvolumes and snapshots
+# - btrfs_reference standard btrfs with the same files as the ext4 reference
+# - btrfs_sparse    standard btrfs with sparse files of TiB size
+# - btrfs_deleted   standard btrfs with thousands of deleted files
+# All types are declared in the registry IMAGE_TYPES (mkfs and mount options,
+# device count, population steps, needed kernel and tools, estimated cost).
+# The content of the created files can be chosen per file class (inline,
+# standard and big files): either the default line pattern, or a seeded pseudo-
+# random payload with configurable entropy, which is not compressible and
+# therefore exercises the decompression of compressed images.
+# Created images can be packed into a compact archive, which stores only the
+# data extents of the image files (compressed with zlib or lzma) and the md5
+# file. Archives are restored as sparse files and can be verified against the
+# md5 file without restoring them.
+# All external tools run with timeouts and resource limits (see execution.py),
+# a hanging mount releases its loop devices and a hanging umount is detached
+# lazily.
+# Several image types (or 'all' types of the test suite) can be built in one
+# call, up to --jobs of them in parallel, each in a process of its own with
+# its own mount point and a log file; progress and estimated remaining time
+# are printed per build. The md5 file is written under a temporary name and
+# renamed when the image is complete; the batch build removes images without
+# md5 file, they are left over from a failed build.
 # The contained class can be used to create images from other scripts.
 ################################################################################
 
@@ -37,62 +75,133 @@ import argparse
 from argparse import RawTextHelpFormatter
 import os
 import sys
+import shutil
+import collections
 import stat
 import subprocess
 import hashlib
 import socket
+import random
+import struct
+import fcntl
+import errno
+import json
+import zlib
+import lzma
+import time
+import signal
+import threading
+import concurrent.futures
+import execution
 
 
 ##
 # main program to support stand-alone script usage
 #
 def main():
-    # list of permitted image types
-    types = ['ext4', 'btrfs', 'btrfs_zlib', 'btrfs_lzo', 'btrfs_mixed',
-             'btrfs_nofeature', 'btrfs_nodemin', 'btrfs_nodemax',
-             'btrfs_noextref', 'btrfs_noskinny', 'btrfs_noholes',
-             'btrfs_raid0DM', 'btrfs_raid1D', 'btrfs_raid1DM', 'ext2_btrfs',
-             'ext3_btrfs', 'ext4_btrfs']
-
     # parse arguments
     parser = argparse.ArgumentParser(
         description="This script creates file system images for testing a btrfs implementation. "
                     "Size of the image and the test-type can be choosen, the filenames correspond "
-                    "to the test-types ([type].img or [type].x.img for raid with x as 1 or 2). All "
+                    "to the test-types ([type].img or [type].x.img for raid with x from 1 to the number "
+                    "of devices, see -m). All "
                     "created files are hashed as md5-sums, these are written to an extra file named "
                     "[image-name].md5. Also the complete image is hashed and saved to this file "
                     "(this process can take some time, according to the image size). Supported types "
-                    "are:\n"
-                    "ext4            ext4 as a reference\n"
-                    "btrfs           btrfs with standard features (as in 3.18, needs 3.10)\n"
-                    "btrfs_nofeature btrfs with filesystem features disabled\n"
-                    "btrfs_zlib      fully zlib compressed standard btrfs\n"
-                    "btrfs_lzo       fully lzo compressed standard btrfs\n"
-                    "btrfs_mixed     standard btrfs in mixed mode\n"
-                    "btrfs_nodemin   standard btrfs with minimum inode size\n"
-                    "btrfs_nodemax   standard btrfs with maximun inode size\n"
-                    "btrfs_noextref  standard btrfs without option extref (needs 3.7)\n"
-                    "btrfs_noskinny  standard btrfs without option skinny-metadata (needs 3.10)\n"
-                    "btrfs_noholes   standard btrfs with option no-holes (needs 3.14)\n"
-                    "btrfs_raid0DM   standard btrfs raid 0 for data and metadata\n"
-                    "btrfs_raid1D    standard btrfs raid 1 for data only\n"
-                    "btrfs_raid1DM   standard btrfs raid 1 for data and metadata\n"
-                    "ext2_btrfs      created as ext2 and converted to standard btrfs\n"
-                    "ext3_btrfs      created as ext2 and converted to standard btrfs\n"
-                    "ext4_btrfs      created as ext2 and converted to standard btrfs",
+                    "are:\n" +
+                    "\n".join("{:<16} {}".format(t.name, t.description)
+                              for t in IMAGE_TYPES.values()),
         formatter_class=RawTextHelpFormatter)
     parser.add_argument('-s', type=int, default=5, metavar='size',
                         help="size of the image in GiB (default = 5)")
-    parser.add_argument('type', metavar='type', choices=types,
-                        help="image type, choose from the listed above")
+    parser.add_argument('-p', action='append', default=[], metavar='class=mode',
+                        help="payload of the created files, mode is 'pattern' (default) or "
+                             "'random', class is one of " + ', '.join(Payload.CLASSES) +
+                             " or 'all' (can be given multiple times)")
+    parser.add_argument('-e', type=float, default=1.0, metavar='entropy',
+                        help="fraction of random bytes in random payloads (default = 1.0)")
+    parser.add_argument('--seed', type=int, default=0, metavar='seed',
+                        help="seed of random payloads (default = 0)")
+    parser.add_argument('-n', type=int, default=ImageFactory.HUGEDIR_ENTRIES, metavar='entries',
+                        help="number of entries in the huge directory (default = " +
+                             str(ImageFactory.HUGEDIR_ENTRIES) + ")")
+    parser.add_argument('-m', type=int, metavar='devices',
+                        help="number of devices of raid10, raid5 and raid6 images "
+                             "(default = 4)")
+    parser.add_argument('-d', default="", metavar='dir',
+                        help="directory of the images (default = current directory)")
+    parser.add_argument('--pack', metavar='archive',
+                        help="pack the existing images of the type into an archive")
+    parser.add_argument('--unpack', metavar='archive',
+                        help="restore the images of an archive as sparse files")
+    parser.add_argument('--verify', metavar='archive',
+                        help="verify the images of an archive against its md5 file")
+    parser.add_argument('-c', default='zlib', choices=ImageArchive.METHODS, metavar='method',
+                        help="compression of packed archives, zlib (default) or lzma")
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='jobs',
+                        help="maximum number of images built in parallel, each one in a "
+                             "process with its own mount point (default = 1)")
+    parser.add_argument('-l', default=BatchBuild.LOG_DIR, metavar='dir',
+                        help="directory of the build logs of several images (default = " +
+                             BatchBuild.LOG_DIR + ")")
+    parser.add_argument('--build', metavar='type', help=argparse.SUPPRESS)
+    parser.add_argument('types', metavar='type', nargs='*',
+                        help="image types, choose from the listed above, or 'all' for the "
+                             "types of the complete test suite")
     args = parser.parse_args()
+    types = list()
+    for t in args.types:
+        if t == 'all':
+            types += [name for name, itype in IMAGE_TYPES.items() if itype.suite]
+        elif t in IMAGE_TYPES:
+            types.append(t)
+        else:
+            parser.error("unknown image type " + t)
+    types = list(collections.OrderedDict.fromkeys(types))
+    if not types and args.unpack is None and args.verify is None and args.build is None:
+        parser.error("the image type is required")
+    if args.pack is not None and len(types) != 1:
+        parser.error("exactly one image type can be packed")
 
     # create a new image from factory class
     fac = ImageFactory(False)
+    fac.HUGEDIR_ENTRIES = args.n
+    fac.RAID_DEVICES = args.m
     try:
-        fac.create(args.type, size=args.s, fast=False)
+        payload = Payload.from_args(args.p, args.e, args.seed)
+        if args.unpack is not None:
+            ImageArchive.unpack(args.unpack, args.d)
+        elif args.verify is not None:
+            if not ImageArchive.verify(args.verify):
+                print("ERROR: archive does not match its md5 file", file=sys.stderr)
+                sys.exit(1)
+        elif args.pack is not None:
+            fac.pack(types[0], args.d, args.pack, args.c)
+        elif args.build is not None:
+            # process of a batch build, on a mount point of its own
+            signal.signal(signal.SIGTERM, BatchBuild.terminate)
+            fac.MOUNT_PATH = ImageBuild(IMAGE_TYPES[args.build], 0).mpath
+            fac.create(args.build, size=args.s, fast=False, imagedir=args.d, payload=payload)
+        elif len(types) > 1:
+            # the options of the build processes
+            options = ['-s', str(args.s), '-e', str(args.e), '--seed', str(args.seed),
+                       '-n', str(args.n)]
+            for p in args.p:
+                options += ['-p', p]
+            if args.m is not None:
+                options += ['-m', str(args.m)]
+            batch = BatchBuild(fac, types, args.jobs, args.d, args.l, options)
+            batch.run()
+            batch.print_summary()
+            if not batch.succeeded:
+                sys.exit(1)
+        else:
+            fac.create(types[0], size=args.s, fast=False, imagedir=args.d, payload=payload)
+    except ValueError as e:
+        parser.error(str(e))
     except ImageCreationError as e:
         print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
 
 
 ##
@@ -102,6 +211,618 @@ class ImageCreationError(Exception):
     pass
 
 
+##
+# description of an image type
+# @details An image type records everything needed to build and test it: the
+# mkfs command ('{std}' is replaced by the standard btrfs options), the mount
+# options, the number of devices, the population steps, the kernel version and
+# tools it needs and an estimated build and test cost (used by the scheduler
+# until timings of real runs are recorded in the performance history).
+#
+class ImageType:
+    # population steps: standard files, extended (btrfs) files, deleted files,
+    # conversion to btrfs and the stress profiles
+    STEPS = ('std', 'ext', 'deleted', 'convert', 'hugedir', 'fragmented', 'snapshots',
+             'sparse', 'deleted_many')
+
+    ##
+    # constructor
+    #
+    # @param name name of the image type
+    # @param description one-line description
+    # @param mkfs mkfs command without the devices
+    # @param mount tuple of mount options
+    # @param devices number of devices (image files)
+    # @param min_devices minimum number of devices if the number can be
+    #        changed (ImageFactory.RAID_DEVICES), None for a fixed number
+    # @param populate tuple of population steps, in order
+    # @param kernel minimum kernel version as tuple
+    # @param tools tuple of additionally needed programs
+    # @param params names of ImageFactory constants the image depends on
+    # @param build_cost estimated build time in seconds
+    # @param test_cost estimated test time in seconds
+    # @param suite flag to include the type in the complete test suite
+    # @param recover flag to recover all files in the tests (tsk_recover would
+    #        write the holes of sparse files of TiB size)
+    # @throw ValueError if received an invalid parameter
+    # @return a new instance of this class
+    #
+    def __init__(self, name, description, mkfs, mount=(), devices=1, min_devices=None,
+                 populate=('std', 'ext', 'deleted'), kernel=(3, 10), tools=(), params=(),
+                 build_cost=60, test_cost=120, suite=True, recover=True):
+        for step in populate:
+            if step not in self.STEPS:
+                raise ValueError("unknown population step " + step)
+        self.name = name
+        self.description = description
+        self.mkfs = tuple(mkfs)
+        self.mount = tuple(mount)
+        self.devices = devices
+        self.min_devices = min_devices
+        self.populate = tuple(populate)
+        self.kernel = kernel
+        self.tools = (self.mkfs[0],) + tuple(tools)
+        self.params = tuple(params)
+        self.build_cost = build_cost
+        self.test_cost = test_cost
+        self.suite = suite
+        self.recover = recover
+
+    ##
+    # create the filenames of the image type
+    #
+    # @param devices number of devices (None = default of the type)
+    # @return the created names, one per device and one for the hashfile
+    #
+    def names(self, devices=None):
+        devices = devices or self.devices
+        if devices > 1:
+            names = [self.name + '.' + str(i) + '.img' for i in range(1, devices + 1)]
+        else:
+            names = [self.name + '.img']
+        names.append(self.name + ".img.md5")
+        return tuple(names)
+
+    ##
+    # create the mkfs command
+    #
+    # @param std_opt standard options for btrfs
+    # @param devs list of devices
+    # @return the command as list
+    #
+    def mkfs_command(self, std_opt, devs):
+        return [arg.format(std=std_opt) for arg in self.mkfs] + list(devs)
+
+    ##
+    # check if the image type can be created on this host
+    #
+    # @return None if supported, else the reason
+    #
+    def unsupported(self):
+        try:
+            release = os.uname().release.split('-')[0]
+            kernel = tuple(int(v) for v in release.split('.')[0:2])
+        except ValueError:
+            kernel = None
+        if kernel is not None and kernel < self.kernel:
+            return "needs kernel " + '.'.join(str(v) for v in self.kernel)
+        for tool in self.tools:
+            if shutil.which(tool) is None:
+                return "needs " + tool
+        return None
+
+
+# registry of all supported image types
+IMAGE_TYPES = collections.OrderedDict((t.name, t) for t in [
+    # the reference is not part of the suite, its directories have a size on
+    # ext4 (the btrfs tests expect the zero size of fix_size)
+    ImageType('ext4', "ext4 as a reference",
+              ['mkfs.ext4'], populate=('std', 'deleted'), kernel=(3, 0), suite=False),
+    ImageType('btrfs', "btrfs with standard features (as in 3.18, needs 3.10)",
+              ['mkfs.btrfs', '{std}']),
+    ImageType('btrfs_nofeature', "btrfs with filesystem features disabled",
+              ['mkfs.btrfs', '-O^extref,^skinny-metadata']),
+    ImageType('btrfs_zlib', "fully zlib compressed standard btrfs",
+              ['mkfs.btrfs', '{std}'], mount=('compress-force=zlib',), build_cost=90),
+    ImageType('btrfs_lzo', "fully lzo compressed standard btrfs",
+              ['mkfs.btrfs', '{std}'], mount=('compress-force=lzo',), build_cost=70),
+    ImageType('btrfs_zstd', "fully zstd compressed standard btrfs (default level, needs 4.14)",
+              ['mkfs.btrfs', '{std}'], mount=('compress-force=zstd',), kernel=(4, 14),
+              build_cost=80),
+    ImageType('btrfs_zstd1', "fully zstd compressed standard btrfs, level 1 (needs 5.1)",
+              ['mkfs.btrfs', '{std}'], mount=('compress-force=zstd:1',), kernel=(5, 1),
+              build_cost=70),
+    ImageType('btrfs_zstd15', "fully zstd compressed standard btrfs, level 15 (needs 5.1)",
+              ['mkfs.btrfs', '{std}'], mount=('compress-force=zstd:15',), kernel=(5, 1),
+              build_cost=240),
+    ImageType('btrfs_mixed', "standard btrfs in mixed mode",
+              ['mkfs.btrfs', '{std}', '--mixed']),
+    ImageType('btrfs_nodemin', "standard btrfs with minimum inode size",
+              ['mkfs.btrfs', '{std}', '-n4096']),
+    ImageType('btrfs_nodemax', "standard btrfs with maximum inode size",
+              ['mkfs.btrfs', '{std}', '-n65536']),
+    ImageType('btrfs_noextref', "standard btrfs without option extref (needs 3.7)",
+              ['mkfs.btrfs', '-O^extref,skinny-metadata']),
+    ImageType('btrfs_noskinny', "standard btrfs without option skinny-metadata (needs 3.10)",
+              ['mkfs.btrfs', '-Oextref,^skinny-metadata']),
+    ImageType('btrfs_noholes', "standard btrfs with option no-holes (needs 3.14)",
+              ['mkfs.btrfs', '{std},no-holes'], kernel=(3, 14)),
+    ImageType('btrfs_raid0DM', "standard btrfs raid 0 for data and metadata",
+              ['mkfs.btrfs', '{std}', '-draid0', '-mraid0'], devices=2, build_cost=80,
+              test_cost=150),
+    ImageType('btrfs_raid1D', "standard btrfs raid 1 for data only",
+              ['mkfs.btrfs', '{std}', '-draid1', '-mraid0'], devices=2, build_cost=100,
+              test_cost=150),
+    ImageType('btrfs_raid1DM', "standard btrfs raid 1 for data and metadata",
+              ['mkfs.btrfs', '{std}', '-draid1', '-mraid1'], devices=2, build_cost=100,
+              test_cost=150),
+    ImageType('btrfs_raid10', "standard btrfs raid 10 for data and metadata (4 or more devices)",
+              ['mkfs.btrfs', '{std}', '-draid10', '-mraid10'], devices=4, min_devices=4,
+              build_cost=150, test_cost=200),
+    ImageType('btrfs_raid5', "standard btrfs raid 5 for data and metadata (needs 3.19)",
+              ['mkfs.btrfs', '{std}', '-draid5', '-mraid5'], devices=4, min_devices=3,
+              kernel=(3, 19), build_cost=150, test_cost=200),
+    ImageType('btrfs_raid6', "standard btrfs raid 6 for data and metadata (needs 3.19)",
+              ['mkfs.btrfs', '{std}', '-draid6', '-mraid6'], devices=4, min_devices=4,
+              kernel=(3, 19), build_cost=150, test_cost=200),
+    ImageType('ext2_btrfs', "created as ext2 and converted to standard btrfs",
+              ['mkfs.ext2'], populate=('std', 'deleted', 'convert', 'ext'),
+              tools=('btrfs-convert',), build_cost=120),
+    ImageType('ext3_btrfs', "created as ext3 and converted to standard btrfs",
+              ['mkfs.ext3'], populate=('std', 'deleted', 'convert', 'ext'),
+              tools=('btrfs-convert',), build_cost=120),
+    ImageType('ext4_btrfs', "created as ext4 and converted to standard btrfs",
+              ['mkfs.ext4'], populate=('std', 'deleted', 'convert', 'ext'),
+              tools=('btrfs-convert',), build_cost=120),
+    ImageType('btrfs_hugedir', "standard btrfs with a directory of many entries",
+              ['mkfs.btrfs', '{std}'], populate=('std', 'hugedir'), params=('HUGEDIR_ENTRIES',),
+              build_cost=300, test_cost=900, suite=False),
+    ImageType('btrfs_fragmented', "standard btrfs with heavily fragmented files",
+              ['mkfs.btrfs', '{std}'], populate=('std', 'fragmented'),
+              params=('FRAGMENTED_FILES', 'FRAGMENTED_SIZE', 'FRAGMENT_SIZE',
+                      'FRAGMENT_OVERWRITES', 'FRAGMENT_SEED'), build_cost=120),
+    ImageType('btrfs_snapshots', "standard btrfs with many subvolumes and snapshots",
+              ['mkfs.btrfs', '{std}'], populate=('std', 'snapshots'),
+              params=('SNAPSHOT_SUBVOLUMES', 'SNAPSHOT_COUNT'), build_cost=600, test_cost=1800,
+              suite=False),
+    ImageType('btrfs_reference', "standard btrfs with the same files as the ext4 reference",
+              ['mkfs.btrfs', '{std}'], populate=('std', 'deleted'), suite=False),
+    ImageType('btrfs_sparse', "standard btrfs with sparse files of TiB size",
+              ['mkfs.btrfs', '{std}'], populate=('sparse',),
+              params=('SPARSE_FILES', 'SPARSE_ISLAND'), build_cost=30, test_cost=1800,
+              suite=False, recover=False),
+    ImageType('btrfs_deleted', "standard btrfs with thousands of deleted files",
+              ['mkfs.btrfs', '{std}'], populate=('std', 'deleted_many'),
+              params=('DELETED_FILES', 'DELETED_SIZES', 'DELETED_CHURN', 'DELETED_SEED'),
+              build_cost=120, test_cost=300, suite=False),
+])
+
+
+##
+# class used to generate the content of created files
+# @details A payload writes a file of a given size in bulk and hashes the data
+# while writing it. The 'pattern' mode writes zero-padded line numbers (highly
+# compressible), the 'random' mode writes a deterministic pseudo-random stream
+# seeded by the payload seed and the file name. The entropy level sets the
+# fraction of random bytes in every block, the rest of the block is zeroed.
+#
+class Payload:
+    PATTERN = 'pattern'
+    RANDOM = 'random'
+    MODES = (PATTERN, RANDOM)
+    # file classes a payload can be chosen for
+    CLASSES = ('inline', 'standard', 'big')
+
+    # size of the chunks written at once
+    CHUNK_SIZE = 1024 ** 2
+    # size of the blocks the entropy level is applied to
+    BLOCK_SIZE = 4096
+
+    ##
+    # constructor
+    #
+    # @param mode payload mode, 'pattern' or 'random'
+    # @param entropy fraction of random bytes per block (0.0 to 1.0)
+    # @param seed seed of the random stream
+    # @throw ValueError if received an invalid parameter
+    # @return a new instance of this class
+    #
+    def __init__(self, mode=PATTERN, entropy=1.0, seed=0):
+        if mode not in self.MODES:
+            raise ValueError("unknown payload mode " + str(mode))
+        if not 0.0 <= entropy <= 1.0:
+            raise ValueError("entropy must be between 0.0 and 1.0")
+        self.mode = mode
+        self.entropy = entropy
+        self.seed = seed
+
+    ##
+    # create payloads per file class from command line arguments
+    #
+    # @param specs list of 'class=mode' or 'mode' strings
+    # @param entropy entropy level of random payloads
+    # @param seed seed of random payloads
+    # @throw ValueError if received an invalid parameter
+    # @return dict of file class to payload
+    #
+    @classmethod
+    def from_args(cls, specs, entropy=1.0, seed=0):
+        payload = dict()
+        for spec in specs:
+            fclass, _, mode = spec.rpartition('=')
+            if fclass in ('', 'all'):
+                fclasses = cls.CLASSES
+            elif fclass in cls.CLASSES:
+                fclasses = (fclass,)
+            else:
+                raise ValueError("unknown file class " + fclass)
+            for c in fclasses:
+                payload[c] = cls(mode, entropy, seed)
+        return payload
+
+    ##
+    # write the payload to a file
+    # @details The data is generated and written in chunks, the md5 sum is
+    # calculated on the fly, so the file does not have to be read again.
+    #
+    # @param f file opened in binary mode
+    # @param bsize size of the file in bytes
+    # @param key name used to derive a per-file random stream
+    # @return the md5 sum of the written data in hex digits
+    #
+    def write(self, f, bsize, key=''):
+        hashsum = hashlib.md5()
+        if self.mode == self.PATTERN:
+            chunks = self.__pattern(bsize)
+        else:
+            chunks = self.__random(bsize, key)
+        for chunk in chunks:
+            f.write(chunk)
+            hashsum.update(chunk)
+        return hashsum.hexdigest()
+
+    ##
+    # generate lines of zero-padded line numbers
+    # @details Same content as written by earlier versions: 80 byte lines
+    # followed by '-' padding, 5 bytes shorter than the requested size.
+    #
+    # @param bsize size of the file in bytes
+    # @return generator of data chunks
+    #
+    def __pattern(self, bsize):
+        if bsize <= 5:
+            return
+        lines = (bsize - 5) // 80
+        padding = (bsize - 5) % 80
+        step = self.CHUNK_SIZE // 80
+        for start in range(0, lines, step):
+            end = min(start + step, lines)
+            yield ''.join('{:0<79}'.format(str(i + 1) + ' ') + '\n'
+                          for i in range(start, end)).encode('ascii')
+        if padding > 0:
+            yield b'-' * padding
+
+    ##
+    # generate pseudo-random data with the configured entropy
+    #
+    # @param bsize size of the file in bytes
+    # @param key name used to derive a per-file random stream
+    # @return generator of data chunks
+    #
+    def __random(self, bsize, key):
+        material = hashlib.sha256((str(self.seed) + ':' + key).encode('utf-8')).digest()
+        # one generator on every interpreter, so a seed gives the same payload
+        rnd = random.Random(int.from_bytes(material, 'big'))
+        nrandom = int(round(self.BLOCK_SIZE * self.entropy))
+
+        for start in range(0, bsize, self.CHUNK_SIZE):
+            size = min(self.CHUNK_SIZE, bsize - start)
+            blocks = -(-size // self.BLOCK_SIZE)
+            data = rnd.randbytes(blocks * nrandom)
+
+            if nrandom == self.BLOCK_SIZE:
+                chunk = data
+            else:
+                # spread the random bytes over the blocks, zero the rest
+                chunk = bytearray(blocks * self.BLOCK_SIZE)
+                for b in range(0, blocks):
+                    pos = b * self.BLOCK_SIZE
+                    chunk[pos:pos + nrandom] = data[b * nrandom:(b + 1) * nrandom]
+            yield bytes(chunk[0:size])
+
+
+##
+# class used to pack images into a compact archive
+# @details An archive starts with a magic number, followed by the compressed
+# data chunks of all image files. Only data extents (found with SEEK_DATA and
+# SEEK_HOLE) are stored, chunks containing only zeros are skipped. The index
+# at the end of the archive lists the files with their sizes and chunks
+# (offset, length, position and length in the archive) and contains the md5
+# file of the images. The trailer stores the position of the index.
+#
+class ImageArchive:
+    MAGIC = b'TSKBTRFS'
+    VERSION = 1
+    METHODS = ('zlib', 'lzma')
+    # maximum size of a data chunk (compressed separately)
+    CHUNK_SIZE = 4 * (1024 ** 2)
+    # magic number, position and length of the index
+    TRAILER = struct.Struct('=8sQQ')
+
+    ##
+    # pack image files into an archive
+    #
+    # @param fname name of the archive
+    # @param images list of image files
+    # @param manifest md5 file of the images (None = no md5 file)
+    # @param method compression method, 'zlib' or 'lzma'
+    # @throw ValueError if received an invalid parameter
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    @classmethod
+    def pack(cls, fname, images, manifest=None, method='zlib'):
+        if method not in cls.METHODS:
+            raise ValueError("unknown compression method " + str(method))
+
+        index = {'version': cls.VERSION, 'method': method, 'files': list()}
+        try:
+            with open(fname, 'wb') as out:
+                out.write(cls.MAGIC)
+                for image in images:
+                    entry = {'name': os.path.basename(image), 'size': os.path.getsize(image),
+                             'chunks': list()}
+                    for offset, data in cls.data_chunks(image):
+                        comp = cls.__compress(data, method)
+                        entry['chunks'].append([offset, len(data), out.tell(), len(comp)])
+                        out.write(comp)
+                    index['files'].append(entry)
+
+                if manifest is not None:
+                    with open(manifest) as f:
+                        index['manifest'] = {'name': os.path.basename(manifest),
+                                             'content': f.read()}
+
+                raw = zlib.compress(json.dumps(index).encode('utf-8'))
+                pos = out.tell()
+                out.write(raw)
+                out.write(cls.TRAILER.pack(cls.MAGIC, pos, len(raw)))
+        except (IOError, OSError) as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not pack images")
+
+    ##
+    # restore the image files of an archive as sparse files
+    #
+    # @param fname name of the archive
+    # @param dirname directory where the files are restored
+    # @throw ImageCreationError if something went wrong or a file name of the
+    #        archive is absolute or contains '..'
+    # @return list of restored files
+    #
+    @classmethod
+    def unpack(cls, fname, dirname=""):
+        restored = list()
+        try:
+            with open(fname, 'rb') as f:
+                index = cls.read_index(f)
+                # nothing is written outside the directory
+                names = [entry['name'] for entry in index['files']]
+                if 'manifest' in index:
+                    names.append(index['manifest']['name'])
+                for name in names:
+                    parts = name.replace('\\', '/').split('/')
+                    if not name or os.path.isabs(name) or '..' in parts:
+                        raise ImageCreationError("invalid file name in archive: " + repr(name))
+                for entry in index['files']:
+                    path = os.path.join(dirname, entry['name'])
+                    with open(path, 'wb') as out:
+                        out.truncate(entry['size'])
+                        for offset, length, pos, clen in entry['chunks']:
+                            f.seek(pos)
+                            os.pwrite(out.fileno(),
+                                      cls.__decompress(f.read(clen), index['method']), offset)
+                    restored.append(path)
+
+                if 'manifest' in index:
+                    path = os.path.join(dirname, index['manifest']['name'])
+                    with open(path, 'w') as out:
+                        out.write(index['manifest']['content'])
+                    restored.append(path)
+        except (IOError, OSError, zlib.error, lzma.LZMAError) as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not unpack images")
+        return restored
+
+    ##
+    # verify the images of an archive against the contained md5 file
+    # @details The md5 sums are calculated on the fly from the stored chunks,
+    # holes are hashed as zeros, nothing is written to disk.
+    #
+    # @param fname name of the archive
+    # @throw ImageCreationError if something went wrong
+    # @return True if all image sums match
+    #
+    @classmethod
+    def verify(cls, fname):
+        zeros = bytes(cls.CHUNK_SIZE)
+        try:
+            with open(fname, 'rb') as f:
+                index = cls.read_index(f)
+                if 'manifest' not in index:
+                    raise ImageCreationError("archive contains no md5 file")
+                expected = cls.image_sums(index['manifest']['content'])
+
+                ok = len(index['files']) > 0
+                for entry in index['files']:
+                    hashsum = hashlib.md5()
+                    pos = 0
+                    for offset, length, cpos, clen in sorted(entry['chunks']):
+                        cls.__hash_zeros(hashsum, zeros, offset - pos)
+                        f.seek(cpos)
+                        hashsum.update(cls.__decompress(f.read(clen), index['method']))
+                        pos = offset + length
+                    cls.__hash_zeros(hashsum, zeros, entry['size'] - pos)
+                    if expected.get(entry['name']) != hashsum.hexdigest():
+                        ok = False
+        except (IOError, OSError, zlib.error, lzma.LZMAError) as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not verify images")
+        return ok
+
+    ##
+    # read the index of an archive
+    #
+    # @param f archive opened in binary mode
+    # @throw ImageCreationError if the file is no archive or its index is
+    #        truncated or invalid
+    # @return the index
+    #
+    @classmethod
+    def read_index(cls, f):
+        f.seek(0, os.SEEK_END)
+        if f.tell() < len(cls.MAGIC) + cls.TRAILER.size:
+            raise ImageCreationError("file is no image archive")
+        f.seek(-cls.TRAILER.size, os.SEEK_END)
+        magic, pos, length = cls.TRAILER.unpack(f.read(cls.TRAILER.size))
+        if magic != cls.MAGIC:
+            raise ImageCreationError("file is no image archive")
+        f.seek(pos)
+        try:
+            index = json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+        except (ValueError, zlib.error) as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("invalid archive index")
+        if not isinstance(index, dict):
+            raise ImageCreationError("invalid archive index")
+        if index.get('version') != cls.VERSION:
+            raise ImageCreationError("unsupported archive version")
+        cls.__check_index(index)
+        return index
+
+    ##
+    # check the structure of an archive index
+    # @details The index needs the compression method and the list of files,
+    # every file a name, a size and a list of chunks of four numbers; the md5
+    # file is optional, but needs a name and a content if it is present.
+    #
+    # @param index the index read from the archive
+    # @throw ImageCreationError if a key is missing or has a wrong type
+    # @return None
+    #
+    @classmethod
+    def __check_index(cls, index):
+        def number(value):
+            return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+        if index.get('method') not in cls.METHODS:
+            raise ImageCreationError("invalid archive index: unknown compression method")
+        if not isinstance(index.get('files'), list):
+            raise ImageCreationError("invalid archive index: no file list")
+        for entry in index['files']:
+            if not isinstance(entry, dict) or not isinstance(entry.get('name'), str) or \
+                    not number(entry.get('size')) or not isinstance(entry.get('chunks'), list):
+                raise ImageCreationError("invalid archive index: invalid file entry")
+            for chunk in entry['chunks']:
+                if not isinstance(chunk, list) or len(chunk) != 4 or \
+                        not all(number(value) for value in chunk):
+                    raise ImageCreationError("invalid archive index: invalid chunk of " +
+                                             repr(entry['name']))
+        if 'manifest' in index:
+            manifest = index['manifest']
+            if not isinstance(manifest, dict) or not isinstance(manifest.get('name'), str) or \
+                    not isinstance(manifest.get('content'), str):
+                raise ImageCreationError("invalid archive index: invalid md5 file")
+
+    ##
+    # get the data chunks of a file
+    # @details The data extents are found with SEEK_DATA and SEEK_HOLE and
+    # split into chunks of at most CHUNK_SIZE bytes, chunks containing only
+    # zeros are skipped.
+    #
+    # @param fname name of the file
+    # @return generator of (offset, data) tuples
+    #
+    @classmethod
+    def data_chunks(cls, fname):
+        with open(fname, 'rb') as f:
+            fd = f.fileno()
+            size = os.fstat(fd).st_size
+            pos = 0
+            while pos < size:
+                try:
+                    start = os.lseek(fd, pos, os.SEEK_DATA)
+                except OSError as e:
+                    # no data after pos
+                    if e.errno == errno.ENXIO:
+                        break
+                    raise
+                end = os.lseek(fd, start, os.SEEK_HOLE)
+                for offset in range(start, end, cls.CHUNK_SIZE):
+                    data = os.pread(fd, min(cls.CHUNK_SIZE, end - offset), offset)
+                    if data.strip(b'\0'):
+                        yield offset, data
+                pos = end
+
+    ##
+    # get the image sums of an md5 file
+    #
+    # @param content content of the md5 file
+    # @return dict of image file name to md5 sum
+    #
+    @staticmethod
+    def image_sums(content):
+        sums = dict()
+        section = None
+        for line in content.splitlines():
+            if line.startswith('-'):
+                section = line.lstrip('-').strip() or 'image'
+            elif section == 'image':
+                digest, _, name = line.partition(' ')
+                sums[name.lstrip(' ')] = digest
+        return sums
+
+    ##
+    # compress a chunk
+    #
+    # @param data the chunk
+    # @param method compression method
+    # @return the compressed chunk
+    #
+    @staticmethod
+    def __compress(data, method):
+        if method == 'lzma':
+            return lzma.compress(data, preset=1)
+        return zlib.compress(data, 6)
+
+    ##
+    # decompress a chunk
+    #
+    # @param data the compressed chunk
+    # @param method compression method
+    # @return the chunk
+    #
+    @staticmethod
+    def __decompress(data, method):
+        if method == 'lzma':
+            return lzma.decompress(data)
+        return zlib.decompress(data)
+
+    ##
+    # hash a number of zero bytes
+    #
+    # @param hashsum hash object to update
+    # @param zeros buffer of zero bytes
+    # @param n number of zero bytes
+    # @return None
+    #
+    @staticmethod
+    def __hash_zeros(hashsum, zeros, n):
+        while n > 0:
+            hashsum.update(zeros[0:min(n, len(zeros))])
+            n -= len(zeros)
+
+
 ##
 # class used to create and destroy test images
 #
@@ -111,11 +832,77 @@ class ImageFactory:
     MOUNT_PATH = "/mnt/loop"
     # standard options for btrfs (to keep consistency among versions)
     BTRFS_STD_OPT = '-Oextref,skinny-metadata'
+    # number of devices of raid types with a variable number of devices
+    # (raid10, raid5, raid6), None for the default of the type
+    RAID_DEVICES = None
+    # maximum number of raid members created and hashed at the same time
+    PARALLEL_DEVICES = 8
+    # attach loop devices with direct io (the image is not cached twice),
+    # falls back to buffered io if the backing file system does not support it
+    LOOP_DIRECT_IO = True
+    # number of entries in the directory of huge directory images
+    HUGEDIR_ENTRIES = 100000
+    # number and size of the files of fragmented images
+    FRAGMENTED_FILES = 10
+    FRAGMENTED_SIZE = 4 * (1024 ** 2)
+    # smallest synced append and number of random overwrites in reflinked copies
+    FRAGMENT_SIZE = 4096
+    FRAGMENT_OVERWRITES = 256
+    # seed of the fragmented file content and the overwrite positions
+    FRAGMENT_SEED = 0
+    # number of subvolumes and snapshots of snapshot images
+    SNAPSHOT_SUBVOLUMES = 1000
+    SNAPSHOT_COUNT = 1000
+    # sparse files of sparse images (name, size and offsets of the data islands),
+    # with data right below and above 4 GiB and 1 TiB
+    SPARSE_FILES = (('file_sparse_4g', 2 ** 32 + 2 ** 21, (0, 2 ** 32 - 8192, 2 ** 32 + 2 ** 20)),
+                    ('file_sparse_1t', 2 ** 40 + 2 ** 21,
+                     (0, 2 ** 32 - 8192, 2 ** 40 - 8192, 2 ** 40 + 2 ** 20)))
+    # size of every data island of the sparse files
+    SPARSE_ISLAND = 16384
+    # block size of the digest of sparse files
+    SPARSE_BLOCK = 4096
+    # number, possible sizes and content seed of the files of deleted images
+    DELETED_FILES = 2000
+    DELETED_SIZES = (512, 4096, 65536, 1024 ** 2)
+    DELETED_SEED = 0
+    # fraction of the deleted bytes written again by new files (reuse of the space)
+    DELETED_CHURN = 0.0
+
+    # FIEMAP ioctl (linux/fs.h and linux/fiemap.h)
+    FS_IOC_FIEMAP = 0xC020660B
+    FIEMAP_FLAG_SYNC = 0x1
+    FIEMAP_EXTENT_LAST = 0x1
+    # extents without a plain block mapping (unknown, delayed, encoded,
+    # encrypted, not aligned, inline, tail and unwritten)
+    FIEMAP_EXTENT_NOT_BLOCKS = 0xF8E
+    FIEMAP_HEADER = struct.Struct('=QQIIII')
+    FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+    # losetup -f of parallel threads could pick the same free device, the lock
+    # file serializes it with the other processes of a batch build (opened
+    # without following symlinks)
+    __loop_lock = threading.Lock()
+    LOOP_LOCK_FILE = "/run/lock/testimage_loop.lock"
+    # suffix of the md5 file while it is written, renamed when it is complete
+    PARTIAL_SUFFIX = ".part"
+    # number of values per file in the sections of the md5 file (default 1)
+    MANIFEST_VALUES = {'sparse': 2}
 
     # flag for fast image creation (skip big files)
     f_fast = False
+    # payload per file class, the line pattern is used for missing classes
+    payload = dict()
+    # md5 sums of the files calculated while writing them, by path
+    digests = dict()
+    # size and sparse digest of the sparse files, by path
+    sparse = dict()
+    # md5 sums of the deleted files of deleted images, by path
+    deleted = dict()
     # text output, if None, stdout is used
     out = None
+    # runs the external tools with timeouts and resource limits
+    executor = execution.Executor()
 
     ##
     # constructor
@@ -133,17 +920,23 @@ class ImageFactory:
     # @param size size of the image (standard = 5)
     # @param fast flag to skip big files for fast tests (standard = False)
     # @param imagedir directory where the files should be created
+    # @param payload dict of file class ('inline', 'standard', 'big') to the
+    #        Payload used for these files (standard = line pattern)
     # @throw ValueError if received an invalid parameter
     # @throw ImageCreationError in case something went wrong
     # @return tuple of created files
     #
-    def create(self, imagetype, size=5, fast=False, imagedir=""):
+    def create(self, imagetype, size=5, fast=False, imagedir="", payload=None):
         if imagetype is None or size is None or fast is None or imagedir is None:
             raise ValueError("parameter must not be None")
         if size <= 0:
             raise ValueError("cannot create zero or negative sized image")
 
         self.f_fast = fast
+        self.payload = dict(payload) if payload is not None else dict()
+        self.digests = dict()
+        self.sparse = dict()
+        self.deleted = dict()
         if self.unittest:
             self.out = open(os.devnull, 'w')
 
@@ -157,8 +950,13 @@ class ImageFactory:
         if imagedir != "" and not os.path.exists(imagedir):
             raise ImageCreationError("directory does not exist")
 
+        # check for image type
+        itype = IMAGE_TYPES.get(imagetype)
+        if itype is None:
+            raise ImageCreationError("this type is not supported")
+
         # create image-filenames from imagetype
-        files = self.__type_to_names(imagetype)
+        files = self.names(imagetype)
         filename = list()
         for f in files[0:-1]:
             filename.append(os.path.join(imagedir, f))
@@ -177,94 +975,76 @@ class ImageFactory:
                 raise ImageCreationError("some image files already exist")
 
         # create the image(s) and fill with files 
+        loopdev = []
         try:
-            # create loop devices and files
-            loopdev = []
-            for f in filename:
-                loopdev += [self.__create_image(f, size, uid, gid)]
+            # create loop devices and files, the members of raid images in parallel
+            with concurrent.futures.ThreadPoolExecutor(self.__workers(len(filename))) as pool:
+                futures = [pool.submit(self.__create_image, f, size, uid, gid)
+                           for f in filename]
+                concurrent.futures.wait(futures)
+            # keep the attached devices for the clean-up, then raise the first error
+            loopdev = [f.result() for f in futures if f.exception() is None]
+            for f in futures:
+                if f.exception() is not None:
+                    raise f.exception()
 
             # format images
             print("formatting image ...", file=self.out)
 
-            if imagetype == 'ext4' or \
-                            imagetype == 'ext4_btrfs':
-                cmd = ['mkfs.ext4', loopdev[0]]
-            elif imagetype == 'ext3_btrfs':
-                cmd = ['mkfs.ext3', loopdev[0]]
-            elif imagetype == 'ext2_btrfs':
-                cmd = ['mkfs.ext2', loopdev[0]]
-            elif imagetype == 'btrfs' or \
-                            imagetype == 'btrfs_zlib' or \
-                            imagetype == 'btrfs_lzo':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, loopdev[0]]
-            elif imagetype == 'btrfs_nofeature':
-                cmd = ['mkfs.btrfs', '-O^extref,^skinny-metadata', loopdev[0]]
-            elif imagetype == 'btrfs_nodemin':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, '-n4096', loopdev[0]]
-            elif imagetype == 'btrfs_nodemax':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, '-n65536', loopdev[0]]
-            elif imagetype == 'btrfs_noextref':
-                cmd = ['mkfs.btrfs', '-O^extref,skinny-metadata', loopdev[0]]
-            elif imagetype == 'btrfs_noskinny':
-                cmd = ['mkfs.btrfs', '-Oextref,^skinny-metadata', loopdev[0]]
-            elif imagetype == 'btrfs_noholes':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT + ',no-holes', loopdev[0]]
-            elif imagetype == 'btrfs_mixed':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, '--mixed', loopdev[0]]
-            elif imagetype == 'btrfs_raid0DM':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, '-draid0', '-mraid0',
-                       loopdev[0], loopdev[1]]
-            elif imagetype == 'btrfs_raid1D':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, '-draid1', '-mraid0',
-                       loopdev[0], loopdev[1]]
-            elif imagetype == 'btrfs_raid1DM':
-                cmd = ['mkfs.btrfs', self.BTRFS_STD_OPT, '-draid1', '-mraid1',
-                       loopdev[0], loopdev[1]]
-            else:
-                raise ImageCreationError("this type is not supported")
-            res = subprocess.call(cmd, stdout=self.out, stderr=self.out)
+            cmd = itype.mkfs_command(self.BTRFS_STD_OPT, loopdev)
+            res = self.executor.call(cmd, stdout=self.out, stderr=self.out)
             if res != 0:
                 raise ImageCreationError("formatting failed")
 
             # mount image(s)
-            self.mount(imagetype, imagedir, self.MOUNT_PATH)
+            self.mount(imagetype, imagedir, self.MOUNT_PATH, device=loopdev[0])
 
             # create files
             print("creating files ...", file=self.out)
 
-            self.__create_files_std(self.MOUNT_PATH)
-            if imagetype == 'ext4':
-                self.__create_files_deleted(self.MOUNT_PATH)
-            elif imagetype == 'ext4_btrfs' or \
-                            imagetype == 'ext3_btrfs' or \
-                            imagetype == 'ext2_btrfs':
-                self.__create_files_deleted(self.MOUNT_PATH)
-                self.umount(self.MOUNT_PATH)
-                res = subprocess.call(['btrfs-convert', self.BTRFS_STD_OPT,
-                                       loopdev[0]])
-                if res != 0:
-                    raise ImageCreationError("conversion failed")
-                self.mount(imagetype, imagedir, self.MOUNT_PATH)
-                self.__create_files_ext(self.MOUNT_PATH)
-            else:
-                self.__create_files_ext(self.MOUNT_PATH)
-                self.__create_files_deleted(self.MOUNT_PATH)
+            steps = {
+                'std': lambda: self.__create_files_std(self.MOUNT_PATH),
+                'ext': lambda: self.__create_files_ext(self.MOUNT_PATH),
+                'deleted': lambda: self.__create_files_deleted(self.MOUNT_PATH),
+                'hugedir': lambda: self.__create_huge_directory(
+                    self.MOUNT_PATH, "directory_huge", self.HUGEDIR_ENTRIES),
+                'fragmented': lambda: self.__create_fragmented_files(
+                    self.MOUNT_PATH, "directory_fragmented", self.FRAGMENTED_FILES,
+                    self.FRAGMENTED_SIZE),
+                'snapshots': lambda: self.__create_many_subvolumes(
+                    self.MOUNT_PATH, self.SNAPSHOT_SUBVOLUMES, self.SNAPSHOT_COUNT),
+                'sparse': lambda: self.__create_large_sparse_files(
+                    self.MOUNT_PATH, "directory_sparse"),
+                'deleted_many': lambda: self.__create_many_deleted_files(
+                    self.MOUNT_PATH, "directory_deleted", self.DELETED_FILES)}
+            for step in itype.populate:
+                if step == 'convert':
+                    self.umount(self.MOUNT_PATH)
+                    cmd = ['btrfs-convert', self.BTRFS_STD_OPT, loopdev[0]]
+                    res = self.executor.call(cmd)
+                    if res != 0:
+                        raise ImageCreationError("conversion failed")
+                    self.mount(imagetype, imagedir, self.MOUNT_PATH, device=loopdev[0])
+                else:
+                    steps[step]()
 
             # change owner of all files
             cmd = ['chown', str(uid) + ':' + str(gid), '-R', self.MOUNT_PATH]
-            res = subprocess.call(cmd)
+            res = self.executor.call(cmd)
             if res != 0:
                 raise ImageCreationError("changing file owner failed")
 
             # hash all created files and the image(s) itself
             print("creating file checksums ...", file=self.out)
 
+            # the md5 file only gets its name when it is complete
+            partial = hfname + self.PARTIAL_SUFFIX
             try:
-                with open(hfname, 'a') as hf:
-                    os.chown(hfname, uid, gid)
+                with open(partial, 'w') as hf:
+                    os.chown(partial, uid, gid)
 
                     # hash all files
-                    self.__md5sum_image(hf)
+                    extents = self.__md5sum_image(hf)
 
                     # unmount image(s) and detach loop device(s)
                     self.__cleanup(loopdev)
@@ -273,8 +1053,32 @@ class ImageFactory:
                     print("creating image checksum ...", file=self.out)
 
                     hf.write("--------------------------------\n")
-                    for f in filename:
-                        hf.write(self.md5sum(f) + "  " + os.path.basename(f) + "\n")
+                    with concurrent.futures.ThreadPoolExecutor(
+                            self.__workers(len(filename))) as pool:
+                        sums = list(pool.map(self.md5sum, filename))
+                    for f, s in zip(filename, sums):
+                        hf.write(s + "  " + os.path.basename(f) + "\n")
+
+                    # extent counts of all files
+                    hf.write("-------------------------------- extents\n")
+                    for rp in sorted(extents):
+                        hf.write(str(extents[rp]) + " " + rp + "\n")
+
+                    # sparse digests and sizes of the sparse files
+                    if self.sparse:
+                        hf.write("-------------------------------- sparse\n")
+                        for fpath in sorted(self.sparse):
+                            size, digest = self.sparse[fpath]
+                            rp = os.path.relpath(fpath, self.MOUNT_PATH)
+                            hf.write(digest + " " + str(size) + " " + rp + "\n")
+
+                    # md5 sums of the deleted files
+                    if self.deleted:
+                        hf.write("-------------------------------- deleted\n")
+                        for fpath in sorted(self.deleted):
+                            rp = os.path.relpath(fpath, self.MOUNT_PATH)
+                            hf.write(self.deleted[fpath] + " " + rp + "\n")
+                os.replace(partial, hfname)
             except Exception as e:
                 print(e, file=sys.stderr)
                 raise ImageCreationError("could not create md5 file")
@@ -282,10 +1086,47 @@ class ImageFactory:
             # in case of an exception, clean up and delete images
             self.__cleanup(loopdev)
             self.delete(imagetype, imagedir)
+            try:
+                os.remove(hfname + self.PARTIAL_SUFFIX)
+            except OSError:
+                pass
             raise
 
         return files
 
+    ##
+    # read a section of the md5 file of an image
+    # @details The md5 file starts with the file sums, the following sections
+    # start with a separator line, followed by the section name (the image
+    # sums have no name and are returned as section 'image'). The sparse
+    # section has two values per file, the sparse digest and the size.
+    #
+    # @param fname md5 file of the image
+    # @param section name of the section, None for the file sums
+    # @return dict of relative path to value (md5 sum, extent count, ...), to
+    #         tuple of sparse digest and size for the sparse section
+    #
+    @classmethod
+    def read_manifest(cls, fname, section=None):
+        nvalues = cls.MANIFEST_VALUES.get(section, 1)
+        values = dict()
+        current = None
+        with open(fname) as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith('-'):
+                    current = line.lstrip('-').strip() or 'image'
+                    continue
+                if current == section:
+                    fields = line.split(' ', nvalues)
+                    # the image sums are separated by two spaces
+                    path = fields[-1].lstrip(' ') if current == 'image' else fields[-1]
+                    if nvalues == 1:
+                        values[path] = fields[0]
+                    else:
+                        values[path] = (fields[0], int(fields[1]))
+        return values
+
     ##
     # delete the created images for this type if they exist
     #
@@ -299,13 +1140,66 @@ class ImageFactory:
         if imagetype is None:
             raise ValueError("parameter must not be None")
 
-        for f in self.__type_to_names(imagetype):
+        for f in self.names(imagetype):
             try:
                 os.remove(os.path.join(ipath, f))
+            except FileNotFoundError:
+                # a failed build may not have created all files
+                pass
             except OSError as e:
                 print(e, file=sys.stderr)
                 raise ImageCreationError("could not remove files")
 
+    ##
+    # remove the images of an incomplete build
+    # @details The md5 file is written last, images without it are left over
+    # from a build that failed or was killed. Their loop devices are detached
+    # and the images and the partial md5 file are removed. Only to be called
+    # by the owner of the image directory (the batch build), images of a
+    # build still running look the same.
+    #
+    # @param imagetype type of the image
+    # @param ipath directory of the image
+    # @throw ImageCreationError if something went wrong
+    # @return True if files of an incomplete build were removed
+    #
+    def discard_incomplete(self, imagetype, ipath):
+        files = [os.path.join(ipath, f) for f in self.names(imagetype)]
+        partial = files[-1] + self.PARTIAL_SUFFIX
+        if os.path.isfile(files[-1]):
+            return False
+        leftovers = [f for f in files[0:-1] + [partial] if os.path.isfile(f)]
+        for f in leftovers:
+            self.detach_loops(f)
+            try:
+                os.remove(f)
+            except OSError as e:
+                print(e, file=sys.stderr)
+                raise ImageCreationError("could not remove files")
+        return len(leftovers) > 0
+
+    ##
+    # pack the files of an image type into an archive
+    #
+    # @param imagetype type of the image
+    # @param ipath directory of the image
+    # @param fname name of the archive
+    # @param method compression method, 'zlib' or 'lzma'
+    # @throw ValueError if received an invalid parameter
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def pack(self, imagetype, ipath, fname, method='zlib'):
+        if imagetype is None or ipath is None or fname is None:
+            raise ValueError("parameter must not be None")
+
+        files = [os.path.join(ipath, f) for f in self.names(imagetype)]
+        for f in files:
+            if not os.path.isfile(f):
+                raise ImageCreationError("image file " + f + " does not exist")
+        print("packing image ...", file=self.out)
+        ImageArchive.pack(fname, files[0:-1], files[-1], method)
+
     ##
     # mount the files of an image type
     #
@@ -313,11 +1207,14 @@ class ImageFactory:
     # @param ipath directory of the image, if None, path has to point to a
     #        custom image (imagetype is a full path then)
     # @param mpath path where to mount
+    # @param options list of additional mount options
+    # @param device loop device the image is already attached to (while it is
+    #        created), mounted as it is; None to attach a new one
     # @throw ValueError if received an invalid parameter
     # @throw ImageCreationError if something went wrong
     # @return None
     #
-    def mount(self, imagetype, ipath, mpath):
+    def mount(self, imagetype, ipath, mpath, options=None, device=None):
         if imagetype is None or mpath is None:
             raise ValueError("parameter must not be None")
 
@@ -331,40 +1228,80 @@ class ImageFactory:
 
         # is it a custom image?
         if ipath is None:
-            files = (os.path.basename(imagetype), os.path.basename(imagetype) + ".md5")
-            image = files[0]
+            image = imagetype
         else:
-            files = self.__type_to_names(imagetype)
+            files = self.names(imagetype)
             image = os.path.join(ipath, files[0])
 
         # mount with appropriate options
         cmd = ['mount']
-        if imagetype == 'btrfs_zlib':
-            cmd += ['-ocompress-force=zlib']
-        elif imagetype == 'btrfs_lzo':
-            cmd += ['-ocompress-force=lzo']
+        loopdev = None
+        if device is not None:
+            # a second device of the same file would show the devid twice
+            image = device
+        elif self.LOOP_DIRECT_IO:
+            loopdev = self.__attach_loop(image)
+            image = loopdev
+        if imagetype in IMAGE_TYPES and IMAGE_TYPES[imagetype].mount:
+            cmd += ['-o' + ','.join(IMAGE_TYPES[imagetype].mount)]
+        if options:
+            cmd += ['-o' + ','.join(options)]
         cmd += [image, mpath]
-        res = subprocess.call(cmd)
+        try:
+            res = self.executor.call(cmd)
+        finally:
+            # detaching a mounted loop device frees it as soon as it is unmounted
+            if loopdev is not None:
+                self.executor.call(['losetup', '-d', loopdev], stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
         if res != 0:
             raise ImageCreationError("mounting failed")
 
     ##
     # unmount the image
     #
+    # @details If umount hangs, the mount is detached lazily.
+    #
     # @param mpath mount path of the image
     # @throw ValueError if received an invalid parameter
     # @throw ImageCreationError if something went wrong
     # @return None
     #
-    @staticmethod
-    def umount(mpath):
+    @classmethod
+    def umount(cls, mpath):
         if mpath is None:
             raise ValueError("parameter must not be None")
 
-        res = subprocess.call(['umount', mpath])
+        try:
+            res = cls.executor.call(['umount', mpath])
+        except execution.ExecutionError as e:
+            print(e, file=sys.stderr)
+            cls.executor.call(['umount', '-l', mpath])
+            raise ImageCreationError("unmounting timed out, detached lazily")
         if res != 0:
             raise ImageCreationError("unmounting failed")
 
+    ##
+    # detach all loop devices of an image file (e.g. left by an aborted run)
+    #
+    # @param fname image file
+    # @return list of detached loop devices
+    #
+    @classmethod
+    def detach_loops(cls, fname):
+        try:
+            out = cls.executor.check_output(['losetup', '-j', os.path.abspath(fname)],
+                                            stderr=subprocess.DEVNULL).decode('utf-8')
+        except (subprocess.CalledProcessError, execution.ExecutionError, OSError):
+            return []
+        detached = list()
+        for line in out.splitlines():
+            dev = line.split(':')[0]
+            if cls.executor.call(['losetup', '-d', dev], stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL) == 0:
+                detached.append(dev)
+        return detached
+
     ##
     # mount raid images
     #
@@ -387,26 +1324,17 @@ class ImageFactory:
                 print(e, file=sys.stderr)
                 raise ImageCreationError("could not create mount point")
 
-        files = self.__type_to_names(imagetype)
+        files = self.names(imagetype)
         devs = list()
 
         # attach to loop device
-        for i in range(0, 2):
-            try:
-                loopdev = subprocess.check_output(['losetup', '-f'],
-                                                  universal_newlines=True)
-            except subprocess.CalledProcessError as e:
-                print(e, file=sys.stderr)
-                raise ImageCreationError("no free loop device available")
-            loopdev = loopdev.replace('\n', '')
-            res = subprocess.call(['losetup', loopdev, os.path.join(ipath, files[i])])
-            if res != 0:
-                raise ImageCreationError("attaching to device failed")
-            devs.append(loopdev)
+        for i in range(0, len(files) - 1):
+            devs.append(self.__attach_loop(os.path.join(ipath, files[i])))
 
-        # mount with appropriate options
+        # mount with appropriate options, a hanging mount releases the devices
         cmd = ['mount', devs[0], mpath]
-        res = subprocess.call(cmd)
+        with self.executor.cleanup(lambda: self.__detach(devs)):
+            res = self.executor.call(cmd)
         if res != 0:
             raise ImageCreationError("mounting failed")
 
@@ -422,29 +1350,37 @@ class ImageFactory:
     def umount_raid(self, mpath, loopdev):
         self.umount(mpath)
 
-        if loopdev is not None:
-            for d in loopdev:
-                if d is not None:
-                    res = subprocess.call(['losetup', '-d', d],
-                                          stdout=subprocess.DEVNULL,
-                                          stderr=subprocess.DEVNULL)
-                    if res != 0:
-                        raise ImageCreationError("releasing from device failed")
+        if loopdev is not None and not self.__detach(loopdev):
+            raise ImageCreationError("releasing from device failed")
+
+    ##
+    # get the number of devices of an image type
+    #
+    # @param imagetype type of the image
+    # @throw ValueError if RAID_DEVICES is too small for the type
+    # @return the number of devices, 1 for custom images
+    #
+    def devices(self, imagetype):
+        itype = IMAGE_TYPES.get(imagetype)
+        if itype is None:
+            return 1
+        if itype.min_devices is None or self.RAID_DEVICES is None:
+            return itype.devices
+        if self.RAID_DEVICES < itype.min_devices:
+            raise ValueError(imagetype + " needs at least " + str(itype.min_devices) +
+                             " devices")
+        return self.RAID_DEVICES
 
     ##
     # create the filenames from the image type
     #
     # @param imagetype type of the image
-    # @return the created names, 1 or 2 for images and 1 for the hashfile
+    # @return the created names, 1 per device for images and 1 for the hashfile
     #
-    @staticmethod
-    def __type_to_names(imagetype):
-        if 'raid' in imagetype:
-            names = [imagetype + '.1.img', imagetype + '.2.img']
-        else:
-            names = [imagetype + '.img']
-        names.append(imagetype + ".img.md5")
-        return tuple(names)
+    def names(self, imagetype):
+        if imagetype in IMAGE_TYPES:
+            return IMAGE_TYPES[imagetype].names(self.devices(imagetype))
+        return imagetype + '.img', imagetype + ".img.md5"
 
     ##
     # create container image for file system
@@ -470,20 +1406,84 @@ class ImageFactory:
             print(e, file=sys.stderr)
             raise ImageCreationError("could not change user of image:")
 
-        # attach to loop device
-        try:
-            loopdev = subprocess.check_output(['losetup', '-f'],
-                                              universal_newlines=True)
-        except subprocess.CalledProcessError as e:
-            print(e, file=sys.stderr)
-            raise ImageCreationError("no free loop device available")
-        loopdev = loopdev.replace('\n', '')
-        res = subprocess.call(['losetup', loopdev, fname])
-        if res != 0:
-            raise ImageCreationError("attaching to device failed")
+        return self.__attach_loop(fname)
+
+    ##
+    # attach a file to a free loop device
+    # @details If LOOP_DIRECT_IO is set, the device is attached with direct io
+    # (LO_FLAGS_DIRECT_IO). If losetup does not know the option, or the backing
+    # file system does not support direct io, buffered io is used.
+    #
+    # @param fname name of the file
+    # @throw ImageCreationError if something went wrong
+    # @return the loop device
+    #
+    def __attach_loop(self, fname):
+        with self.__loop_lock:
+            try:
+                lock = os.open(self.LOOP_LOCK_FILE, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW,
+                               0o600)
+            except OSError as e:
+                print(e, file=sys.stderr)
+                raise ImageCreationError("could not open the lock file of the loop devices")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                return self.__attach_free_loop(fname)
+            finally:
+                os.close(lock)
+
+    ##
+    # attach a file to a free loop device, without locking
+    #
+    # @param fname name of the file
+    # @throw ImageCreationError if something went wrong
+    # @return the loop device
+    #
+    def __attach_free_loop(self, fname):
+        loopdev = None
+        if self.LOOP_DIRECT_IO:
+            try:
+                loopdev = self.executor.check_output(
+                    ['losetup', '-f', '--show', '--direct-io=on', fname],
+                    universal_newlines=True, stderr=subprocess.DEVNULL).strip()
+            except subprocess.CalledProcessError:
+                loopdev = None
 
+        if loopdev is None:
+            try:
+                loopdev = self.executor.check_output(['losetup', '-f', '--show', fname],
+                                                     universal_newlines=True).strip()
+            except subprocess.CalledProcessError as e:
+                print(e, file=sys.stderr)
+                raise ImageCreationError("attaching to device failed")
+
+        if self.LOOP_DIRECT_IO and not self.direct_io(loopdev):
+            print("direct io not supported for", fname, file=self.out)
         return loopdev
 
+    ##
+    # number of threads for the members of an image
+    #
+    # @param n number of members
+    # @return the number of threads
+    #
+    def __workers(self, n):
+        return max(1, min(n, self.PARALLEL_DEVICES))
+
+    ##
+    # check if a loop device uses direct io
+    #
+    # @param loopdev the loop device
+    # @return True if direct io is used
+    #
+    @staticmethod
+    def direct_io(loopdev):
+        try:
+            with open(os.path.join('/sys/block', os.path.basename(loopdev), 'loop', 'dio')) as f:
+                return f.read().strip() == '1'
+        except IOError:
+            return False
+
     ##
     # cleanup function to unmount and free the loop devices
     #
@@ -492,40 +1492,63 @@ class ImageFactory:
     #
     def __cleanup(self, loopdev):
         print("cleaning up", file=self.out)
-        subprocess.call(['umount', self.MOUNT_PATH], stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL)
+        try:
+            self.executor.call(['umount', self.MOUNT_PATH], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+        except execution.ExecutionError as e:
+            print(e, file=sys.stderr)
+            self.executor.call(['umount', '-l', self.MOUNT_PATH], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+
+        self.__detach(loopdev)
 
+    ##
+    # detach loop devices
+    #
+    # @param loopdev tuple of loop devices (None entries are skipped)
+    # @return True if all devices were detached
+    #
+    def __detach(self, loopdev):
+        success = True
         for d in loopdev:
             if d is not None:
-                subprocess.call(['losetup', '-d', d],
-                                stdout=subprocess.DEVNULL,
-                                stderr=subprocess.DEVNULL)
+                res = self.executor.call(['losetup', '-d', d], stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL)
+                success = success and res == 0
+        return success
 
     ##
     # create generic file
+    # @details The md5 sum of a newly created file is remembered, so it has
+    # not to be read again when hashing the image. Appending to an existing
+    # file invalidates its remembered sum.
     #
     # @param path file creation director
     # @param fname filename
     # @param bsize size of the file in bytes
+    # @param fclass file class to choose the payload for (None = line pattern)
     # @throw ImageCreationError if something went wrong
     # @return None
     #
-    @staticmethod
-    def __create_raw_file(path, fname, bsize):
-        lines = (bsize - 5) // 80
-        padding = (bsize - 5) % 80
+    def __create_raw_file(self, path, fname, bsize, fclass=None):
+        payload = self.payload.get(fclass)
+        if payload is None:
+            payload = Payload()
+        fpath = os.path.join(path, fname)
 
         try:
-            with open(os.path.join(path, fname), 'a') as f:
-                if bsize > 5:
-                    for i in range(0, lines):
-                        f.write('{:0<79}'.format(str(i + 1) + ' ') + '\n')
-                    for i in range(0, padding):
-                        f.write('-')
+            with open(fpath, 'ab') as f:
+                new = f.tell() == 0
+                digest = payload.write(f, bsize, fname)
         except IOError as e:
             print(e, file=sys.stderr)
             raise ImageCreationError("could not create file")
 
+        if new:
+            self.digests[fpath] = digest
+        else:
+            self.digests.pop(fpath, None)
+
     ##
     # create inline file
     #
@@ -536,7 +1559,7 @@ class ImageFactory:
     #
     def __create_inline_file(self, path, fname):
         print("creating inline file", file=self.out)
-        self.__create_raw_file(path, fname, 400)
+        self.__create_raw_file(path, fname, 400, 'inline')
 
     ##
     # create standard file
@@ -548,7 +1571,7 @@ class ImageFactory:
     #
     def __create_file(self, path, fname):
         print("creating standard file", file=self.out)
-        self.__create_raw_file(path, fname, 1 * (1024 ** 2))
+        self.__create_raw_file(path, fname, 1 * (1024 ** 2), 'standard')
 
     ##
     # create big file
@@ -563,7 +1586,7 @@ class ImageFactory:
             return
         else:
             print("creating big file ...", file=self.out)
-            self.__create_raw_file(path, fname, 1124 * (1024 ** 2))
+            self.__create_raw_file(path, fname, 1124 * (1024 ** 2), 'big')
 
     ##
     # create file with long name
@@ -709,6 +1732,157 @@ class ImageFactory:
 
         self.__create_raw_file(p, "EOD", 100)
 
+    ##
+    # create directory with many entries
+    # @details The entries are empty files, created directly with os.open to
+    # keep the creation of millions of entries fast. Their (empty) md5 sums are
+    # remembered, so they are not read again when hashing the image.
+    #
+    # @param path directory creation directory
+    # @param dname directory name
+    # @param entries number of entries
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def __create_huge_directory(self, path, dname, entries):
+        print("creating directory with", entries, "entries", file=self.out)
+        p = os.path.join(path, dname)
+        empty = hashlib.md5().hexdigest()
+        try:
+            os.mkdir(p)
+            for i in range(0, entries):
+                fpath = os.path.join(p, self.entry_name(i))
+                os.close(os.open(fpath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+                self.digests[fpath] = empty
+        except OSError as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not create huge directory")
+
+    ##
+    # create fragmented files
+    # @details The files are written in parallel by small appends, each synced
+    # to disk, so their extents interleave. File i appends 2^(i mod 5)
+    # fragments at once, which spreads the extent counts of the files. Every
+    # second file gets a reflinked copy, which is then overwritten at random
+    # block positions, so the copy shares only part of its extents.
+    #
+    # @param path file creation directory
+    # @param dname directory name
+    # @param count number of files
+    # @param size size of each file
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def __create_fragmented_files(self, path, dname, count, size):
+        print("creating fragmented files", file=self.out)
+        p = os.path.join(path, dname)
+        rnd = random.Random(self.FRAGMENT_SEED)
+        names = ["file_fragmented_{}".format(i) for i in range(0, count)]
+        fds = list()
+        try:
+            os.mkdir(p)
+            for name in names:
+                fds.append(os.open(os.path.join(p, name),
+                                   os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644))
+
+            # interleave small synced appends
+            written = [0] * count
+            while min(written) < size:
+                for i in range(0, count):
+                    n = min(self.FRAGMENT_SIZE * 2 ** (i % 5), size - written[i])
+                    if n > 0:
+                        os.write(fds[i], self.__random_bytes(rnd, n))
+                        os.fsync(fds[i])
+                        written[i] += n
+        except OSError as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not create fragmented files")
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        # overwrite random blocks of reflinked copies
+        blocks = size // self.FRAGMENT_SIZE
+        for name in names[0::2]:
+            self.__create_reflink(p, name + "_reflink", name)
+            try:
+                fd = os.open(os.path.join(p, name + "_reflink"), os.O_WRONLY)
+                try:
+                    for i in range(0, self.FRAGMENT_OVERWRITES):
+                        offset = rnd.randrange(0, blocks) * self.FRAGMENT_SIZE
+                        os.pwrite(fd, self.__random_bytes(rnd, self.FRAGMENT_SIZE), offset)
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(e, file=sys.stderr)
+                raise ImageCreationError("could not overwrite reflinked file")
+
+    ##
+    # create and delete many files
+    # @details The files get sizes from DELETED_SIZES and a seeded random
+    # content, their md5 sums are kept. They are synced to disk and deleted,
+    # then new files of DELETED_CHURN times the deleted bytes are written to
+    # the same directory, which reuses part of the freed space.
+    #
+    # @param path file creation directory
+    # @param dname directory name
+    # @param count number of deleted files
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def __create_many_deleted_files(self, path, dname, count):
+        print("creating and deleting files", file=self.out)
+        p = os.path.join(path, dname)
+        rnd = random.Random(self.DELETED_SEED)
+        nbytes = 0
+        try:
+            os.mkdir(p)
+            for i in range(0, count):
+                fpath = os.path.join(p, "file_deleted_{:06d}".format(i))
+                data = self.__random_bytes(rnd, rnd.choice(self.DELETED_SIZES))
+                with open(fpath, 'wb') as f:
+                    f.write(data)
+                self.deleted[fpath] = hashlib.md5(data).hexdigest()
+                nbytes += len(data)
+            # the files have to be on disk, else they are never written
+            os.sync()
+            for fpath in sorted(self.deleted):
+                os.remove(fpath)
+            os.sync()
+
+            written = 0
+            i = 0
+            while written < nbytes * self.DELETED_CHURN:
+                with open(os.path.join(p, "file_churn_{:06d}".format(i)), 'wb') as f:
+                    written += f.write(self.__random_bytes(rnd, rnd.choice(self.DELETED_SIZES)))
+                i += 1
+            os.sync()
+        except OSError as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not create deleted files")
+
+    ##
+    # generate random bytes
+    #
+    # @param rnd random number generator
+    # @param n number of bytes
+    # @return the bytes
+    #
+    @staticmethod
+    def __random_bytes(rnd, n):
+        return rnd.getrandbits(n * 8).to_bytes(n, 'little')
+
+    ##
+    # name of an entry in a huge directory
+    #
+    # @param i index of the entry
+    # @return the entry name
+    #
+    @staticmethod
+    def entry_name(i):
+        return "entry_{:07d}".format(i)
+
     ##
     # create sparse file
     #
@@ -727,6 +1901,42 @@ class ImageFactory:
             print(e, file=sys.stderr)
             raise ImageCreationError("could not create sparse file")
 
+    ##
+    # create sparse files of TiB size
+    # @details The files are truncated to their size and small data islands
+    # are written at the offsets of SPARSE_FILES, so only a few blocks are
+    # allocated. The island content is derived from the file name and offset,
+    # the digest of every file is calculated from the islands (see
+    # sparse_digest) instead of reading the whole file.
+    #
+    # @param path file creation directory
+    # @param dname directory name
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def __create_large_sparse_files(self, path, dname):
+        print("creating large sparse files", file=self.out)
+        p = os.path.join(path, dname)
+        try:
+            os.mkdir(p)
+            for fname, size, offsets in self.SPARSE_FILES:
+                fpath = os.path.join(p, fname)
+                islands = list()
+                fd = os.open(fpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    os.ftruncate(fd, size)
+                    for offset in offsets:
+                        data = hashlib.shake_256("{}:{}".format(fname, offset).encode(
+                            'utf-8')).digest(self.SPARSE_ISLAND)
+                        os.pwrite(fd, data, offset)
+                        islands.append((offset, data))
+                finally:
+                    os.close(fd)
+                self.sparse[fpath] = (size, self.sparse_digest(size, islands))
+        except OSError as e:
+            print(e, file=sys.stderr)
+            raise ImageCreationError("could not create large sparse files")
+
     ##
     # create reflink
     #
@@ -741,8 +1951,8 @@ class ImageFactory:
         try:
             p = os.getcwd()
             os.chdir(path)
-            res = subprocess.call(['cp', '--reflink', fname, lname],
-                                  stdout=subprocess.DEVNULL)
+            res = self.executor.call(['cp', '--reflink', fname, lname],
+                                     stdout=subprocess.DEVNULL)
             if res != 0:
                 raise ImageCreationError("could not create reflink")
             os.chdir(p)
@@ -764,8 +1974,8 @@ class ImageFactory:
         p = path
         for i in range(0, depth):
             p = os.path.join(p, vname)
-            res = subprocess.call(['btrfs', 'subvolume', 'create', p],
-                                  stdout=subprocess.DEVNULL)
+            res = self.executor.call(['btrfs', 'subvolume', 'create', p],
+                                     stdout=subprocess.DEVNULL)
             if res != 0:
                 raise ImageCreationError("could not create subvolumes")
 
@@ -782,13 +1992,60 @@ class ImageFactory:
     #
     def __create_snapshot(self, path, sname, src):
         print("creating snapshot", file=self.out)
-        res = subprocess.call(['btrfs', 'subvolume', 'snapshot',
-                               os.path.join(path, src),
-                               os.path.join(path, sname)],
-                              stdout=subprocess.DEVNULL)
+        res = self.executor.call(['btrfs', 'subvolume', 'snapshot',
+                                  os.path.join(path, src),
+                                  os.path.join(path, sname)],
+                                 stdout=subprocess.DEVNULL)
         if res != 0:
             raise ImageCreationError("could not create snapshot")
 
+    ##
+    # create many subvolumes and snapshots sharing their extents
+    # @details A base subvolume with a standard and an inline file is created
+    # first. The subvolumes (in directory 'subvolumes') and the snapshots (in
+    # directory 'snapshots') are snapshots of this base, each with one small
+    # file of its own naming it, so they share all other extents. The sums of
+    # the shared files are taken over from the base.
+    #
+    # @param path creation directory
+    # @param nsubvols number of subvolumes
+    # @param nsnapshots number of snapshots
+    # @throw ImageCreationError if something went wrong
+    # @return None
+    #
+    def __create_many_subvolumes(self, path, nsubvols, nsnapshots):
+        print("creating", nsubvols, "subvolumes and", nsnapshots, "snapshots", file=self.out)
+        base = os.path.join(path, "subvolume_base")
+        res = self.executor.call(['btrfs', 'subvolume', 'create', base],
+                                 stdout=subprocess.DEVNULL)
+        if res != 0:
+            raise ImageCreationError("could not create subvolumes")
+        self.__create_inline_file(base, "file_inline")
+        self.__create_file(base, "file")
+        shared = [f for f in self.digests if os.path.dirname(f) == base]
+
+        for dname, prefix, count in (("subvolumes", "subvolume_", nsubvols),
+                                     ("snapshots", "snapshot_", nsnapshots)):
+            try:
+                os.mkdir(os.path.join(path, dname))
+            except OSError as e:
+                print(e, file=sys.stderr)
+                raise ImageCreationError("could not create subvolume directory")
+            for i in range(0, count):
+                p = os.path.join(path, dname, prefix + str(i))
+                res = self.executor.call(['btrfs', 'subvolume', 'snapshot', base, p],
+                                         stdout=subprocess.DEVNULL)
+                if res != 0:
+                    raise ImageCreationError("could not create snapshot")
+                for f in shared:
+                    self.digests[os.path.join(p, os.path.basename(f))] = self.digests[f]
+                try:
+                    with open(os.path.join(p, "file_unique"), 'w') as f:
+                        f.write(prefix + str(i) + "\n")
+                except IOError as e:
+                    print(e, file=sys.stderr)
+                    raise ImageCreationError("could not create file")
+
     ##
     # modify file
     #
@@ -800,6 +2057,7 @@ class ImageFactory:
     #
     def __modify_file(self, path, fname, tag):
         print("modify file", file=self.out)
+        self.digests.pop(os.path.join(path, fname), None)
         try:
             with open(os.path.join(path, fname), 'a') as f:
                 f.write("\n")
@@ -869,17 +2127,43 @@ class ImageFactory:
             print(e, file=sys.stderr)
             raise ImageCreationError("could not delete file")
 
+    ##
+    # read the metadata of all files of a mounted image using stat
+    # @details The output is the ground truth of the unit tests, one line per
+    # file with name, inode, uid, gid, times, mode, links and size.
+    #
+    # @param mpath mount path of the image
+    # @param paths list of relative paths to stat instead of all files, None for all
+    # @throw CalledProcessError if one of the given paths does not exist
+    # @return output of stat as bytes
+    #
+    @classmethod
+    def stat_output(cls, mpath, paths=None):
+        fmt = '%n|%i|a|%u|%g|%Y|%X|%Z|%W|%a|%h|%s'
+        if paths is not None:
+            return cls.executor.check_output(
+                ['stat', '-c', fmt, '--'] + [os.path.join(mpath, p) for p in paths],
+                stderr=subprocess.DEVNULL)
+        # find passes the paths in batches, a shell glob would exceed the
+        # argument limit for directories with many entries
+        cmd = ['find', mpath, '-mindepth', '1', '-exec', 'stat', '-c', fmt, '{}', '+']
+        return cls.executor.check_output(cmd, stderr=subprocess.DEVNULL)
+
     ##
     # calculate md5 sums of all files
+    # @details Sums calculated while creating the files are reused. The
+    # extent counts of the files are collected in the same pass.
     #
     # @param path directory with content that should get hashed
     # @param hf all hashsums are written to this file
     # @throw ImageCreationError if something went wrong
-    # @return None
+    # @return dict of relative path to extent count
     #
     def __md5sum_image(self, hf):
+        extents = dict()
         for root, dirs, files in os.walk(self.MOUNT_PATH):
-            for fname in files:
+            dirs.sort()
+            for fname in sorted(files):
                 s = os.stat(os.path.join(root, fname)).st_mode
 
                 # do not try to hash if file is a device, socket or pipe
@@ -887,9 +2171,112 @@ class ImageFactory:
                         stat.S_ISFIFO(s) or stat.S_ISSOCK(s)):
                     continue
 
-                res = self.md5sum(os.path.join(root, fname))
                 rp = os.path.relpath(os.path.join(root, fname), self.MOUNT_PATH)
-                hf.write(res + " " + rp + "\n")
+                # sparse files have their own section
+                if os.path.join(root, fname) not in self.sparse:
+                    res = self.digests.get(os.path.join(root, fname))
+                    if res is None:
+                        res = self.md5sum(os.path.join(root, fname))
+                    hf.write(res + " " + rp + "\n")
+
+                try:
+                    extents[rp] = len(self.fiemap(os.path.join(root, fname)))
+                except OSError:
+                    # file system does not support FIEMAP
+                    pass
+        return extents
+
+    ##
+    # get the extents of a file
+    # @details The extents are read with the FIEMAP ioctl in batches, logical
+    # and physical offsets and lengths are given in bytes.
+    #
+    # @param fname name of the file
+    # @param batch number of extents requested per ioctl
+    # @throw OSError if the file system does not support FIEMAP
+    # @return list of (logical, physical, length, flags) tuples
+    #
+    @classmethod
+    def fiemap(cls, fname, batch=512):
+        extents = list()
+        start = 0
+        fd = os.open(fname, os.O_RDONLY)
+        try:
+            while True:
+                buf = bytearray(cls.FIEMAP_HEADER.size + batch * cls.FIEMAP_EXTENT.size)
+                cls.FIEMAP_HEADER.pack_into(buf, 0, start, 2 ** 64 - 1 - start,
+                                            cls.FIEMAP_FLAG_SYNC, 0, batch, 0)
+                fcntl.ioctl(fd, cls.FS_IOC_FIEMAP, buf)
+                mapped = cls.FIEMAP_HEADER.unpack_from(buf, 0)[3]
+                if mapped == 0:
+                    break
+                for i in range(0, mapped):
+                    fe = cls.FIEMAP_EXTENT.unpack_from(
+                        buf, cls.FIEMAP_HEADER.size + i * cls.FIEMAP_EXTENT.size)
+                    extents.append((fe[0], fe[1], fe[2], fe[5]))
+                if extents[-1][3] & cls.FIEMAP_EXTENT_LAST:
+                    break
+                start = extents[-1][0] + extents[-1][2]
+        finally:
+            os.close(fd)
+        return extents
+
+    ##
+    # get the extents of all regular files of a mounted image
+    # @details The files are visited in sorted order and their extents are
+    # read one file at a time, so the map can be consumed as a stream.
+    #
+    # @param mpath mount path of the image
+    # @param paths list of relative paths to visit instead of all files, None for all
+    # @throw OSError if the file system does not support FIEMAP
+    # @return generator of (relative path, extents) tuples (see fiemap)
+    #
+    @classmethod
+    def extent_map(cls, mpath, paths=None):
+        if paths is not None:
+            for rp in sorted(paths):
+                fpath = os.path.join(mpath, rp)
+                if os.path.lexists(fpath) and stat.S_ISREG(os.lstat(fpath).st_mode):
+                    yield rp, cls.fiemap(fpath)
+            return
+        for root, dirs, files in os.walk(mpath):
+            dirs.sort()
+            for fname in sorted(files):
+                fpath = os.path.join(root, fname)
+                if stat.S_ISREG(os.lstat(fpath).st_mode):
+                    yield os.path.relpath(fpath, mpath), cls.fiemap(fpath)
+
+    ##
+    # calculate the sparse digest of a file from its data islands
+    # @details The sparse digest is the md5 sum over all blocks of SPARSE_BLOCK
+    # bytes containing data other than zeros, each preceded by its offset
+    # (64 bit little endian), followed by the size of the file. Holes and
+    # zeroed blocks do not change it, so it is calculated without the TiB of
+    # zeros between the islands.
+    #
+    # @param size size of the file
+    # @param islands list of (offset, data) tuples written to the file
+    # @return the sparse digest in hex digits
+    #
+    @classmethod
+    def sparse_digest(cls, size, islands):
+        blocks = dict()
+        for offset, data in islands:
+            pos = offset
+            while pos < offset + len(data):
+                start = pos - pos % cls.SPARSE_BLOCK
+                block = blocks.setdefault(start, bytearray(min(cls.SPARSE_BLOCK, size - start)))
+                n = min(start + len(block), offset + len(data)) - pos
+                block[pos - start:pos - start + n] = data[pos - offset:pos - offset + n]
+                pos += n
+
+        hashsum = hashlib.md5()
+        for start in sorted(blocks):
+            if blocks[start].count(0) != len(blocks[start]):
+                hashsum.update(struct.pack('<Q', start))
+                hashsum.update(blocks[start])
+        hashsum.update(struct.pack('<Q', size))
+        return hashsum.hexdigest()
 
     ##
     # calculate md5 sum
@@ -903,7 +2290,8 @@ class ImageFactory:
         hashsum = hashlib.md5()
         try:
             with open(fname, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
+                # big chunks, hashlib releases the GIL while hashing them
+                for chunk in iter(lambda: f.read(1024 ** 2), b''):
                     hashsum.update(chunk)
         except IOError as e:
             print(e, file=sys.stderr)
@@ -912,6 +2300,307 @@ class ImageFactory:
         return hashsum.hexdigest()
 
 
+##
+# build of one image type in a batch build
+#
+class ImageBuild:
+    ##
+    # constructor
+    #
+    # @param itype ImageType of the build
+    # @param cost estimated build time in seconds
+    # @return a new instance of this class
+    #
+    def __init__(self, itype, cost):
+        self.itype = itype
+        self.cost = cost
+        self.process = None
+        self.log = None
+        self.reader = None
+        self.buffer = ""
+        self.phase = "starting"
+        self.start = None
+        self.elapsed = None
+        self.result = None
+        # reason why the image is not built, None if it is built
+        self.skipped = itype.unsupported()
+
+    ##
+    # mount point of the build process
+    #
+    @property
+    def mpath(self):
+        return ImageFactory.MOUNT_PATH + "_" + self.itype.name
+
+    ##
+    # elapsed time of the build in seconds, up to now if it is running
+    #
+    @property
+    def running_time(self):
+        if self.elapsed is not None:
+            return self.elapsed
+        return time.perf_counter() - self.start if self.start is not None else 0.0
+
+    ##
+    # estimated remaining time of the build in seconds (0 if overdue)
+    #
+    @property
+    def remaining(self):
+        return max(0.0, self.cost - self.running_time)
+
+    ##
+    # flag if the image was built or already existed
+    #
+    @property
+    def passed(self):
+        return self.result == 0 or self.skipped == "already built"
+
+
+##
+# class used to build several image types in parallel
+# @details Every image is built by a process of its own (testimage.py --build)
+# with its own mount point; the loop devices are attached under a lock file
+# shared by the processes (ImageFactory.LOOP_LOCK_FILE). The builds are
+# started longest first. The output of every build is written to a log file,
+# the progress messages in the logs are printed with the elapsed and the
+# estimated remaining time of the build (from the build cost of the type).
+# The md5 file of an image is only written when the build succeeded; the
+# files of a failed build are removed, so a md5 file always belongs to a
+# complete image.
+#
+class BatchBuild:
+    # configurable constants
+    # default directory of the build logs
+    LOG_DIR = "logs"
+    # interval between checks of the running builds in seconds
+    POLL_INTERVAL = 1.0
+    # interval between progress reports of all running builds in seconds
+    PROGRESS_INTERVAL = 60.0
+    # progress messages of ImageFactory.create and the phases they start
+    PHASES = (('formatting image', "formatting"), ('creating files', "creating files"),
+              ('creating file checksums', "hashing files"),
+              ('creating image checksum', "hashing images"))
+
+    ##
+    # constructor
+    #
+    # @param fac ImageFactory with the parameters of the builds
+    # @param imagetypes list of image types to build
+    # @param jobs maximum number of parallel builds
+    # @param ipath directory of the images
+    # @param logdir directory of the log files
+    # @param options command line options of the build processes
+    # @throw ValueError if received an invalid parameter
+    # @return a new instance of this class
+    #
+    def __init__(self, fac, imagetypes, jobs=1, ipath="", logdir=LOG_DIR, options=()):
+        if jobs < 1:
+            raise ValueError("at least one job is needed")
+        self.fac = fac
+        self.max_jobs = jobs
+        self.ipath = ipath
+        self.logdir = logdir
+        self.options = list(options)
+
+        self.builds = list()
+        for imagetype in imagetypes:
+            build = ImageBuild(IMAGE_TYPES[imagetype], IMAGE_TYPES[imagetype].build_cost)
+            if all(os.path.isfile(os.path.join(ipath, f)) for f in fac.names(imagetype)):
+                build.skipped = "already built"
+            self.builds.append(build)
+        # longest build first
+        self.builds.sort(key=lambda b: b.cost, reverse=True)
+
+    ##
+    # flag if all images were built or already existed
+    #
+    @property
+    def succeeded(self):
+        return all(build.passed for build in self.builds)
+
+    ##
+    # estimate the remaining time of all builds
+    # @details The pending builds are simulated in order, each one is started
+    # as soon as one of the parallel slots is free.
+    #
+    # @param running list of running builds
+    # @param pending list of pending builds
+    # @return the estimated remaining time in seconds
+    #
+    def estimate(self, running, pending):
+        slots = [build.remaining for build in running]
+        slots += [0.0] * (self.max_jobs - len(slots))
+        for build in pending:
+            slots.sort()
+            slots[0] += build.cost
+        return max(slots)
+
+    ##
+    # run all builds
+    # @details On an interrupt the running builds are terminated, they remove
+    # their images before they exit.
+    #
+    # @throw ImageCreationError if the builds cannot be started
+    # @return None
+    #
+    def run(self):
+        if os.getuid() != 0:
+            raise ImageCreationError("this method needs root")
+        os.makedirs(self.logdir, exist_ok=True)
+        if self.ipath != "":
+            os.makedirs(self.ipath, exist_ok=True)
+        pending = [build for build in self.builds if build.skipped is None]
+        running = list()
+        print("building {} images with {} jobs, estimated {:.0f} s".format(
+            len(pending), self.max_jobs, self.estimate(running, pending)))
+
+        reported = time.perf_counter()
+        try:
+            while pending or running:
+                while pending and len(running) < self.max_jobs:
+                    build = pending.pop(0)
+                    self.__start(build)
+                    running.append(build)
+
+                time.sleep(self.POLL_INTERVAL)
+                for build in list(running):
+                    self.__follow(build)
+                    if build.process.poll() is not None:
+                        self.__finish(build)
+                        running.remove(build)
+
+                if running and time.perf_counter() - reported >= self.PROGRESS_INTERVAL:
+                    reported = time.perf_counter()
+                    for build in running:
+                        self.print_progress(build)
+                    print("all builds done in about {:.0f} s".format(
+                        self.estimate(running, pending)))
+        except KeyboardInterrupt:
+            print("interrupted, stopping the running builds", file=sys.stderr)
+            for build in running:
+                build.process.terminate()
+            for build in running:
+                build.process.wait()
+                self.__finish(build)
+            for build in pending:
+                build.skipped = "interrupted"
+
+    ##
+    # start the process of a build
+    #
+    # @param build ImageBuild to start
+    # @return None
+    #
+    def __start(self, build):
+        name = build.itype.name
+        # images without md5 file are left over from an aborted build
+        try:
+            if self.fac.discard_incomplete(name, self.ipath):
+                print("removed images of an incomplete build of", name)
+        except ImageCreationError as e:
+            print("ERROR:", name + ":", e, file=sys.stderr)
+        build.log = open(os.path.join(self.logdir, "build_" + name + ".log"), 'w')
+        build.reader = open(build.log.name, errors='replace')
+        cmd = [sys.executable, '-u', os.path.abspath(__file__)] + self.options + \
+            ['-d', self.ipath, '--build', name]
+        build.start = time.perf_counter()
+        # in a session of its own, an interrupt only reaches the batch process
+        build.process = subprocess.Popen(cmd, stdout=build.log, stderr=subprocess.STDOUT,
+                                         start_new_session=True)
+        self.print_progress(build)
+
+    ##
+    # follow the log of a build and print the progress on a new phase
+    #
+    # @param build running ImageBuild
+    # @return None
+    #
+    def __follow(self, build):
+        lines = (build.buffer + build.reader.read()).split('\n')
+        build.buffer = lines.pop()
+        for line in lines:
+            for message, phase in self.PHASES:
+                if line.startswith(message) and build.phase != phase:
+                    build.phase = phase
+                    self.print_progress(build)
+
+    ##
+    # collect the result of a finished build
+    # @details Files left by a failed build (e.g. a killed process) are
+    # removed, so no md5 file of an incomplete image remains.
+    #
+    # @param build finished ImageBuild
+    # @return None
+    #
+    def __finish(self, build):
+        build.elapsed = time.perf_counter() - build.start
+        build.result = build.process.returncode
+        self.__follow(build)
+        build.reader.close()
+        build.log.close()
+        if not build.passed:
+            try:
+                if os.path.ismount(build.mpath):
+                    self.fac.umount(build.mpath)
+                self.fac.discard_incomplete(build.itype.name, self.ipath)
+            except ImageCreationError as e:
+                print("ERROR:", build.itype.name + ":", e, file=sys.stderr)
+        try:
+            os.rmdir(build.mpath)
+        except OSError:
+            pass
+        print("finished", build.itype.name, "in {:.0f} s:".format(build.elapsed),
+              "ok" if build.passed else "FAILED (see " + build.log.name + ")")
+
+    ##
+    # print the progress of a running build
+    #
+    # @param build running ImageBuild
+    # @return None
+    #
+    def print_progress(self, build):
+        elapsed = build.running_time
+        if elapsed <= build.cost:
+            eta = "ETA {:.0f} s".format(build.remaining)
+        else:
+            eta = "{:.0f} s over estimate".format(elapsed - build.cost)
+        print("{:<18} {:<16} {:>6.0f} s  {:>3.0%}  {}".format(
+            build.itype.name, build.phase, elapsed, min(1.0, elapsed / build.cost), eta))
+
+    ##
+    # print the results of all builds
+    #
+    # @return None
+    #
+    def print_summary(self):
+        print()
+        print("{:<18} {:>10} {:>10}  {}".format('type', 'cost s', 'actual s', 'result'))
+        for build in self.builds:
+            if build.skipped is not None:
+                result = "skipped: " + build.skipped
+            else:
+                result = "ok" if build.passed else "FAILED"
+            elapsed = "{:.0f}".format(build.elapsed) if build.elapsed is not None else "-"
+            print("{:<18} {:>10.0f} {:>10}  {}".format(build.itype.name, build.cost, elapsed,
+                                                       result))
+        print("{} of {} images available".format(
+            sum(1 for build in self.builds if build.passed), len(self.builds)))
+
+    ##
+    # signal handler of the build processes for SIGTERM
+    # @details Exits via SystemExit, so the images are removed by the clean-up
+    # of ImageFactory.create; further signals do not interrupt the clean-up.
+    #
+    # @param signum number of the signal
+    # @param frame current stack frame
+    # @return None
+    #
+    @staticmethod
+    def terminate(signum, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        sys.exit(1)
+
+
 # start the program
 if __name__ == '__main__':
     main()
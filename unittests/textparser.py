@@ -9,8 +9,8 @@
 # @details This class can be used to process the output of various Linux and TSK
 # shell tools. Precisely, it can take the output of fls to extract the file
 # names, the output of ils to organize the meta data and the output of stat
-# to do the same. Additionally, it filters and removes some not matching or
-# unnecessary data.
+# to do the same, and the run list of istat. Additionally, it filters and
+# removes some not matching or unnecessary data.
 ################################################################################
 
 import os
@@ -42,9 +42,11 @@ class TextParser:
     # them as a list.
     #
     # @param data raw output of fls tool to process
+    # @param types dict filled with the type of every file ('r', 'd', 'l', ...)
+    #        by path, None to skip
     # @return list of contained files
     #
-    def parse_fls_files(self, data):
+    def parse_fls_files(self, data, types=None):
         files = list()
         data = data.decode('utf-8')
         # split in elements
@@ -67,8 +69,28 @@ class TextParser:
                 else:
                     line[1] = line[1][1:]
                 files.append([line[1], int(line[2])])
+                if types is not None:
+                    types[line[1]] = line[3][0]
         return files
     
+    ##
+    # parse fls -r -p output
+    # @details This function extracts the paths of the listed entries, e.g.
+    # of the deleted entries listed by fls -r -d -p.
+    #
+    # @param data raw output of fls tool to process
+    # @return list of paths
+    #
+    @staticmethod
+    def parse_fls_names(data):
+        names = list()
+        data = data.decode('utf-8')
+        for line in data.splitlines():
+            _, tab, name = line.partition('\t')
+            if tab:
+                names.append(name)
+        return names
+
     ##
     # parse ils -a output
     # @details This function parses the output of TSKs ils tool. It splits up
@@ -98,6 +120,37 @@ class TextParser:
                 inodes[intline[0]] = intline[1:]
         return inodes
     
+    ##
+    # parse istat -r output
+    # @details This function parses the run list of TSKs istat tool. Every
+    # attribute starts with a 'Type:' line, the runs of the first data
+    # attribute (or of the first attribute with runs) are returned. Sparse and
+    # filler runs have no start address.
+    #
+    # @param data raw output of istat -r to process
+    # @return list of (start, length, sparse) tuples in blocks
+    #
+    @staticmethod
+    def parse_istat_runs(data):
+        attributes = list()
+        data = data.decode('utf-8')
+        for line in data.splitlines():
+            line = line.strip()
+            if line.startswith('Type:'):
+                attributes.append((line, list()))
+            elif line.startswith('Starting address:') and attributes:
+                start, _, rest = line[len('Starting address:'):].partition(',')
+                length = rest.split(':')[1].split()[0]
+                sparse = not start.strip().isdigit() or 'Sparse' in rest or 'Filler' in rest
+                attributes[-1][1].append((None if sparse else int(start), int(length), sparse))
+        for header, runs in attributes:
+            if 'DATA' in header and runs:
+                return runs
+        for header, runs in attributes:
+            if runs:
+                return runs
+        return list()
+
     ##
     # parse stat -c '%n|%i|a|%u|%g|%Y|%X|%Z|%W|%a|%h|%s' output
     # @details This function parses the output of the stat tool. It splits up